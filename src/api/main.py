@@ -6,28 +6,162 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from contextlib import asynccontextmanager, suppress
+import hmac
+import json
+import time
+import asyncio
 import logging
-from typing import Dict, Any
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Literal, Optional, Union
 
-from models.requests import QueryRequest, TrainingExampleRequest, HealthCheckRequest
-from models.responses import SQLResponse, QueryResultResponse, ErrorResponse, HealthCheckResponse, TrainingResponse
-from services.query_service import QueryService
-from services.customer_api_service import CustomerAPIService
+from models.requests import (
+    QueryRequest, BatchQueryRequest, TrainingExampleRequest, HealthCheckRequest, PermissionsInvalidateRequest
+)
+from models.responses import (
+    SQLResponse, QueryResultResponse, ColumnarQueryResultResponse, ErrorResponse, HealthCheckResponse, TrainingResponse
+)
+from services.customer_api_service import CustomerAPIService, UserNotFoundError
+from src.utils import embeddings, metrics, result_encoding, tokens, tracing
+from src.utils.arrow_export import ARROW, MEDIA_TYPES, PARQUET
+from src.utils.db_pool import DatabasePool
+from src.utils.invalidation_bus import InvalidationBus
+from src.utils.schema_catalog import get_schema_catalog
+from src.utils.sql_stream import format_sse
+from src.utils.tracing import TracingMiddleware
+
+if TYPE_CHECKING:
+    from services.query_service import QueryService
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+# Сервис генерации создается при прогреве в lifespan: импорт модуля не тянет
+# vanna/pandas/openai/torch и не требует доступной БД
+query_service: Optional["QueryService"] = None
+customer_api_service = CustomerAPIService()
+
+
+def _build_query_service() -> "QueryService":
+    """Импорт и создание QueryService (тяжелые зависимости загружаются здесь)"""
+    from services.query_service import QueryService
+
+    return QueryService()
+
+
+async def _warmup_component(app: FastAPI, name: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Прогрев одного компонента с замером времени; ошибка не прерывает остальные"""
+    started = time.perf_counter()
+    state = app.state.warmup[name] = {"status": "warming"}
+    try:
+        result = await factory()
+        state.update(status="ready", seconds=round(time.perf_counter() - started, 3))
+        return result
+    except Exception as e:
+        state.update(status="failed", seconds=round(time.perf_counter() - started, 3), error=str(e))
+        logger.error(f"❌ Прогрев {name} не удался: {e}")
+        return None
+
+
+async def warmup(app: FastAPI):
+    """
+    Параллельный прогрев независимых компонентов
+
+    1. Модель эмбеддингов, пул БД и QueryService (импорты vanna/openai) - параллельно.
+    2. Каталог схемы, клиенты LLM и кэш доменного DDL - параллельно, им нужны
+       QueryService и пул.
+
+    /ready отвечает 200 только после завершения прогрева.
+    """
+    global query_service
+    started = time.perf_counter()
+
+    async def open_db_pool():
+        db_pool = DatabasePool()
+        await db_pool.open()
+        app.state.db_pool = db_pool
+        metrics.REGISTRY.register_collector(db_pool.collect_metrics)
+        return db_pool
+
+    _, db_pool, service = await asyncio.gather(
+        _warmup_component(app, "embeddings", lambda: asyncio.to_thread(embeddings.warmup)),
+        _warmup_component(app, "db_pool", open_db_pool),
+        _warmup_component(app, "query_service", lambda: asyncio.to_thread(_build_query_service)),
+    )
+    catalog = get_schema_catalog()
+    app.state.catalog_refresh = asyncio.create_task(catalog.run_refresh_loop(db_pool))
+    if os.getenv("INVALIDATION_BUS_ENABLED", "1") == "1":
+        # Слушатель переподключается сам: недоступная при старте БД не блокирует прогрев
+        app.state.invalidation_bus = InvalidationBus()
+        app.state.invalidation_bus.start()
+    if service is not None:
+        # Без пула ретриверы работают через разовые подключения
+        service.set_db_pool(db_pool)
+        if app.state.invalidation_bus is not None:
+            service.set_invalidation_bus(app.state.invalidation_bus)
+        query_service = service
+        await asyncio.gather(
+            _warmup_component(app, "schema_catalog", lambda: catalog.aload(db_pool)),
+            _warmup_component(app, "llm_clients", service.pipeline.awarmup),
+            _warmup_component(app, "schema_cache", service.warm_schema_cache),
+        )
+
+    app.state.ready = query_service is not None
+    app.state.warmup_seconds = round(time.perf_counter() - started, 3)
+    logger.info(f"{'✅' if app.state.ready else '❌'} Прогрев завершен за {app.state.warmup_seconds}с: {app.state.warmup}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Жизненный цикл приложения: прогрев в фоне, сервер сразу принимает соединения
+    """
+    global query_service
+    app.state.ready = False
+    app.state.warmup = {}
+    app.state.warmup_seconds = None
+    app.state.db_pool = None
+    app.state.catalog_refresh = None
+    app.state.invalidation_bus = None
+    metrics.REGISTRY.register_collector(collect_execution_metrics)
+    metrics.REGISTRY.register_collector(customer_api_service.collect_metrics)
+    warmup_task = asyncio.create_task(warmup(app))
+    try:
+        yield
+    finally:
+        for task in (warmup_task, app.state.catalog_refresh):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        metrics.REGISTRY.unregister_collector(collect_execution_metrics)
+        metrics.REGISTRY.unregister_collector(customer_api_service.collect_metrics)
+        # Keep-alive соединения к API заказчика закрываются вместе с приложением
+        await customer_api_service.aclose()
+        if app.state.invalidation_bus is not None:
+            await app.state.invalidation_bus.stop()
+        db_pool = app.state.db_pool
+        if db_pool is not None:
+            metrics.REGISTRY.unregister_collector(db_pool.collect_metrics)
+            await db_pool.close()
+        if query_service is not None:
+            query_service.set_db_pool(None)
+            query_service.shutdown()
+            query_service = None
+
+
 # Создание FastAPI приложения
 app = FastAPI(
     title="NL→SQL API",
     description="API для генерации SQL запросов на естественном языке",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Настройка CORS
@@ -38,10 +172,57 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Трассировка: контекст из заголовка traceparent (веб-интерфейс → core API → API заказчика)
+app.add_middleware(TracingMiddleware, service_name="nlsql-api")
 
-# Инициализация сервисов
-query_service = QueryService()
-customer_api_service = CustomerAPIService()
+def get_query_service():
+    """Зависимость эндпоинтов генерации: 503, пока идет прогрев"""
+    if query_service is None:
+        raise HTTPException(status_code=503, detail="Сервис прогревается, повторите запрос позже")
+    return query_service
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Зависимость служебных эндпоинтов: заголовок X-Admin-Token должен совпасть с ADMIN_API_TOKEN"""
+    token = os.getenv("ADMIN_API_TOKEN", "")
+    if not token:
+        raise HTTPException(status_code=403, detail="Служебные эндпоинты отключены: ADMIN_API_TOKEN не задан")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Неверный или отсутствующий X-Admin-Token")
+
+
+async def authorize_user(request: QueryRequest) -> Dict[str, Any]:
+    """
+    Проверка роли по правам из API заказчика (кэш прав)
+
+    Роль из запроса должна совпасть с ролью пользователя у заказчика, а права -
+    включать чтение; отдел берется из прав. Возвращает контекст пользователя
+    для выполнения SQL.
+    """
+    try:
+        permissions = await customer_api_service.get_user_permissions(request.user_id)
+    except UserNotFoundError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except Exception as e:
+        logger.error(f"Ошибка получения прав пользователя {request.user_id}: {e}")
+        raise HTTPException(status_code=502, detail=f"Права пользователя недоступны: {str(e)}")
+
+    role = permissions.get("role")
+    if role != request.role:
+        logger.warning(f"⚠️ Роль {request.role} не совпадает с ролью {role} пользователя {request.user_id}")
+        raise HTTPException(status_code=403, detail=f"Роль {request.role} не назначена пользователю {request.user_id}")
+    if "read" not in permissions.get("permissions", []):
+        raise HTTPException(status_code=403, detail=f"У пользователя {request.user_id} нет права на чтение")
+    return {
+        "user_id": request.user_id,
+        "role": role,
+        "department": permissions.get("department") or request.department
+    }
+
+
+def collect_execution_metrics():
+    """Объединение одинаковых запросов к API заказчика"""
+    return metrics.single_flight_metrics({'execution': customer_api_service.execution_flight})
 
 
 @app.get("/", response_model=Dict[str, str])
@@ -59,10 +240,17 @@ async def health_check():
     """
     try:
         # Проверка компонентов
+        db_pool = getattr(app.state, "db_pool", None)
+        db_health = await db_pool.health() if db_pool else {"status": "unhealthy", "error": "pool is not initialized"}
+        # Модели: кэшируемые легкие пробы и состояние circuit breaker, без генераций
+        service = query_service
+        llm_health = await service.pipeline.ahealth_check() if service and service.pipeline else {}
         components = {
             "api": "healthy",
-            "vanna": "healthy" if query_service.is_ready() else "unhealthy",
-            "customer_api": "healthy" if customer_api_service.is_ready() else "unhealthy"
+            "vanna": "healthy" if service and service.is_ready() else "unhealthy",
+            "customer_api": "healthy" if customer_api_service.is_ready() else "unhealthy",
+            "database": db_health["status"],
+            "llm": "healthy" if any(model["available"] for model in llm_health.values()) else "unhealthy"
         }
         
         status = "healthy" if all(status == "healthy" for status in components.values()) else "unhealthy"
@@ -70,6 +258,24 @@ async def health_check():
         return HealthCheckResponse(
             status=status,
             components=components,
+            details={
+                "embeddings": embeddings.get_stats(),
+                "llm": llm_health,
+                "db_pool": db_health,
+                "warmup": app.state.warmup,
+                "schema_catalog": get_schema_catalog().stats(),
+                "invalidation_bus": app.state.invalidation_bus.stats() if app.state.invalidation_bus else None,
+                "customer_api": customer_api_service.stats(),
+                "permission_cache": customer_api_service.permission_stats(),
+                "sql_cache": service.sql_cache.stats() if service else None,
+                "semantic_cache": service.semantic_cache.stats() if service else None,
+                "tracing": tracing.get_stats(),
+                "tokenizer": tokens.stats(),
+                "single_flight": {
+                    "generation": service.generation_flight.stats() if service else None,
+                    "execution": customer_api_service.execution_flight.stats()
+                }
+            },
             version="1.0.0"
         )
         
@@ -78,16 +284,39 @@ async def health_check():
         raise HTTPException(status_code=500, detail="Ошибка проверки здоровья системы")
 
 
+@app.get("/ready")
+async def readiness():
+    """
+    Готовность принимать запросы: 200 после прогрева, до этого 503
+    (для readiness probe балансировщика; /health остается проверкой живости)
+    """
+    body = {
+        "ready": app.state.ready,
+        "warmup_seconds": app.state.warmup_seconds,
+        "components": app.state.warmup
+    }
+    return JSONResponse(status_code=200 if app.state.ready else 503, content=body)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Метрики в формате Prometheus: длительность этапов, эмбеддингов, ожидания пула,
+    LLM по моделям, размер промпта, попадания в кэши, время API заказчика
+    """
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.post("/query", response_model=SQLResponse)
-async def generate_sql(request: QueryRequest):
+async def generate_sql(request: QueryRequest, service=Depends(get_query_service)):
     """
     Генерация SQL запроса на основе вопроса пользователя
     """
     try:
         logger.info(f"Получен запрос от пользователя {request.user_id}: {request.question}")
         
-        # Генерация SQL через Vanna AI
-        sql = await query_service.generate_sql(
+        # Генерация SQL через Vanna AI (или из кэша)
+        result = await service.generate_sql_with_meta(
             question=request.question,
             user_context={
                 "user_id": request.user_id,
@@ -98,9 +327,12 @@ async def generate_sql(request: QueryRequest):
         )
         
         return SQLResponse(
-            sql=sql,
+            sql=result["sql"],
             question=request.question,
-            user_id=request.user_id
+            user_id=request.user_id,
+            source=result.get("source"),
+            model=result.get("model"),
+            similarity=result.get("similarity")
         )
         
     except Exception as e:
@@ -108,50 +340,191 @@ async def generate_sql(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"Ошибка генерации SQL: {str(e)}")
 
 
-@app.post("/query/execute", response_model=QueryResultResponse)
-async def execute_query(request: QueryRequest):
+@app.post("/query/stream")
+async def stream_sql(request: QueryRequest, service=Depends(get_query_service)):
+    """
+    Потоковая генерация SQL (Server-Sent Events)
+    
+    События: stage (domain_detected, context_retrieved, model_selected, ...),
+    token (фрагменты ответа LLM), sql (итоговый запрос) или error.
+    """
+    logger.info(f"Потоковый запрос от пользователя {request.user_id}: {request.question}")
+    user_context = {
+        "user_id": request.user_id,
+        "role": request.role,
+        "department": request.department,
+        "context": request.context
+    }
+    
+    async def events():
+        async for event in service.stream_sql(request.question, user_context):
+            name = event.pop("event")
+            yield format_sse(name, event)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/query/batch")
+async def generate_sql_batch(request: BatchQueryRequest, service=Depends(get_query_service)):
+    """
+    Пакетная генерация SQL
+    
+    Результаты возвращаются в формате NDJSON по мере готовности (не в порядке
+    запросов): одна строка на запрос с полем index и success, при ошибке - error.
+    """
+    max_items = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="Пустой пакет запросов")
+    if len(request.queries) > max_items:
+        raise HTTPException(status_code=413, detail=f"Слишком много запросов в пакете: максимум {max_items}")
+    
+    # Клиент может только уменьшить лимит параллельности, но не превысить серверный
+    max_concurrency = max(1, min(request.max_concurrency or service.batch_max_concurrency,
+                                 service.batch_max_concurrency))
+    items = [
+        (
+            query.question,
+            {
+                "user_id": query.user_id,
+                "role": query.role,
+                "department": query.department,
+                "context": query.context
+            }
+        )
+        for query in request.queries
+    ]
+    logger.info(f"Пакетный запрос: {len(items)} вопросов, параллельность {max_concurrency}")
+    
+    async def lines():
+        async for item in service.generate_sql_batch(items, max_concurrency=max_concurrency):
+            item["user_id"] = request.queries[item["index"]].user_id
+            yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/query/execute", response_model=Union[QueryResultResponse, ColumnarQueryResultResponse])
+async def execute_query(
+    request: QueryRequest,
+    http_request: Request,
+    result_format: Literal["rows", "columnar", "arrow", "parquet"] = Query(result_encoding.ROWS, alias="format"),
+    service=Depends(get_query_service)
+):
     """
     Генерация и выполнение SQL запроса
+    
+    Ответ сериализуется одним вызовом (orjson) без построчной валидации pydantic
+    и сжимается по Accept-Encoding; format=columnar - колонки и строки-списки.
+    format=arrow - Arrow IPC stream, format=parquet - файл Parquet: строятся API
+    заказчика из курсора с сохранением типов и передаются без разбора.
     """
+    # Роль проверяется до генерации: ошибки прав - 403/502, а не 500
+    user_context = await authorize_user(request)
     try:
         logger.info(f"Выполнение запроса от пользователя {request.user_id}: {request.question}")
         
         # Генерация SQL
-        sql = await query_service.generate_sql(
+        sql = await service.generate_sql(
             question=request.question,
-            user_context={
-                "user_id": request.user_id,
-                "role": request.role,
-                "department": request.department,
-                "context": request.context
-            }
+            user_context={**user_context, "context": request.context}
         )
         
+        if result_format in (ARROW, PARQUET):
+            return await export_query_result(sql, user_context, result_format)
+        
         # Отправка в API заказчика для выполнения
         result = await customer_api_service.execute_sql(
             sql_template=sql,
-            user_context={
-                "user_id": request.user_id,
-                "role": request.role,
-                "department": request.department
-            }
+            user_context=user_context
         )
         
-        return QueryResultResponse(
-            data=result.get("data", []),
-            columns=result.get("columns", []),
-            row_count=result.get("row_count", 0),
-            execution_time=result.get("execution_time", 0.0),
-            sql=result.get("final_sql", sql)
-        )
+        columns, rows = result_encoding.result_rows(result)
+        return result_encoding.response({
+            **result_encoding.shape_result(columns, rows, result_format),
+            "row_count": result.get("row_count", len(rows)),
+            "execution_time": result.get("execution_time", 0.0),
+            "sql": result.get("final_sql", sql)
+        }, http_request.headers.get("accept-encoding"))
         
     except Exception as e:
         logger.error(f"Ошибка выполнения запроса: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка выполнения запроса: {str(e)}")
 
 
+@app.post("/permissions/invalidate", dependencies=[Depends(require_admin)])
+async def invalidate_permissions(request: PermissionsInvalidateRequest):
+    """
+    Сброс кэша прав пользователя (или всех) после изменения прав в системе заказчика
+    
+    Служебный эндпоинт: требует заголовок X-Admin-Token.
+    """
+    removed = customer_api_service.invalidate_permissions(request.user_id)
+    return {"user_id": request.user_id, "removed": removed}
+
+
+async def export_query_result(sql: str, user_context: Dict[str, Any], result_format: str) -> StreamingResponse:
+    """Arrow/Parquet из API заказчика: ошибка до начала ответа - исключением, дальше - поток байтов"""
+    chunks = customer_api_service.export_sql(sql, user_context, result_format)
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+    
+    headers = {"X-Accel-Buffering": "no"}
+    if result_format == PARQUET:
+        headers["Content-Disposition"] = 'attachment; filename="result.parquet"'
+    return StreamingResponse(body(), media_type=MEDIA_TYPES[result_format], headers=headers)
+
+
+@app.post("/query/execute/stream")
+async def execute_query_stream(request: QueryRequest, service=Depends(get_query_service)):
+    """
+    Генерация и потоковое выполнение SQL запроса (NDJSON)
+    
+    Кадры: sql (сгенерированный запрос), meta (колонки), rows (пачки строк в
+    порядке columns), end (row_count, execution_time) или error. Строки идут
+    по мере чтения курсора в БД заказчика: первая пачка приходит, пока запрос
+    еще выполняется, а память не растет с размером результата.
+    """
+    user_context = await authorize_user(request)
+    try:
+        logger.info(f"Потоковое выполнение запроса от пользователя {request.user_id}: {request.question}")
+        sql = await service.generate_sql(
+            question=request.question,
+            user_context={**user_context, "context": request.context}
+        )
+    except Exception as e:
+        logger.error(f"Ошибка генерации SQL: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка выполнения запроса: {str(e)}")
+    
+    async def lines():
+        yield result_encoding.dumps({"type": "sql", "sql": sql}) + b"\n"
+        try:
+            # Кадры API заказчика передаются без разбора
+            async for line in customer_api_service.stream_sql(sql, user_context):
+                yield line + "\n"
+        except Exception as e:
+            logger.error(f"Ошибка потокового выполнения запроса: {e}")
+            yield result_encoding.dumps({"type": "error", "error": str(e)}) + b"\n"
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/training/example", response_model=TrainingResponse)
-async def add_training_example(request: TrainingExampleRequest):
+async def add_training_example(request: TrainingExampleRequest, service=Depends(get_query_service)):
     """
     Добавление примера для обучения модели
     """
@@ -159,7 +532,7 @@ async def add_training_example(request: TrainingExampleRequest):
         logger.info(f"Добавление примера обучения от пользователя {request.user_id}")
         
         # Добавление примера в Vanna AI
-        await query_service.add_training_example(
+        await service.add_training_example(
             question=request.question,
             sql=request.sql,
             user_id=request.user_id,
@@ -178,12 +551,12 @@ async def add_training_example(request: TrainingExampleRequest):
 
 
 @app.get("/training/status")
-async def get_training_status():
+async def get_training_status(service=Depends(get_query_service)):
     """
     Получение статуса обучения модели
     """
     try:
-        status = await query_service.get_training_status()
+        status = await service.get_training_status()
         return status
         
     except Exception as e:
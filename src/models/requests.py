@@ -3,7 +3,7 @@ Pydantic модели для входящих запросов
 """
 
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 
@@ -18,6 +18,14 @@ class QueryRequest(BaseModel):
     context: Optional[Dict[str, Any]] = Field(None, description="Дополнительный контекст")
 
 
+class BatchQueryRequest(BaseModel):
+    """
+    Пакетный запрос на генерацию SQL
+    """
+    queries: List[QueryRequest] = Field(..., description="Запросы на генерацию SQL")
+    max_concurrency: Optional[int] = Field(None, description="Лимит одновременных генераций")
+
+
 class SQLTemplateRequest(BaseModel):
     """
     Запрос SQL шаблона для API заказчика
@@ -38,6 +46,13 @@ class TrainingExampleRequest(BaseModel):
     verified: bool = Field(False, description="Проверен ли пример")
 
 
+class PermissionsInvalidateRequest(BaseModel):
+    """
+    Запрос на сброс кэша прав пользователей
+    """
+    user_id: Optional[str] = Field(None, description="ID пользователя; не задан - сбросить права всех")
+
+
 class HealthCheckRequest(BaseModel):
     """
     Запрос проверки здоровья системы
@@ -16,6 +16,9 @@ class SQLResponse(BaseModel):
     user_id: str = Field(..., description="ID пользователя")
     timestamp: datetime = Field(default_factory=datetime.now)
     confidence: Optional[float] = Field(None, description="Уверенность модели")
+    source: Optional[str] = Field(None, description="Источник ответа: llm, fallback или cache")
+    model: Optional[str] = Field(None, description="Модель, сгенерировавшая SQL")
+    similarity: Optional[float] = Field(None, description="Близость к вопросу из семантического кэша")
 
 
 class QueryResultResponse(BaseModel):
@@ -29,6 +32,18 @@ class QueryResultResponse(BaseModel):
     sql: str = Field(..., description="Выполненный SQL запрос")
 
 
+class ColumnarQueryResultResponse(BaseModel):
+    """
+    Результат выполнения запроса в колоночном формате (format=columnar)
+    """
+    format: str = Field("columnar", description="Формат строк")
+    columns: List[str] = Field(..., description="Названия колонок")
+    rows: List[List[Any]] = Field(..., description="Строки: значения в порядке columns")
+    row_count: int = Field(..., description="Количество строк")
+    execution_time: float = Field(..., description="Время выполнения в секундах")
+    sql: str = Field(..., description="Выполненный SQL запрос")
+
+
 class ErrorResponse(BaseModel):
     """
     Ответ с ошибкой
@@ -46,6 +61,7 @@ class HealthCheckResponse(BaseModel):
     status: str = Field(..., description="Статус системы")
     timestamp: datetime = Field(default_factory=datetime.now)
     components: Dict[str, str] = Field(..., description="Статус компонентов")
+    details: Optional[Dict[str, Any]] = Field(None, description="Подробности по компонентам")
     version: str = Field("1.0.0", description="Версия системы")
 
 
@@ -1,14 +1,62 @@
 """
 Сервис для работы с API заказчика
+
+Все обращения идут через один долгоживущий httpx.AsyncClient с пулом
+keep-alive соединений (опционально HTTP/2), поэтому TCP/TLS рукопожатие не
+повторяется на каждый запрос. Клиент закрывается в lifespan приложения.
+
+Переменные окружения:
+    CUSTOMER_API_TIMEOUT                таймаут по умолчанию (секунды)
+    CUSTOMER_API_TIMEOUT_<ENDPOINT>     таймаут эндпоинта (SQL_EXECUTE, SQL_STREAM, SQL_EXPORT, SQL_VALIDATE,
+                                        USER_PERMISSIONS, HEALTH)
+    CUSTOMER_API_CONNECT_TIMEOUT        таймаут установки соединения
+    CUSTOMER_API_MAX_CONNECTIONS        максимум соединений пула
+    CUSTOMER_API_MAX_KEEPALIVE          максимум простаивающих keep-alive соединений
+    CUSTOMER_API_KEEPALIVE_EXPIRY       время жизни простаивающего соединения (секунды)
+    CUSTOMER_API_HTTP2                  1 - HTTP/2 (нужен пакет h2)
+    CUSTOMER_API_RETRIES                повторы идемпотентных запросов
+    CUSTOMER_API_RETRY_DELAY            базовая пауза повтора (экспоненциальная, со случайным разбросом)
+    PERMISSIONS_CACHE_*                 кэш прав пользователей (src/services/permission_cache.py)
 """
 
+import os
+import json
+import time
+import re
+import random
 import logging
+import threading
 import httpx
-from typing import Dict, Any, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
 import asyncio
 
+from src.utils import result_encoding
+from src.services.permission_cache import FRESH, NEGATIVE, STALE, PermissionCache
+from src.utils.single_flight import SingleFlight
+from src.utils import metrics, tracing
+
 logger = logging.getLogger(__name__)
 
+# Таймауты эндпоинтов по умолчанию; проверка здоровья не должна ждать долго
+ENDPOINT_TIMEOUTS = {
+    'sql_execute': None,
+    # Для потока - пауза между кадрами, а не время всего ответа
+    'sql_stream': None,
+    # Parquet отдается после выборки всего результата - первый байт может идти долго
+    'sql_export': 300.0,
+    'sql_validate': 10.0,
+    'user_permissions': 5.0,
+    'health': 5.0,
+}
+# Ответы, после которых идемпотентный запрос имеет смысл повторить
+RETRY_STATUS_CODES = frozenset({502, 503, 504})
+MAX_RETRY_DELAY = 5.0
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class UserNotFoundError(Exception):
+    """API заказчика не знает пользователя (ответ 404, в том числе из отрицательного кэша)"""
+
 
 class CustomerAPIService:
     """
@@ -23,12 +71,143 @@ class CustomerAPIService:
             customer_api_url: URL API заказчика
         """
         self.customer_api_url = customer_api_url
-        self.timeout = 30.0  # Таймаут для запросов
+        self.timeout = float(os.getenv("CUSTOMER_API_TIMEOUT", "30"))  # Таймаут для запросов
+        self.timeouts = {
+            endpoint: float(os.getenv(f"CUSTOMER_API_TIMEOUT_{endpoint.upper()}", str(default or self.timeout)))
+            for endpoint, default in ENDPOINT_TIMEOUTS.items()
+        }
+        self.connect_timeout = float(os.getenv("CUSTOMER_API_CONNECT_TIMEOUT", "5"))
+        self.max_connections = int(os.getenv("CUSTOMER_API_MAX_CONNECTIONS", "50"))
+        self.max_keepalive = int(os.getenv("CUSTOMER_API_MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(os.getenv("CUSTOMER_API_KEEPALIVE_EXPIRY", "30"))
+        self.http2 = os.getenv("CUSTOMER_API_HTTP2", "0") == "1"
+        self.retries = int(os.getenv("CUSTOMER_API_RETRIES", "2"))
+        self.retry_delay = float(os.getenv("CUSTOMER_API_RETRY_DELAY", "0.2"))
+        self.execution_flight = SingleFlight("execute_sql")
+        # Права меняются редко: кэш с фоновым обновлением, одновременные промахи - один запрос
+        self.permission_cache = PermissionCache()
+        self.permissions_flight = SingleFlight("user_permissions")
+        self._permission_refreshes: Dict[str, asyncio.Task] = {}
+        self._refresh_count = 0
+        self._refresh_errors = 0
+        
+        # Клиент создается при первом запросе и живет до aclose()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._stats_lock = threading.Lock()
+        self._requests: Dict[str, int] = {}
+        self._retries: Dict[str, int] = {}
+        self._connections_opened = 0
+        self._in_flight = 0
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Общий клиент с пулом keep-alive соединений"""
+        if self._client is None or self._client.is_closed:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            timeout = httpx.Timeout(self.timeout, connect=self.connect_timeout)
+            try:
+                self._client = httpx.AsyncClient(
+                    base_url=self.customer_api_url, limits=limits, timeout=timeout, http2=self.http2
+                )
+            except ImportError:
+                logger.warning("⚠️ HTTP/2 недоступен (нет пакета h2), API заказчика вызывается по HTTP/1.1")
+                self.http2 = False
+                self._client = httpx.AsyncClient(base_url=self.customer_api_url, limits=limits, timeout=timeout)
+            logger.info(
+                f"✅ Клиент API заказчика: {self.customer_api_url} (connections={self.max_connections}, "
+                f"keepalive={self.max_keepalive}, http2={self.http2})"
+            )
+        return self._client
+    
+    def _timeout(self, endpoint: str) -> httpx.Timeout:
+        """Таймаут эндпоинта на чтение/запись и общий таймаут соединения (число задало бы и connect)"""
+        return httpx.Timeout(self.timeouts[endpoint], connect=self.connect_timeout)
+    
+    async def aclose(self):
+        """Закрытие клиента и его соединений (lifespan приложения)"""
+        refreshes = list(self._permission_refreshes.values())
+        for task in refreshes:
+            task.cancel()
+        await asyncio.gather(*refreshes, return_exceptions=True)
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+            logger.info("✅ Клиент API заказчика закрыт")
+    
+    async def _trace(self, event_name: str, info: Dict[str, Any]):
+        """События httpcore: новое TCP соединение - промах пула keep-alive"""
+        if event_name == "connection.connect_tcp.complete":
+            with self._stats_lock:
+                self._connections_opened += 1
+    
+    def _retry_delay(self, attempt: int) -> float:
+        """Экспоненциальная пауза с полным случайным разбросом (повторы клиентов не синхронизируются)"""
+        return random.uniform(0, min(self.retry_delay * 2 ** attempt, MAX_RETRY_DELAY))
+    
+    async def _request(self, endpoint: str, method: str, path: str, idempotent: bool,
+                       retries: Optional[int] = None, **kwargs) -> httpx.Response:
+        """
+        Запрос к API заказчика через общий клиент
+        
+        Неотправленный запрос (ошибка соединения, нет свободного соединения в
+        пуле) повторяется всегда; идемпотентный - также после таймаута чтения,
+        обрыва соединения и ответов 502/503/504.
+        
+        Args:
+            endpoint: Имя эндпоинта для таймаута и метрик
+            method: HTTP метод
+            path: Путь относительно URL API заказчика
+            idempotent: Повторный запрос безопасен
+            retries: Число повторов (по умолчанию CUSTOMER_API_RETRIES); 0 - без повторов
+        """
+        client = self._get_client()
+        retries = self.retries if retries is None else retries
+        extensions = {"trace": self._trace}
+        attempt = 0
+        while True:
+            with self._stats_lock:
+                self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+                self._in_flight += 1
+            retry_reason = None
+            try:
+                response = await client.request(
+                    method, path, timeout=self._timeout(endpoint), extensions=extensions, **kwargs
+                )
+                if not (idempotent and response.status_code in RETRY_STATUS_CODES):
+                    return response
+                retry_reason = f"HTTP {response.status_code}"
+                if attempt >= retries:
+                    return response
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt >= retries:
+                    raise
+                retry_reason = f"{type(e).__name__}: {e}"
+            except (httpx.ReadTimeout, httpx.RemoteProtocolError, httpx.ReadError) as e:
+                if not idempotent or attempt >= retries:
+                    raise
+                retry_reason = f"{type(e).__name__}: {e}"
+            finally:
+                with self._stats_lock:
+                    self._in_flight -= 1
+            delay = self._retry_delay(attempt)
+            attempt += 1
+            with self._stats_lock:
+                self._retries[endpoint] = self._retries.get(endpoint, 0) + 1
+            logger.warning(
+                f"⚠️ API заказчика {endpoint}: {retry_reason}, повтор через {delay:.2f}с ({attempt}/{retries})"
+            )
+            await asyncio.sleep(delay)
     
     async def execute_sql(self, sql_template: str, user_context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Отправка SQL шаблона в API заказчика для выполнения
         
+        Одновременные запросы с тем же SQL и контекстом пользователя
+        выполняются одним обращением к API заказчика.
+        
         Args:
             sql_template: SQL шаблон
             user_context: Контекст пользователя
@@ -36,6 +215,18 @@ class CustomerAPIService:
         Returns:
             Dict[str, Any]: Результат выполнения
         """
+        key = (sql_template, json.dumps(user_context, sort_keys=True, default=str))
+        result = await self.execution_flight.do(
+            key, lambda: self._execute_sql(sql_template, user_context)
+        )
+        return dict(result)
+    
+    async def _execute_sql(self, sql_template: str, user_context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Фактическое обращение к /api/sql/execute
+        """
+        started = time.perf_counter()
+        outcome = "error"
         try:
             logger.info(f"Отправка SQL в API заказчика: {sql_template[:100]}...")
             
@@ -43,30 +234,135 @@ class CustomerAPIService:
             request_data = {
                 "sql_template": sql_template,
                 "user_context": user_context,
-                "request_id": f"req_{hash(sql_template)}"
+                "request_id": f"req_{hash(sql_template)}",
+                # Колонки + строки-списки: меньше ответ и разбор без словаря на строку
+                "result_format": result_encoding.COLUMNAR
             }
             
-            # Отправка запроса
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.customer_api_url}/api/sql/execute",
-                    json=request_data
+            # Отправка запроса; выполнение SQL не идемпотентно - повтор только неотправленного запроса
+            with tracing.span("customer_api.sql_execute", kind="client"):
+                response = await self._request(
+                    "sql_execute", "POST", "/api/sql/execute", idempotent=False,
+                    json=request_data,
+                    headers=tracing.inject_headers()
                 )
                 
                 if response.status_code == 200:
-                    result = response.json()
+                    result = result_encoding.loads(response.content)
                     logger.info(f"SQL успешно выполнен, получено {result.get('row_count', 0)} строк")
+                    outcome = "success"
                     return result
                 else:
                     logger.error(f"Ошибка API заказчика: {response.status_code} - {response.text}")
                     raise Exception(f"API заказчика вернул ошибку: {response.status_code}")
                     
         except httpx.TimeoutException:
+            outcome = "timeout"
             logger.error("Таймаут при обращении к API заказчика")
             raise Exception("Таймаут при обращении к API заказчика")
         except Exception as e:
             logger.error(f"Ошибка обращения к API заказчика: {e}")
             raise
+        finally:
+            metrics.CUSTOMER_API_SECONDS.observe(
+                time.perf_counter() - started, endpoint="sql_execute", outcome=outcome
+            )
+    
+    async def stream_sql(self, sql_template: str, user_context: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Потоковое выполнение SQL в API заказчика (/api/sql/execute/stream)
+        
+        Возвращает NDJSON кадры (meta, rows, end или error) строками без
+        разбора. Следующий кадр читается из сети, только когда потребитель
+        забрал предыдущий, поэтому обратное давление доходит до курсора БД, а
+        память не зависит от размера результата. Запрос не повторяется.
+        
+        Args:
+            sql_template: SQL шаблон
+            user_context: Контекст пользователя
+            
+        Yields:
+            str: Кадр NDJSON без перевода строки
+        """
+        request_data = {
+            "sql_template": sql_template,
+            "user_context": user_context,
+            "request_id": f"req_{hash(sql_template)}"
+        }
+        logger.info(f"Потоковое выполнение SQL в API заказчика: {sql_template[:100]}...")
+        async for line in self._stream("sql_stream", "/api/sql/execute/stream", request_data, lines=True):
+            yield line
+    
+    async def export_sql(self, sql_template: str, user_context: Dict[str, Any],
+                         result_format: str) -> AsyncIterator[bytes]:
+        """
+        Выполнение SQL с выгрузкой в Arrow IPC stream или Parquet (/api/sql/execute)
+        
+        Байты ответа передаются дальше как есть, без разбора и буферизации.
+        Ошибка API заказчика возникает до первого фрагмента.
+        
+        Args:
+            sql_template: SQL шаблон
+            user_context: Контекст пользователя
+            result_format: arrow или parquet
+            
+        Yields:
+            bytes: Фрагменты тела ответа
+        """
+        request_data = {
+            "sql_template": sql_template,
+            "user_context": user_context,
+            "request_id": f"req_{hash(sql_template)}",
+            "result_format": result_format
+        }
+        logger.info(f"Выгрузка SQL ({result_format}) из API заказчика: {sql_template[:100]}...")
+        async for chunk in self._stream("sql_export", "/api/sql/execute", request_data, lines=False):
+            yield chunk
+    
+    async def _stream(self, endpoint: str, path: str, request_data: Dict[str, Any],
+                      lines: bool) -> AsyncIterator[Any]:
+        """Потоковое чтение ответа API заказчика: строки (NDJSON) или байты как есть"""
+        started = time.perf_counter()
+        outcome = "error"
+        chunks = 0
+        with self._stats_lock:
+            self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+            self._in_flight += 1
+        try:
+            async with self._get_client().stream(
+                "POST", path,
+                json=request_data,
+                headers=tracing.inject_headers(),
+                timeout=self._timeout(endpoint),
+                extensions={"trace": self._trace}
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    logger.error(f"Ошибка API заказчика: {response.status_code} - {response.text}")
+                    raise Exception(f"API заказчика вернул ошибку: {response.status_code}")
+                parts = response.aiter_lines() if lines else response.aiter_bytes()
+                async for part in parts:
+                    if part:
+                        chunks += 1
+                        yield part
+            outcome = "success"
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            logger.error("Таймаут потока API заказчика")
+            raise Exception("Таймаут при обращении к API заказчика")
+        except (asyncio.CancelledError, GeneratorExit):
+            # Потребитель перестал читать (клиент отключился): соединение закрывается, курсор освобождается
+            outcome = "cancelled"
+            raise
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+            logger.info(
+                f"Поток API заказчика {endpoint}: {chunks} фрагментов за {time.perf_counter() - started:.3f}с ({outcome})"
+            )
+            metrics.CUSTOMER_API_SECONDS.observe(
+                time.perf_counter() - started, endpoint=endpoint, outcome=outcome
+            )
     
     async def validate_sql(self, sql_template: str, user_context: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -79,6 +375,8 @@ class CustomerAPIService:
         Returns:
             Dict[str, Any]: Результат валидации
         """
+        started = time.perf_counter()
+        outcome = "error"
         try:
             logger.info(f"Валидация SQL через API заказчика: {sql_template[:100]}...")
             
@@ -90,54 +388,159 @@ class CustomerAPIService:
             }
             
             # Отправка запроса
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.customer_api_url}/api/sql/validate",
-                    json=request_data
+            with tracing.span("customer_api.sql_validate", kind="client"):
+                response = await self._request(
+                    "sql_validate", "POST", "/api/sql/validate", idempotent=True,
+                    json=request_data,
+                    headers=tracing.inject_headers()
                 )
                 
                 if response.status_code == 200:
                     result = response.json()
                     logger.info("SQL успешно валидирован")
+                    outcome = "success"
                     return result
                 else:
                     logger.error(f"Ошибка валидации SQL: {response.status_code} - {response.text}")
                     raise Exception(f"Ошибка валидации SQL: {response.status_code}")
                     
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            logger.error("Таймаут валидации SQL в API заказчика")
+            raise Exception("Таймаут при обращении к API заказчика")
         except Exception as e:
             logger.error(f"Ошибка валидации SQL: {e}")
             raise
+        finally:
+            metrics.CUSTOMER_API_SECONDS.observe(
+                time.perf_counter() - started, endpoint="sql_validate", outcome=outcome
+            )
     
     async def get_user_permissions(self, user_id: str) -> Dict[str, Any]:
         """
-        Получение прав пользователя через API заказчика
+        Получение прав пользователя (кэш, затем API заказчика)
+        
+        Свежие права отдаются из кэша; устаревшие в пределах окна
+        stale-while-revalidate отдаются сразу и обновляются фоном.
         
         Args:
             user_id: ID пользователя
             
         Returns:
             Dict[str, Any]: Права пользователя
+            
+        Raises:
+            UserNotFoundError: Пользователь неизвестен API заказчика
         """
+        state, permissions = self.permission_cache.get(user_id)
+        metrics.CACHE_LOOKUPS.inc(cache='permissions', result=state or 'miss')
+        if state == FRESH:
+            return permissions
+        if state == NEGATIVE:
+            raise UserNotFoundError(f"Пользователь {user_id} не найден в API заказчика")
+        if state == STALE:
+            self._refresh_permissions(user_id)
+            return permissions
+        return dict(await self.permissions_flight.do(user_id, lambda: self._fetch_user_permissions(user_id)))
+    
+    def _refresh_permissions(self, user_id: str):
+        """Фоновое обновление устаревших прав (одна задача на пользователя)"""
+        if user_id in self._permission_refreshes:
+            return
+        task = asyncio.create_task(self.permissions_flight.do(user_id, lambda: self._fetch_user_permissions(user_id)))
+        self._permission_refreshes[user_id] = task
+        
+        def done(finished: asyncio.Task):
+            # После сброса кэша на этом месте может быть уже новая задача
+            if self._permission_refreshes.get(user_id) is finished:
+                del self._permission_refreshes[user_id]
+            if finished.cancelled():
+                return
+            if finished.exception() is not None:
+                # Устаревшие права остаются в кэше до конца окна stale
+                self._refresh_errors += 1
+                logger.warning(f"⚠️ Фоновое обновление прав {user_id} не удалось: {finished.exception()}")
+            else:
+                self._refresh_count += 1
+        
+        task.add_done_callback(done)
+    
+    def invalidate_permissions(self, user_id: Optional[str] = None) -> int:
+        """
+        Сброс кэша прав пользователя (или всех пользователей)
+        
+        Загрузки, начатые до сброса, не записывают права в кэш (поколение
+        кэша), фоновые обновления отменяются, а новые запросы не присоединяются
+        к уже идущей загрузке.
+        
+        Returns:
+            int: Число удаленных записей
+        """
+        removed = self.permission_cache.invalidate(user_id)
+        self.permissions_flight.forget(user_id)
+        for refreshed_user, task in list(self._permission_refreshes.items()):
+            if user_id is None or refreshed_user == user_id:
+                self._permission_refreshes.pop(refreshed_user, None)
+                task.cancel()
+        logger.info(f"🔄 Кэш прав сброшен ({user_id or 'все пользователи'}): {removed} записей")
+        return removed
+    
+    def permission_stats(self) -> Dict[str, Any]:
+        """Статистика кэша прав и фоновых обновлений"""
+        return {
+            **self.permission_cache.stats(),
+            "refreshes": self._refresh_count,
+            "refresh_errors": self._refresh_errors,
+            "refreshing": len(self._permission_refreshes),
+        }
+    
+    async def _fetch_user_permissions(self, user_id: str) -> Dict[str, Any]:
+        """
+        Фактическое обращение к /api/users/{user_id}/permissions с сохранением в кэш
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        # Поколение до запроса: если кэш сбросят, пока идет запрос, ответ в кэш не попадет
+        generation = self.permission_cache.generation(user_id)
         try:
             logger.info(f"Получение прав пользователя {user_id}")
             
             # Отправка запроса
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(
-                    f"{self.customer_api_url}/api/users/{user_id}/permissions"
+            with tracing.span("customer_api.user_permissions", kind="client"):
+                response = await self._request(
+                    "user_permissions", "GET", f"/api/users/{user_id}/permissions", idempotent=True,
+                    headers=tracing.inject_headers()
                 )
                 
                 if response.status_code == 200:
                     permissions = response.json()
                     logger.info(f"Получены права пользователя {user_id}")
+                    outcome = "success"
+                    # Cache-Control: max-age ответа задает TTL записи этого пользователя
+                    max_age = _MAX_AGE.search(response.headers.get("cache-control", ""))
+                    self.permission_cache.set(
+                        user_id, permissions, float(max_age.group(1)) if max_age else None, generation
+                    )
                     return permissions
+                elif response.status_code == 404:
+                    outcome = "not_found"
+                    self.permission_cache.set_negative(user_id, generation)
+                    raise UserNotFoundError(f"Пользователь {user_id} не найден в API заказчика")
                 else:
                     logger.error(f"Ошибка получения прав: {response.status_code} - {response.text}")
                     raise Exception(f"Ошибка получения прав: {response.status_code}")
                     
+        except httpx.TimeoutException:
+            outcome = "timeout"
+            logger.error("Таймаут получения прав пользователя в API заказчика")
+            raise Exception("Таймаут при обращении к API заказчика")
         except Exception as e:
             logger.error(f"Ошибка получения прав пользователя: {e}")
             raise
+        finally:
+            metrics.CUSTOMER_API_SECONDS.observe(
+                time.perf_counter() - started, endpoint="user_permissions", outcome=outcome
+            )
     
     def is_ready(self) -> bool:
         """
@@ -162,14 +565,72 @@ class CustomerAPIService:
             Dict[str, Any]: Статус API заказчика
         """
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.customer_api_url}/health")
+            # Без повторов, в том числе после ошибки соединения: проверка показывает текущее состояние
+            response = await self._request("health", "GET", "/health", idempotent=False, retries=0)
+            
+            if response.status_code == 200:
+                return {"status": "healthy", "response_time": response.elapsed.total_seconds()}
+            else:
+                return {"status": "unhealthy", "status_code": response.status_code}
                 
-                if response.status_code == 200:
-                    return {"status": "healthy", "response_time": response.elapsed.total_seconds()}
-                else:
-                    return {"status": "unhealthy", "status_code": response.status_code}
-                    
         except Exception as e:
             logger.error(f"Ошибка проверки здоровья API заказчика: {e}")
             return {"status": "unhealthy", "error": str(e)}
+    
+    def _pool_connections(self) -> Dict[str, int]:
+        """Соединения пула httpcore (внутренний API, при его изменении - пусто)"""
+        try:
+            connections = list(self._client._transport._pool.connections)
+        except AttributeError:
+            return {}
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"total": len(connections), "idle": idle, "active": len(connections) - idle}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Настройки клиента, запросы и повторы по эндпоинтам, переиспользование соединений"""
+        with self._stats_lock:
+            requests = dict(self._requests)
+            retries = dict(self._retries)
+            opened = self._connections_opened
+            in_flight = self._in_flight
+        total = sum(requests.values())
+        return {
+            "open": self._client is not None and not self._client.is_closed,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "keepalive_expiry": self.keepalive_expiry,
+            "timeouts": self.timeouts,
+            "requests": requests,
+            "retries": retries,
+            "in_flight": in_flight,
+            "connections_opened": opened,
+            # Доля запросов, обслуженных уже открытым соединением
+            "connection_reuse": round(1 - opened / total, 4) if total else None,
+            "connections": self._pool_connections() if self._client is not None else {},
+        }
+    
+    def collect_metrics(self) -> List[Any]:
+        """Пул соединений и повторы клиента API заказчика для /metrics"""
+        stats = self.stats()
+        connections = metrics.Gauge(
+            "nlsql_customer_api_pool_connections", "Соединения пула клиента API заказчика", ["state"]
+        )
+        for state, value in stats["connections"].items():
+            connections.set(value, state=state)
+        connections.set(stats["in_flight"], state="in_flight")
+        opened = metrics.Counter(
+            "nlsql_customer_api_connections_opened_total", "Новые TCP соединения к API заказчика"
+        )
+        opened.inc(stats["connections_opened"])
+        requests = metrics.Counter(
+            "nlsql_customer_api_requests_total", "Попытки запросов к API заказчика (с повторами)", ["endpoint"]
+        )
+        retries = metrics.Counter(
+            "nlsql_customer_api_retries_total", "Повторы запросов к API заказчика", ["endpoint"]
+        )
+        for endpoint, count in stats["requests"].items():
+            requests.inc(count, endpoint=endpoint)
+        for endpoint, count in stats["retries"].items():
+            retries.inc(count, endpoint=endpoint)
+        return [connections, opened, requests, retries]
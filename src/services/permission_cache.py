@@ -0,0 +1,162 @@
+"""
+Кэш прав пользователей из API заказчика
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+FRESH = "fresh"
+STALE = "stale"
+NEGATIVE = "negative"
+
+
+@dataclass
+class _Entry:
+    value: Optional[Dict[str, Any]]
+    expires_at: float
+    stale_until: float
+
+    @property
+    def negative(self) -> bool:
+        return self.value is None
+
+
+class PermissionCache:
+    """
+    LRU-кэш прав по user_id с TTL записи и окном stale-while-revalidate
+
+    - Свежая запись (до expires_at) отдается без обращения к API.
+    - Устаревшая (до stale_until) отдается сразу, а права обновляются фоном.
+    - Неизвестный пользователь кэшируется отрицательно на короткий срок.
+    TTL записи задается при сохранении (например, из Cache-Control ответа).
+
+    Сброс увеличивает поколение пользователя (или общее поколение). Загрузка
+    запоминает поколение до обращения к API и передает его в set/set_negative:
+    ответ, начатый до сброса, в кэш не попадает.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None,
+                 stale_ttl: Optional[float] = None, negative_ttl: Optional[float] = None):
+        self.max_size = max_size if max_size is not None else int(os.getenv("PERMISSIONS_CACHE_MAX_SIZE", "10000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("PERMISSIONS_CACHE_TTL", "3600"))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.getenv("PERMISSIONS_CACHE_STALE_TTL", "600"))
+        self.negative_ttl = (
+            negative_ttl if negative_ttl is not None else float(os.getenv("PERMISSIONS_CACHE_NEGATIVE_TTL", "60"))
+        )
+        self._data: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._user_generations: Dict[str, int] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.discarded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, user_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Состояние записи и права
+
+        Returns:
+            (FRESH | STALE | NEGATIVE | None, права); None - промах
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None or entry.stale_until <= now:
+                if entry is not None:
+                    del self._data[user_id]
+                self.misses += 1
+                return None, None
+            self._data.move_to_end(user_id)
+            if entry.negative:
+                self.negative_hits += 1
+                return NEGATIVE, None
+            if entry.expires_at <= now:
+                self.stale_hits += 1
+                return STALE, dict(entry.value)
+            self.hits += 1
+            return FRESH, dict(entry.value)
+
+    def generation(self, user_id: str) -> Tuple[int, int]:
+        """Поколение записи пользователя: запоминается перед загрузкой прав из API"""
+        with self._lock:
+            return self._generation, self._user_generations.get(user_id, 0)
+
+    def set(self, user_id: str, permissions: Dict[str, Any], ttl: Optional[float] = None,
+            generation: Optional[Tuple[int, int]] = None):
+        """
+        Сохранение прав; ttl записи по умолчанию - PERMISSIONS_CACHE_TTL
+
+        Если передано generation и с тех пор кэш пользователя сбрасывали, права не сохраняются.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self._store(user_id, _Entry(dict(permissions), 0.0, 0.0), ttl, self.stale_ttl, generation)
+
+    def set_negative(self, user_id: str, generation: Optional[Tuple[int, int]] = None):
+        """Пользователь неизвестен API заказчика: повторные запросы не уходят в API до истечения срока"""
+        self._store(user_id, _Entry(None, 0.0, 0.0), self.negative_ttl, 0.0, generation)
+
+    def _store(self, user_id: str, entry: _Entry, ttl: float, stale_ttl: float,
+               generation: Optional[Tuple[int, int]]):
+        if not self.enabled or ttl <= 0:
+            return
+        now = time.monotonic()
+        entry.expires_at = now + ttl
+        entry.stale_until = entry.expires_at + stale_ttl
+        with self._lock:
+            if generation is not None and generation != (self._generation, self._user_generations.get(user_id, 0)):
+                # Загрузка началась до сброса - ее результат мог устареть
+                self.discarded += 1
+                return
+            self._data[user_id] = entry
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: Optional[str] = None) -> int:
+        """Удаление прав пользователя (или всех); возвращает число удаленных записей"""
+        with self._lock:
+            if user_id is None:
+                removed = len(self._data)
+                self._data.clear()
+                # Общее поколение меняет поколение всех пользователей
+                self._generation += 1
+                self._user_generations.clear()
+            else:
+                removed = 1 if self._data.pop(user_id, None) is not None else 0
+                self._user_generations[user_id] = self._user_generations.get(user_id, 0) + 1
+            self.invalidations += 1
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            negative = sum(1 for entry in self._data.values() if entry.negative)
+            lookups = self.hits + self.stale_hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._data),
+                "negative_entries": negative,
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+                "negative_ttl": self.negative_ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "discarded": self.discarded,
+            }
@@ -0,0 +1,289 @@
+"""
+Семантический кэш SQL: повторное использование ответа для перефразированных вопросов
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.services.sql_cache import normalize_question
+
+# Литералы в порядке извлечения: найденный фрагмент вырезается, чтобы дата не
+# дала еще и числа, а число в кавычках - еще и число
+_QUOTED_RE = re.compile(r"'([^']*)'|\"([^\"]*)\"|«([^»]*)»|“([^”]*)”")
+_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b|\b(\d{1,2})[./](\d{1,2})[./](\d{4})\b")
+_MONTH_RE = re.compile(
+    r"\b(?:(январ)|(феврал)|(март)|(апрел)|(ма[йяе]\b)|(июн)|(июл)|(август)|(сентябр)|(октябр)|(ноябр)|(декабр))\w*"
+)
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def parse_thresholds(spec: str) -> Dict[str, float]:
+    """
+    Разбор порогов по доменам вида "payments=0.95,users=0.9"
+    """
+    thresholds = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        domain, value = part.split("=", 1)
+        thresholds[domain.strip()] = float(value)
+    return thresholds
+
+
+def extract_literals(question: str) -> Tuple[str, ...]:
+    """
+    Литералы вопроса: строки в кавычках, даты, месяцы и числа
+
+    Имя клиента, период, сумма или лимит меняют SQL, но почти не меняют
+    эмбеддинг. Строки сравниваются без учета регистра, даты приводятся к
+    виду ГГГГ-ММ-ДД, месяцы - к номеру.
+    """
+    text = (question or "").replace("ё", "е")
+    literals = []
+
+    def quoted(match: "re.Match") -> str:
+        literals.append("s:" + next(group for group in match.groups() if group is not None).strip().lower())
+        return " "
+
+    def date(match: "re.Match") -> str:
+        year, month, day = match.group(1, 2, 3) if match.group(1) else match.group(6, 5, 4)
+        literals.append(f"d:{int(year):04d}-{int(month):02d}-{int(day):02d}")
+        return " "
+
+    def month(match: "re.Match") -> str:
+        literals.append(f"m:{next(i for i, group in enumerate(match.groups(), 1) if group)}")
+        return " "
+
+    text = _QUOTED_RE.sub(quoted, text)
+    text = _DATE_RE.sub(date, text)
+    text = _MONTH_RE.sub(month, text.lower())
+    literals.extend("n:" + n.replace(",", ".") for n in _NUMBER_RE.findall(text))
+    return tuple(sorted(literals))
+
+
+@dataclass
+class SemanticCacheEntry:
+    question: str
+    literals: Tuple[str, ...]
+    domain: str
+    role: str
+    kb_version: Hashable
+    value: Dict[str, Any]
+    expires_at: float
+    hits: int = 0
+
+
+@dataclass
+class SemanticCacheHit:
+    value: Dict[str, Any]
+    similarity: float
+    question: str
+
+
+class SemanticSQLCache:
+    """
+    Кэш SQL по косинусной близости эмбеддингов вопросов
+
+    Эмбеддинги хранятся в заранее выделенной матрице на max_entries строк,
+    поэтому память ограничена. Вытеснение - LRU, записи устаревают по TTL,
+    смена версии KB делает старые записи непригодными (clear() при инвалидации).
+    Совпадение засчитывается только внутри того же домена и роли, при равных
+    литералах вопроса (строки в кавычках, даты, месяцы, числа) и близости не
+    ниже порога домена.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+        threshold: Optional[float] = None,
+        domain_thresholds: Optional[Dict[str, float]] = None,
+    ):
+        self.max_entries = (
+            max_entries if max_entries is not None
+            else int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+        )
+        self.ttl = ttl if ttl is not None else float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+        self.threshold = (
+            threshold if threshold is not None
+            else float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.93"))
+        )
+        self.domain_thresholds = (
+            domain_thresholds if domain_thresholds is not None
+            else parse_thresholds(os.getenv("SEMANTIC_CACHE_DOMAIN_THRESHOLDS", ""))
+        )
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Optional[SemanticCacheEntry]] = [None] * max(self.max_entries, 0)
+        self._free: List[int] = list(range(max(self.max_entries, 0) - 1, -1, -1))
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._hit_similarity_total = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def threshold_for(self, domain: str) -> float:
+        return self.domain_thresholds.get(domain, self.threshold)
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _release(self, slot: int):
+        self._entries[slot] = None
+        self._lru.pop(slot, None)
+        self._free.append(slot)
+
+    def lookup(
+        self,
+        embedding: Sequence[float],
+        question: str,
+        domain: str,
+        role: Optional[str],
+        kb_version: Hashable,
+    ) -> Optional[SemanticCacheHit]:
+        """
+        Поиск ближайшего закэшированного вопроса
+
+        Returns:
+            Optional[SemanticCacheHit]: Ответ, близость и исходный вопрос либо None
+        """
+        if not self.enabled:
+            return None
+        query = self._normalize(embedding)
+        literals = extract_literals(question)
+        threshold = self.threshold_for(domain)
+        now = time.monotonic()
+
+        with self._lock:
+            if self._vectors is None or not self._lru or self._vectors.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+
+            slots = np.fromiter(self._lru.keys(), dtype=np.int64, count=len(self._lru))
+            similarities = self._vectors[slots] @ query
+            order = np.argsort(-similarities)
+
+            for i in order:
+                similarity = float(similarities[i])
+                if similarity < threshold:
+                    break
+                slot = int(slots[i])
+                entry = self._entries[slot]
+                if entry is None:
+                    continue
+                if entry.expires_at <= now:
+                    self._release(slot)
+                    self.expirations += 1
+                    continue
+                if (
+                    entry.domain != domain
+                    or entry.role != (role or "")
+                    or entry.kb_version != kb_version
+                    or entry.literals != literals
+                ):
+                    continue
+                entry.hits += 1
+                self._lru.move_to_end(slot)
+                self.hits += 1
+                self._hit_similarity_total += similarity
+                return SemanticCacheHit(value=dict(entry.value), similarity=similarity, question=entry.question)
+
+            self.misses += 1
+            return None
+
+    def add(
+        self,
+        embedding: Sequence[float],
+        question: str,
+        domain: str,
+        role: Optional[str],
+        kb_version: Hashable,
+        value: Dict[str, Any],
+    ):
+        """Сохранение ответа; при заполнении вытесняется давно не использованная запись"""
+        if not self.enabled:
+            return
+        vec = self._normalize(embedding)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vec.shape[0]:
+                # Матрица выделяется по размерности первой модели эмбеддингов
+                self._vectors = np.zeros((self.max_entries, vec.shape[0]), dtype=np.float32)
+                self._entries = [None] * self.max_entries
+                self._free = list(range(self.max_entries - 1, -1, -1))
+                self._lru.clear()
+
+            normalized = normalize_question(question)
+            for slot in self._lru:
+                entry = self._entries[slot]
+                if (
+                    entry is not None
+                    and entry.question == normalized
+                    and entry.domain == domain
+                    and entry.role == (role or "")
+                    and entry.kb_version == kb_version
+                ):
+                    self._release(slot)
+                    break
+
+            if not self._free:
+                oldest, _ = self._lru.popitem(last=False)
+                self._entries[oldest] = None
+                self._free.append(oldest)
+                self.evictions += 1
+
+            slot = self._free.pop()
+            self._vectors[slot] = vec
+            self._entries[slot] = SemanticCacheEntry(
+                question=normalized,
+                literals=extract_literals(question),
+                domain=domain,
+                role=role or "",
+                kb_version=kb_version,
+                value=dict(value),
+                expires_at=time.monotonic() + self.ttl,
+            )
+            self._lru[slot] = None
+
+    def clear(self):
+        """Полная инвалидация (изменилась KB или схема)"""
+        with self._lock:
+            for slot in list(self._lru):
+                self._release(slot)
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._lru),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "domain_thresholds": dict(self.domain_thresholds),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "avg_hit_similarity": round(self._hit_similarity_total / self.hits, 4) if self.hits else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "memory_bytes": int(self._vectors.nbytes) if self._vectors is not None else 0,
+            }
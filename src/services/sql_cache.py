@@ -0,0 +1,97 @@
+"""
+Кэш сгенерированного SQL по нормализованному вопросу
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT = " \t\n.?!;:…\"'«»"
+
+
+def normalize_question(question: str) -> str:
+    """
+    Нормализация вопроса для ключа кэша
+
+    Регистр, «ё», повторяющиеся пробелы и завершающая пунктуация не влияют на SQL.
+    Операторы сравнения и числа внутри вопроса сохраняются.
+    """
+    text = (question or "").lower().replace("ё", "е")
+    text = _WHITESPACE_RE.sub(" ", text)
+    return text.strip(_TRAILING_PUNCT)
+
+
+class SQLCache:
+    """
+    LRU-кэш с TTL для сгенерированного SQL
+
+    Ключ: (нормализованный вопрос, роль, версия KB). Смена версии KB делает
+    старые ключи недостижимыми, а clear() освобождает память сразу.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_size = max_size if max_size is not None else int(os.getenv("SQL_CACHE_MAX_SIZE", "1000"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("SQL_CACHE_TTL", "3600"))
+        self._data: "OrderedDict[Hashable, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(question: str, role: Optional[str], kb_version: Hashable) -> Tuple[str, str, Hashable]:
+        return (normalize_question(question), role or "", kb_version)
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+
+    def set(self, key: Hashable, value: Dict[str, Any]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, dict(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Полная инвалидация (изменилась KB или схема)"""
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
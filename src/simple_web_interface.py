@@ -4,7 +4,8 @@
 """
 
 from fastapi import FastAPI, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from typing import Optional
 import httpx
 import logging
 import os
@@ -14,6 +15,8 @@ sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from src.utils.plan_sql_converter import sql_to_plan
 from src.services.query_service import QueryService
+from src.utils.sql_stream import format_sse
+from src.utils import tracing
 
 def fix_sql_for_mock_api(sql: str) -> str:
     """Исправляет SQL для совместимости с Mock API"""
@@ -64,6 +67,7 @@ app = FastAPI(
     description="Упрощенный интерфейс для тестирования обученного Vanna AI агента",
     version="2.0.0"
 )
+app.add_middleware(tracing.TracingMiddleware, service_name="nlsql-simple-ui")
 
 # Инициализация QueryService с KB
 def get_query_service():
@@ -294,6 +298,67 @@ async def home():
                 document.getElementById('question').value = text;
             }
 
+            const STAGE_TITLES = {
+                cache_hit: '💾 Ответ найден в кэше',
+                domain_detected: '🎯 Определен домен',
+                context_retrieved: '🔍 Получен контекст',
+                model_selected: '🤖 Выбрана модель',
+                agent_context: '📋 Контекст агента собран'
+            };
+
+            // Чтение SSE из /generate-sql/stream; возвращает данные события sql
+            async function streamSQL(formData, resultContent) {
+                const response = await fetch('/generate-sql/stream', {
+                    method: 'POST',
+                    body: formData
+                });
+                if (!response.ok || !response.body) {
+                    throw new Error(`Потоковая генерация недоступна: ${response.status}`);
+                }
+
+                resultContent.innerHTML = '<ul id="streamStages"></ul><pre id="streamTokens" style="background: #e3f2fd; padding: 15px; border-radius: 5px; overflow-x: auto;"></pre>';
+                const stages = document.getElementById('streamStages');
+                const tokens = document.getElementById('streamTokens');
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) {
+                        break;
+                    }
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                        const message = buffer.slice(0, boundary);
+                        buffer = buffer.slice(boundary + 2);
+                        let name = 'message';
+                        let payload = '';
+                        for (const line of message.split('\\n')) {
+                            if (line.startsWith('event: ')) name = line.slice(7);
+                            else if (line.startsWith('data: ')) payload += line.slice(6);
+                        }
+                        const data = payload ? JSON.parse(payload) : {};
+                        if (name === 'stage') {
+                            const details = data.domain || data.model || data.cache || '';
+                            const item = document.createElement('li');
+                            item.textContent = `${STAGE_TITLES[data.stage] || data.stage} ${details} (${data.elapsed ?? ''}с)`;
+                            stages.appendChild(item);
+                        } else if (name === 'token') {
+                            tokens.textContent += data.text;
+                        } else if (name === 'sql') {
+                            reader.cancel();
+                            return data;
+                        } else if (name === 'error') {
+                            reader.cancel();
+                            throw new Error(data.error);
+                        }
+                    }
+                }
+                throw new Error('Поток завершился без SQL');
+            }
+
             document.getElementById('sqlForm').addEventListener('submit', async function(e) {
                 e.preventDefault();
                 
@@ -319,12 +384,19 @@ async def home():
                     formData.append('role', role);
                     formData.append('department', department);
                     
+                    // Этапы и токены SQL показываем по мере генерации
+                    const streamed = await streamSQL(formData, resultContent);
+                    formData.append('sql', streamed.sql);
+                    
                     const response = await fetch('/generate-sql', {
                         method: 'POST',
                         body: formData
                     });
                     
                     const data = await response.json();
+                    data.source = data.source || streamed.source;
+                    data.model = data.model || streamed.model;
+                    data.similarity = data.similarity || streamed.similarity;
                     
                     if (data.success) {
                         resultDiv.className = 'result success';
@@ -365,6 +437,13 @@ async def home():
                         }
                         html += `<p><strong>Объяснение:</strong> ${data.explanation}</p>`;
                         html += `<p><strong>Агент:</strong> ${data.agent_type}</p>`;
+                        if (data.source) {
+                            let source = data.source === 'cache' ? '💾 кэш' : `🤖 LLM (${data.model || 'unknown'})`;
+                            if (data.similarity) {
+                                source += `, близость ${data.similarity}`;
+                            }
+                            html += `<p><strong>Источник:</strong> ${source}</p>`;
+                        }
 
                         resultContent.innerHTML = html;
                     } else {
@@ -516,13 +595,47 @@ async def home():
     </html>
     """
 
+@app.post("/generate-sql/stream")
+async def generate_sql_stream(
+    question: str = Form(...),
+    role: str = Form("admin"),
+    department: str = Form("IT")
+):
+    """Потоковая генерация SQL (SSE) в формате /query/stream основного API"""
+    global query_service
+    
+    if query_service is None:
+        query_service = get_query_service()
+        if query_service is None:
+            return JSONResponse(
+                status_code=500,
+                content={"success": False, "error": "Не удалось инициализировать QueryService"}
+            )
+    
+    async def events():
+        async for event in query_service.stream_sql(question, {}):
+            name = event.pop("event")
+            yield format_sse(name, event)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/generate-sql")
 async def generate_sql(
     question: str = Form(...),
     role: str = Form("admin"),
-    department: str = Form("IT")
+    department: str = Form("IT"),
+    sql: Optional[str] = Form(None)
 ):
-    """Генерация SQL через QueryService с KB"""
+    """
+    Генерация SQL через QueryService с KB
+    
+    Если SQL уже получен через /generate-sql/stream, он передается в поле sql
+    и повторно не генерируется: строятся только план и финальный SQL.
+    """
     global query_service
     
     try:
@@ -538,9 +651,11 @@ async def generate_sql(
                 )
         
         # Генерируем SQL через QueryService (с KB и правильными данными)
-        import asyncio
-        sql = await query_service.generate_sql(question, {})
-        sql = extract_sql_from_text(sql)
+        if sql:
+            generated = {"sql": sql}
+        else:
+            generated = await query_service.generate_sql_with_meta(question, {})
+        sql = extract_sql_from_text(generated["sql"])
         sql = normalize_sql_for_postgres(sql)
 
         # Повторная нормализация не требуется; если не SELECT — отдадим ошибку на клиенте выполнения
@@ -558,10 +673,12 @@ async def generate_sql(
         restrictions = []
         decoded_sql = None
         try:
-            async with httpx.AsyncClient(timeout=3.0) as client:
+            async with httpx.AsyncClient(timeout=3.0) as client, \
+                    tracing.span("customer_api.plan_execute", kind="client"):
                 # Сначала пробуем новую цепочку: отправляем ПЛАН в Mock API
                 resp = await client.post(
                     "http://localhost:8081/api/plan/execute",
+                    headers=tracing.inject_headers(),
                     json={
                         "plan": plan,
                         "user_context": {
@@ -581,6 +698,7 @@ async def generate_sql(
                     # Фоллбэк: старый путь SQL→Mock API
                     resp2 = await client.post(
                         "http://localhost:8081/api/sql/execute",
+                        headers=tracing.inject_headers(),
                         json={
                             "sql_template": sql_template,
                             "user_context": {
@@ -607,7 +725,10 @@ async def generate_sql(
             "final_sql": final_sql,
             "restrictions": restrictions,
             "explanation": "SQL сгенерирован QueryService с KB и правильными данными, план построен конвертером SQL→План; при наличии Mock API показан финальный SQL с ролевыми ограничениями",
-            "agent_type": "QueryService с KB"
+            "agent_type": "QueryService с KB",
+            "source": generated.get("source"),
+            "model": generated.get("model"),
+            "similarity": generated.get("similarity")
         })
                 
     except Exception as e:
@@ -703,9 +824,11 @@ async def execute_sql(
         # Выполняем SQL через Mock Customer API
         try:
             logger.info(f"Отправка SQL в Mock API: {sql}")
-            async with httpx.AsyncClient(timeout=10.0) as client:
+            async with httpx.AsyncClient(timeout=10.0) as client, \
+                    tracing.span("customer_api.sql_execute", kind="client"):
                 resp = await client.post(
                     "http://localhost:8081/api/sql/execute",
+                    headers=tracing.inject_headers(),
                     json={
                         "sql_template": sql,  # Передаем исправленный SQL
                         "user_context": {
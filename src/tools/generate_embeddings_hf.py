@@ -23,9 +23,10 @@ async def main():
     args = parser.parse_args()
 
     # Lazy import to avoid startup cost when unused
-    from sentence_transformers import SentenceTransformer
+    from src.utils.embeddings import registry, to_vector_literal
 
-    model = SentenceTransformer(args.model)
+    spec = f"hf:{args.model}"
+    registry.get(spec)
     logger.info(f"Loaded HF model: {args.model}")
 
     conn = await asyncpg.connect(args.dsn)
@@ -38,10 +39,10 @@ async def main():
     for i in range(0, total, args.batch_size):
         batch = records[i:i+args.batch_size]
         texts: List[str] = [(r['content'] or '').replace('\x00', '').strip() for r in batch]
-        emb = model.encode(texts, normalize_embeddings=True)
+        emb = registry.encode(texts, spec)
         # Save
         for rec, vec in zip(batch, emb):
-            vec_str = '[' + ','.join(map(lambda x: f"{float(x)}", vec.tolist())) + ']'
+            vec_str = to_vector_literal(vec)
             await conn.execute("""
                 UPDATE vanna_vectors SET embedding = $1::vector WHERE id = $2
             """, vec_str, rec['id'])
@@ -0,0 +1,62 @@
+-- Уведомления об изменении KB и схемы для шины инвалидации (src/utils/invalidation_bus.py)
+--
+-- Процессы API слушают канал INVALIDATION_BUS_CHANNEL (LISTEN) и сбрасывают версию KB,
+-- кэш SQL, кэш DDL и каталог схемы. Уведомление уходит после фиксации транзакции;
+-- одинаковые уведомления в одной транзакции Postgres схлопывает сам.
+--
+-- Имя канала - переменная psql channel (по умолчанию nlsql_invalidation), она
+-- должна совпадать с INVALIDATION_BUS_CHANNEL процессов API.
+--
+-- Применение (event trigger требует прав суперпользователя; триггер на vanna_vectors
+-- создается до него и достаточно прав владельца таблицы):
+--   psql "$CUSTOMER_DB_DSN" -v ON_ERROR_STOP=1 -v channel="$INVALIDATION_BUS_CHANNEL" \
+--        -f src/tools/invalidation_triggers.sql
+
+\if :{?channel}
+\else
+\set channel nlsql_invalidation
+\endif
+
+-- Канал хранится в функции: внутри тел функций ($$) переменные psql не подставляются
+SELECT format(
+    'CREATE OR REPLACE FUNCTION nlsql_invalidation_channel() RETURNS text LANGUAGE sql IMMUTABLE AS %L',
+    format('SELECT %L::text', :'channel')
+) \gexec
+
+-- Изменения vanna_vectors: один NOTIFY на оператор, а не на строку
+CREATE OR REPLACE FUNCTION nlsql_notify_kb_change() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify(
+        nlsql_invalidation_channel(),
+        json_build_object('kind', 'kb', 'table', TG_TABLE_NAME, 'op', TG_OP)::text
+    );
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS vanna_vectors_notify_invalidation ON vanna_vectors;
+CREATE TRIGGER vanna_vectors_notify_invalidation
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON vanna_vectors
+    FOR EACH STATEMENT EXECUTE FUNCTION nlsql_notify_kb_change();
+
+-- Изменения схемы: таблицы, представления, колонки, ограничения, комментарии
+CREATE OR REPLACE FUNCTION nlsql_notify_schema_change() RETURNS event_trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify(
+        nlsql_invalidation_channel(),
+        json_build_object('kind', 'schema', 'tag', TG_TAG)::text
+    );
+END;
+$$;
+
+DROP EVENT TRIGGER IF EXISTS nlsql_schema_notify_invalidation;
+CREATE EVENT TRIGGER nlsql_schema_notify_invalidation ON ddl_command_end
+    WHEN TAG IN (
+        'CREATE TABLE', 'CREATE TABLE AS', 'ALTER TABLE', 'DROP TABLE',
+        'CREATE VIEW', 'ALTER VIEW', 'DROP VIEW',
+        'CREATE MATERIALIZED VIEW', 'DROP MATERIALIZED VIEW',
+        'CREATE SCHEMA', 'DROP SCHEMA', 'COMMENT'
+    )
+    EXECUTE FUNCTION nlsql_notify_schema_change();
@@ -0,0 +1,232 @@
+"""
+Выгрузка результатов запросов в Apache Arrow и Parquet
+
+Строится из потока кадров курсора (meta с колонками и типами Postgres, затем
+пачки строк - см. stream_sql_against_db в src/mock_customer_api.py):
+
+- Arrow IPC stream - пачка строк превращается в RecordBatch и сразу
+  отдается клиенту, в памяти не больше одной пачки;
+- Parquet - пачки пишутся во временный файл (футер Parquet пишется в конце,
+  поэтому файл отдается после выборки последней строки).
+
+Типы сохраняются: numeric(p, s) - decimal128(p, s) (decimal256 при p > 38),
+точность и масштаб берутся из typmod колонки, а не из значений, поэтому схема
+верна для всех пачек; numeric без ограничений (агрегаты, вычисления) - точной
+строкой с пометкой pg_type=numeric в метаданных поля. timestamptz - timestamp[us, UTC], timestamp - timestamp[us], uuid - расширение
+arrow.uuid, целые и float - соответствующей разрядности, json/jsonb - строки.
+
+pyarrow необязателен: без него выгрузка недоступна (ArrowUnavailableError).
+"""
+
+import io
+import os
+import re
+import uuid
+import decimal
+import logging
+import tempfile
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # необязательная зависимость
+    pa = None
+    pq = None
+
+ARROW = "arrow"
+PARQUET = "parquet"
+FORMATS = (ARROW, PARQUET)
+
+MEDIA_TYPES = {
+    ARROW: "application/vnd.apache.arrow.stream",
+    PARQUET: "application/vnd.apache.parquet",
+}
+
+DECIMAL128_PRECISION = 38
+DECIMAL256_PRECISION = 76
+UUID_EXTENSION = "arrow.uuid"
+# Строк в группе Parquet: пачки курсора мелкие, группы копятся до этого размера
+PARQUET_ROW_GROUP_ROWS = int(os.getenv("ARROW_PARQUET_ROW_GROUP_ROWS", "65536"))
+
+_NUMERIC_TYPMOD = re.compile(r"numeric\((\d+)(?:,(-?\d+))?\)")
+
+
+class ArrowUnavailableError(RuntimeError):
+    """pyarrow не установлен"""
+
+
+def require_arrow():
+    if pa is None:
+        raise ArrowUnavailableError("Выгрузка Arrow/Parquet недоступна: не установлен pyarrow")
+
+
+def _simple_types() -> Dict[str, Any]:
+    return {
+        'bool': pa.bool_(),
+        'int2': pa.int16(),
+        'int4': pa.int32(),
+        'int8': pa.int64(),
+        'oid': pa.int64(),
+        'float4': pa.float32(),
+        'float8': pa.float64(),
+        'date': pa.date32(),
+        'time': pa.time64('us'),
+        'timestamp': pa.timestamp('us'),
+        # asyncpg возвращает aware datetime; храним в UTC с пометкой часового пояса
+        'timestamptz': pa.timestamp('us', tz='UTC'),
+        'interval': pa.duration('us'),
+        'bytea': pa.binary(),
+    }
+
+
+def numeric_typmod(pg_type: str) -> Optional[Tuple[int, int]]:
+    """Точность и масштаб из 'numeric(p,s)' (format_type); None - numeric без ограничений"""
+    match = _NUMERIC_TYPMOD.fullmatch(pg_type.replace(" ", ""))
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2) or 0)
+
+
+def _numeric_type(pg_type: str):
+    typmod = numeric_typmod(pg_type)
+    if typmod is None:
+        return None
+    precision, scale = typmod
+    # Отрицательный масштаб (PostgreSQL 15+) Arrow поддерживает не везде - такие колонки строкой
+    if scale < 0 or precision > DECIMAL256_PRECISION:
+        return None
+    if precision > DECIMAL128_PRECISION:
+        return pa.decimal256(precision, scale)
+    return pa.decimal128(precision, scale)
+
+
+def _uuid_type():
+    """Расширение arrow.uuid (pyarrow >= 18), иначе fixed_size_binary(16) с пометкой в метаданных поля"""
+    return pa.uuid() if hasattr(pa, "uuid") else pa.binary(16)
+
+
+def arrow_field(name: str, pg_type: str):
+    """
+    Поле Arrow для колонки с типом Postgres
+
+    pg_type - имя типа asyncpg (int4, timestamptz), для numeric - с typmod ('numeric(12,2)')
+    """
+    if pg_type.startswith('numeric'):
+        decimal_type = _numeric_type(pg_type)
+        if decimal_type is not None:
+            return pa.field(name, decimal_type)
+        # Масштаб заранее неизвестен: точное значение строкой, тип - в метаданных
+        return pa.field(name, pa.string(), metadata={b"pg_type": b"numeric"})
+    if pg_type == 'uuid':
+        arrow_type = _uuid_type()
+        metadata = None if hasattr(pa, "uuid") else {b"ARROW:extension:name": UUID_EXTENSION.encode()}
+        return pa.field(name, arrow_type, metadata=metadata)
+    simple = _simple_types().get(pg_type)
+    # text, varchar, json/jsonb, enum и прочие - строкой
+    return pa.field(name, simple if simple is not None else pa.string())
+
+
+def build_schema(columns: Sequence[str], types: Sequence[str]):
+    """Схема по колонкам и типам Postgres (не зависит от значений)"""
+    require_arrow()
+    return pa.schema([arrow_field(name, pg_type) for name, pg_type in zip(columns, types)])
+
+
+def _column_array(field, pg_type: str, values: List[Any]):
+    if pg_type == 'uuid':
+        storage = pa.array([value.bytes if isinstance(value, uuid.UUID) else value for value in values], pa.binary(16))
+        return pa.ExtensionArray.from_storage(field.type, storage) if hasattr(pa, "uuid") else storage
+    if pa.types.is_string(field.type):
+        values = [
+            value if value is None or isinstance(value, str)
+            else format(value, 'f') if isinstance(value, decimal.Decimal) and value.is_finite()
+            else str(value)
+            for value in values
+        ]
+    return pa.array(values, type=field.type)
+
+
+def record_batch(schema, types: Sequence[str], rows: Sequence[Sequence[Any]]):
+    """RecordBatch из строк-кортежей (транспонирование по колонкам)"""
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    arrays = [
+        _column_array(field, pg_type, list(values))
+        for field, pg_type, values in zip(schema, types, columns)
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+async def _batches(frames: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Tuple[Any, Optional[Any]]]:
+    """(схема, RecordBatch) по кадрам курсора; схема строится по кадру meta"""
+    require_arrow()
+    types: List[str] = []
+    schema = None
+    async for frame in frames:
+        if frame["type"] == "meta":
+            types = frame.get("types") or ['text'] * len(frame["columns"])
+            schema = build_schema(frame["columns"], types)
+            # Пустой результат тоже получает схему
+            yield schema, None
+            continue
+        yield schema, record_batch(schema, types, frame["rows"])
+
+
+async def ipc_stream(frames: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Arrow IPC stream: схема, затем по сообщению на пачку, затем маркер конца потока"""
+    sink = io.BytesIO()
+    writer = None
+    rows = 0
+    async for schema, batch in _batches(frames):
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, schema)
+        if batch is not None:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+        # Отдаем записанное и освобождаем буфер: в памяти только текущая пачка
+        chunk = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        yield chunk
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue()
+    logger.info(f"✅ Arrow IPC: {rows} строк")
+
+
+async def write_parquet(frames: AsyncIterator[Dict[str, Any]], directory: Optional[str] = None) -> Tuple[str, int]:
+    """
+    Запись пачек во временный файл Parquet (в памяти - не больше группы строк)
+
+    Returns:
+        (путь к файлу, число строк); файл удаляет вызывающий
+    """
+    handle, path = tempfile.mkstemp(suffix=".parquet", dir=directory)
+    os.close(handle)
+    writer = None
+    pending: List[Any] = []
+    pending_rows = rows = 0
+    try:
+        async for schema, batch in _batches(frames):
+            if writer is None:
+                writer = pq.ParquetWriter(path, schema)
+            if batch is not None:
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                rows += batch.num_rows
+            if pending_rows >= PARQUET_ROW_GROUP_ROWS:
+                writer.write_table(pa.Table.from_batches(pending))
+                pending, pending_rows = [], 0
+        if writer is not None:
+            if pending:
+                writer.write_table(pa.Table.from_batches(pending))
+            writer.close()
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        os.unlink(path)
+        raise
+    logger.info(f"✅ Parquet: {rows} строк, {os.path.getsize(path)} байт")
+    return path, rows
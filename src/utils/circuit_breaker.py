@@ -0,0 +1,171 @@
+"""
+Circuit breaker для внешних провайдеров (LLM)
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Ошибки авторизации не лечатся повтором - размыкаем сразу
+FATAL_STATUS_CODES = (401, 403)
+
+
+def is_fatal_error(error: Optional[BaseException]) -> bool:
+    """Ошибка провайдера, после которой повторять вызов бессмысленно (неверный ключ, нет доступа)"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in FATAL_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Автомат closed → open → half_open → closed
+
+    - closed: вызовы проходят; failure_threshold ошибок подряд (медленный вызов
+      дольше slow_call_threshold считается ошибкой) размыкают цепь;
+    - open: вызовы сразу отклоняются в течение recovery_timeout;
+    - half_open: пропускается half_open_max_calls пробных вызовов, успех
+      замыкает цепь, ошибка снова размыкает.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        slow_call_threshold: Optional[float] = None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.slow_call_threshold = slow_call_threshold
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_at = 0.0
+        self._half_open_calls = 0
+        self._last_error: Optional[str] = None
+
+        self.rejected = 0
+        self.opened = 0
+        self.failures = 0
+        self.successes = 0
+        self.slow_calls = 0
+
+    def _transition(self, state: str, reason: str = ""):
+        if state == self._state:
+            return
+        previous, self._state = self._state, state
+        now = time.monotonic()
+        if state == OPEN:
+            self._opened_at = now
+            self.opened += 1
+        elif state == HALF_OPEN:
+            self._half_open_at = now
+            self._half_open_calls = 0
+        elif state == CLOSED:
+            self._consecutive_failures = 0
+        logger.warning(f"🔌 Circuit {self.name}: {previous} → {state}{f' ({reason})' if reason else ''}")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._state == OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN, "истек recovery_timeout")
+        elif (
+            self._state == HALF_OPEN
+            and self._half_open_calls >= self.half_open_max_calls
+            and now - self._half_open_at >= self.recovery_timeout
+        ):
+            # Пробный вызов так и не отчитался - разрешаем новую попытку
+            self._half_open_at = now
+            self._half_open_calls = 0
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов; в half_open занимает пробный слот"""
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, latency: Optional[float] = None):
+        """Успешный вызов; слишком медленный учитывается как ошибка"""
+        if self.slow_call_threshold is not None and latency is not None and latency > self.slow_call_threshold:
+            with self._lock:
+                self.slow_calls += 1
+            self.record_failure(reason=f"медленный вызов {latency:.1f}с")
+            return
+        with self._lock:
+            self.successes += 1
+            self._consecutive_failures = 0
+            if self._state != CLOSED:
+                self._transition(CLOSED, "успешный вызов")
+
+    def record_failure(self, error: Optional[BaseException] = None, reason: Optional[str] = None):
+        """Ошибка вызова или недоступность по пробе"""
+        with self._lock:
+            self.failures += 1
+            self._consecutive_failures += 1
+            self._last_error = reason or (repr(error) if error is not None else None)
+            if self._state == HALF_OPEN:
+                self._transition(OPEN, "ошибка пробного вызова")
+            elif self._state == CLOSED and (
+                is_fatal_error(error) or self._consecutive_failures >= self.failure_threshold
+            ):
+                self._transition(OPEN, self._last_error or "")
+            elif self._state == OPEN:
+                self._opened_at = time.monotonic()
+
+    def trip(self, reason: str):
+        """Принудительное размыкание (проба показала, что провайдер недоступен)"""
+        with self._lock:
+            self._last_error = reason
+            if self._state == OPEN:
+                self._opened_at = time.monotonic()
+            else:
+                self._transition(OPEN, reason)
+
+    def probe_succeeded(self):
+        """Проба успешна: разомкнутая цепь переходит к пробным вызовам, не дожидаясь таймаута"""
+        with self._lock:
+            if self._state == OPEN:
+                self._transition(HALF_OPEN, "проба успешна")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            snapshot = {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "failures": self.failures,
+                "successes": self.successes,
+                "slow_calls": self.slow_calls,
+                "rejected": self.rejected,
+                "opened": self.opened,
+                "last_error": self._last_error,
+            }
+            if self._state == OPEN:
+                snapshot["retry_in"] = round(max(self.recovery_timeout - (time.monotonic() - self._opened_at), 0.0), 3)
+            return snapshot
@@ -0,0 +1,210 @@
+"""
+Сборка контекста промпта в бюджет токенов
+
+Фрагменты всех источников (DDL домена, гибридный поиск, RAG примеры, DDL
+приоритетных таблиц из каталога схемы, документация) собираются вместе,
+дубликаты отбрасываются по таблице и по хэшу содержимого, остальное
+ранжируется по приоритету источника и укладывается в бюджет модели.
+Фрагмент, не влезающий целиком, усекается по строкам (если разрешено), иначе
+отбрасывается; отчет перечисляет отброшенное.
+
+Переменные окружения:
+    CONTEXT_TOKEN_BUDGET          бюджет контекста в токенах по умолчанию
+    CONTEXT_TOKEN_BUDGET_<MODEL>  бюджет для модели пайплайна (GPT4, OLLAMA, SQLCODER)
+"""
+
+import os
+import re
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.utils.tokens import count_tokens, is_exact
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = 3000
+
+# Чем выше, тем раньше фрагмент попадает в бюджет; при совпадении таблицы
+# остается фрагмент источника с большим приоритетом
+SOURCE_PRIORITY = {
+    'ddl': 100,
+    'payment': 90,
+    'rag': 80,
+    'schema': 50,
+    'docs': 30,
+}
+# Надбавка источникам, не зависящим от вопроса, когда нужен стабильный префикс
+# промпта: они упаковываются первыми, и их состав одинаков для всех вопросов
+STATIC_PRIORITY_BOOST = 1000
+
+# Усеченный фрагмент меньше этого размера бесполезен - отбрасываем целиком
+MIN_TRUNCATED_TOKENS = 48
+# Одна большая таблица не должна вытеснять остальные источники
+MAX_SNIPPET_SHARE = 0.3
+TRUNCATION_MARK = "-- ... (усечено по бюджету контекста)"
+
+# Заголовки описаний таблиц: DDL из vanna_vectors, каталог схемы, pg_dump
+_TABLE_PATTERNS = (
+    re.compile(r"^TABLE:\s*(?:\w+\.)?(\w+)", re.MULTILINE),
+    re.compile(r"^Таблица\s+(?:\w+\.)?(\w+)\s*:", re.MULTILINE),
+    re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?:\w+\.)?\"?(\w+)\"?", re.IGNORECASE),
+)
+
+
+def detect_table(text: str) -> Optional[str]:
+    """Имя таблицы, которую описывает фрагмент (None - фрагмент не про таблицу)"""
+    for pattern in _TABLE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return match.group(1).lower()
+    return None
+
+
+def content_hash(text: str) -> str:
+    """Хэш содержимого без учета регистра и пробелов"""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def budget_for(model_name: Optional[str] = None) -> int:
+    """Бюджет контекста модели пайплайна (gpt4, ollama, sqlcoder)"""
+    default = int(os.getenv("CONTEXT_TOKEN_BUDGET", str(DEFAULT_BUDGET)))
+    if not model_name:
+        return default
+    return int(os.getenv(f"CONTEXT_TOKEN_BUDGET_{model_name.upper()}", str(default)))
+
+
+@dataclass
+class Snippet:
+    source: str
+    text: str
+    priority: float
+    table: Optional[str] = None
+    tokens: int = 0
+
+
+@dataclass
+class AssembledContext:
+    """Результат сборки: фрагменты по источникам в порядке ранжирования"""
+    budget: int
+    sections: Dict[str, List[str]] = field(default_factory=dict)
+    used_tokens: int = 0
+    candidates: int = 0
+    dropped: List[Dict[str, Any]] = field(default_factory=list)
+    truncated: List[Dict[str, Any]] = field(default_factory=list)
+
+    def text(self, source: str) -> str:
+        return "\n\n".join(self.sections.get(source, []))
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'budget': self.budget,
+            'used_tokens': self.used_tokens,
+            # False - токены оценены по числу символов (tiktoken не установлен)
+            'exact_tokens': is_exact(),
+            'candidates': self.candidates,
+            'included': sum(len(parts) for parts in self.sections.values()),
+            'truncated': self.truncated,
+            'dropped': self.dropped,
+        }
+
+
+class ContextAssembler:
+    """
+    Кандидаты контекста из всех источников с дедупликацией и бюджетом токенов
+
+    Пример:
+        assembler = ContextAssembler(budget_for('gpt4'), tokenizer_model='gpt-4o')
+        assembler.add('ddl', ddl_parts, ddl=True)
+        assembler.add('rag', examples)
+        context = assembler.assemble()
+    """
+
+    def __init__(self, budget_tokens: int, tokenizer_model: Optional[str] = None):
+        self.budget_tokens = max(0, int(budget_tokens))
+        self.tokenizer_model = tokenizer_model
+        self._snippets: List[Snippet] = []
+
+    def add(self, source: str, texts: Iterable[str], priority: Optional[float] = None, ddl: bool = False):
+        """
+        Кандидаты одного источника, от более к менее релевантному
+
+        Args:
+            source: Имя источника (ключ секции промпта)
+            texts: Фрагменты
+            priority: Приоритет источника (по умолчанию из SOURCE_PRIORITY)
+            ddl: Фрагменты - описания таблиц: дедупликация по таблице и
+                усечение по строкам, если фрагмент не влезает целиком
+        """
+        base = priority if priority is not None else SOURCE_PRIORITY.get(source, 0)
+        for rank, text in enumerate(text for text in texts if text and text.strip()):
+            text = text.strip()
+            self._snippets.append(Snippet(
+                source=source,
+                text=text,
+                # Внутри источника сохраняется порядок релевантности
+                priority=base - rank * 0.01,
+                table=detect_table(text) if ddl else None,
+            ))
+
+    def _count(self, text: str) -> int:
+        return count_tokens(text, self.tokenizer_model)
+
+    def _truncate(self, snippet: Snippet, limit: int) -> Optional[str]:
+        """Наибольший префикс по строкам, укладывающийся в limit токенов"""
+        lines = snippet.text.splitlines()
+        low, high, best = 1, len(lines) - 1, None
+        while low <= high:
+            middle = (low + high) // 2
+            candidate = "\n".join(lines[:middle] + [TRUNCATION_MARK])
+            if self._count(candidate) <= limit:
+                best, low = candidate, middle + 1
+            else:
+                high = middle - 1
+        return best
+
+    def assemble(self) -> AssembledContext:
+        result = AssembledContext(budget=self.budget_tokens, candidates=len(self._snippets))
+        seen_hashes = set()
+        seen_tables: Dict[str, str] = {}
+        # sorted устойчив: при равном приоритете сохраняется порядок добавления
+        for snippet in sorted(self._snippets, key=lambda s: -s.priority):
+            info = {'source': snippet.source, 'table': snippet.table}
+            digest = content_hash(snippet.text)
+            if digest in seen_hashes:
+                result.dropped.append({**info, 'reason': 'duplicate'})
+                continue
+            if snippet.table and snippet.table in seen_tables:
+                result.dropped.append({**info, 'reason': f"duplicate_table:{seen_tables[snippet.table]}"})
+                continue
+
+            snippet.tokens = self._count(snippet.text)
+            remaining = self.budget_tokens - result.used_tokens
+            if snippet.table:
+                remaining = min(remaining, max(MIN_TRUNCATED_TOKENS, int(self.budget_tokens * MAX_SNIPPET_SHARE)))
+            text, tokens = snippet.text, snippet.tokens
+            if tokens > remaining:
+                text = (
+                    self._truncate(snippet, remaining)
+                    if snippet.table and remaining >= MIN_TRUNCATED_TOKENS else None
+                )
+                if text is None:
+                    result.dropped.append({**info, 'reason': 'budget', 'tokens': snippet.tokens})
+                    continue
+                tokens = self._count(text)
+                result.truncated.append({**info, 'tokens': snippet.tokens, 'kept_tokens': tokens})
+
+            seen_hashes.add(digest)
+            if snippet.table:
+                seen_tables[snippet.table] = snippet.source
+            result.sections.setdefault(snippet.source, []).append(text)
+            result.used_tokens += tokens
+
+        if result.dropped or result.truncated:
+            logger.info(
+                f"✂️ Контекст: {result.used_tokens}/{self.budget_tokens} токенов, "
+                f"отброшено {len(result.dropped)}, усечено {len(result.truncated)} из {result.candidates}"
+            )
+        return result
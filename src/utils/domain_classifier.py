@@ -0,0 +1,255 @@
+"""
+Классификатор домена вопроса
+
+Единое описание доменов (ключевые слова, таблицы, примеры вопросов) и
+скомпилированный классификатор: основы ключевых слов собираются один раз в
+префиксное дерево, а дерево - в одно регулярное выражение, так что вопрос
+просматривается за один проход движком re. Основа ключевого слова (легкий
+стеммер без зависимостей) совпадает с началом слова вопроса, поэтому 'платеж'
+находит 'платежами', а 'админ' - 'администратор'.
+
+Если ключевые слова не нашлись, а эмбеддинг вопроса уже посчитан (семантический
+кэш), домен определяется по близости к центроидам доменов. Центроиды строит
+tools/build_domain_centroids.py.
+
+Переменные окружения:
+    DOMAIN_CENTROIDS_PATH       файл центроидов (JSON)
+    DOMAIN_CENTROID_THRESHOLD   минимальная косинусная близость к центроиду
+"""
+
+import os
+import re
+import json
+import math
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+GENERAL = 'general'
+DEFAULT_CENTROIDS_PATH = "training_data/domain_centroids.json"
+
+
+@dataclass(frozen=True)
+class DomainSpec:
+    keywords: Tuple[str, ...]
+    tables: Tuple[str, ...]
+    # Типичные вопросы домена - материал для центроидов эмбеддингов
+    examples: Tuple[str, ...] = ()
+
+
+# Порядок доменов важен: при равном счете побеждает объявленный раньше
+DOMAINS: Dict[str, DomainSpec] = {
+    'payments': DomainSpec(
+        keywords=('платеж', 'payment', 'оплата', 'деньги', 'денег', 'сумма', 'рубль', 'входящий', 'исходящий'),
+        tables=('tbl_incoming_payments', 'tbl_payment_statuses', 'tbl_postpayment_types', 'tbl_business_unit',
+                'tbl_principal_assignment'),
+        examples=('покажи входящие платежи за месяц', 'сумма оплат по клиентам', 'платежи в статусе ошибка'),
+    ),
+    'users': DomainSpec(
+        keywords=('пользователь', 'user', 'сотрудник', 'менеджер', 'админ', 'логин', 'отдел', 'департамент'),
+        tables=('equsers', 'eq_departments', 'eqroles', 'eqgroups'),
+        examples=('список пользователей отдела', 'сотрудники с ролью администратора', 'кто менеджер клиента'),
+    ),
+    'assignments': DomainSpec(
+        keywords=('поручение', 'assignment', 'задание', 'документ', 'договор', 'контракт', 'task'),
+        tables=('tbl_principal_assignment', 'tbl_business_unit', 'equsers'),
+        examples=('поручения по клиенту', 'просроченные задания', 'договоры без документов'),
+    ),
+    'reports': DomainSpec(
+        keywords=('отчет', 'report', 'статистика', 'аналитика', 'сводка', 'итог'),
+        tables=('tbl_incoming_payments', 'equsers', 'eq_departments', 'tbl_business_unit'),
+        examples=('сводка по отделам за квартал', 'статистика платежей по месяцам', 'итоги работы менеджеров'),
+    ),
+}
+
+DOMAIN_TABLES: Dict[str, List[str]] = {name: list(spec.tables) for name, spec in DOMAINS.items()}
+
+# Окончания русских слов, от длинных к коротким; основа не короче MIN_STEM
+_ENDINGS = sorted((
+    'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях', 'иям', 'ием', 'ией',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ов', 'ев', 'ом', 'ем',
+    'ам', 'ям', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья',
+    'ы', 'и', 'а', 'я', 'о', 'е', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 4
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace('ё', 'е')
+
+
+def stem(word: str) -> str:
+    """Основа слова: снимается одно окончание (русское или английское -s)"""
+    word = normalize(word)
+    if word.isascii():
+        return word[:-1] if len(word) > MIN_STEM and word.endswith('s') else word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+@dataclass
+class DomainScore:
+    domain: str
+    score: float
+    keywords: List[str] = field(default_factory=list)
+    method: str = 'keywords'
+
+
+@dataclass
+class Classification:
+    """Итог: лучший домен (или general) и счет всех найденных доменов по убыванию"""
+    domain: str
+    scores: List[DomainScore] = field(default_factory=list)
+
+    @property
+    def method(self) -> Optional[str]:
+        return self.scores[0].method if self.scores else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'domain': self.domain,
+            'method': self.method,
+            'scores': [
+                {'domain': s.domain, 'score': round(s.score, 4), 'keywords': s.keywords, 'method': s.method}
+                for s in self.scores
+            ],
+        }
+
+
+def _trie_pattern(node: Dict[str, Any]) -> str:
+    """Регулярное выражение из префиксного дерева (ветвления - альтернативы)"""
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != '$']
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # Основа, которая сама является началом более длинной: продолжение необязательно
+    return f'(?:{pattern})?' if '$' in node else pattern
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class DomainClassifier:
+    """
+    Скомпилированный классификатор домена
+
+    Дерево строится из основ ключевых слов один раз и компилируется в
+    регулярное выражение, привязанное к началу слова.
+    """
+
+    def __init__(self, domains: Optional[Dict[str, DomainSpec]] = None,
+                 centroids: Optional[Dict[str, List[float]]] = None,
+                 centroid_threshold: Optional[float] = None):
+        self.domains = domains or DOMAINS
+        self._order = {name: index for index, name in enumerate(self.domains)}
+        keywords: Dict[str, List[Tuple[str, str]]] = {}
+        trie: Dict[str, Any] = {}
+        for name, spec in self.domains.items():
+            for keyword in spec.keywords:
+                keyword_stem = stem(keyword)
+                keywords.setdefault(keyword_stem, []).append((name, keyword))
+                node = trie
+                for char in keyword_stem:
+                    node = node.setdefault(char, {})
+                node['$'] = True
+        self._pattern = re.compile(r'\b(' + _trie_pattern(trie) + ')')
+        # Жадное совпадение - самая длинная основа; основы, являющиеся ее началом, засчитываются заранее
+        self._hits: Dict[str, Tuple[Tuple[str, str], ...]] = {
+            keyword_stem: tuple(hit for other, hits in keywords.items() if keyword_stem.startswith(other) for hit in hits)
+            for keyword_stem in keywords
+        }
+        self.centroids = centroids or {}
+        self.centroid_threshold = (
+            centroid_threshold if centroid_threshold is not None
+            else float(os.getenv("DOMAIN_CENTROID_THRESHOLD", "0.45"))
+        )
+
+    def match(self, question: str) -> Dict[str, List[str]]:
+        """Найденные ключевые слова по доменам"""
+        found: Dict[str, List[str]] = {}
+        for matched in self._pattern.findall(normalize(question)):
+            for name, keyword in self._hits[matched]:
+                keywords = found.setdefault(name, [])
+                if keyword not in keywords:
+                    keywords.append(keyword)
+        return found
+
+    def classify(self, question: str, embedding: Optional[Sequence[float]] = None) -> Classification:
+        """
+        Домен вопроса
+
+        Args:
+            question: Вопрос пользователя
+            embedding: Эмбеддинг вопроса, если уже посчитан (для центроидов)
+        """
+        found = self.match(question)
+        if found:
+            # Домены в found идут в порядке первого совпадения - сортируем по счету, затем по объявлению
+            ranked = sorted(found, key=lambda name: (-len(found[name]), self._order[name]))
+            scores = [DomainScore(name, float(len(found[name])), found[name]) for name in ranked]
+            return Classification(ranked[0], scores)
+        if embedding is not None and self.centroids:
+            scores = [
+                DomainScore(name, _cosine(embedding, centroid), method='centroid')
+                for name, centroid in self.centroids.items()
+                if len(centroid) == len(embedding)
+            ]
+            scores.sort(key=lambda s: -s.score)
+            if scores and scores[0].score >= self.centroid_threshold:
+                return Classification(scores[0].domain, scores)
+            return Classification(GENERAL, scores)
+        return Classification(GENERAL)
+
+    def load_centroids(self, path: str, spec: Optional[str] = None) -> bool:
+        """Загрузка центроидов; файл другой модели эмбеддингов игнорируется"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        if spec and data.get("spec") != spec:
+            logger.warning(f"⚠️ Центроиды доменов построены для {data.get('spec')}, а не {spec} - не используются")
+            return False
+        self.centroids = {name: vector for name, vector in data.get("centroids", {}).items() if name in self.domains}
+        logger.info(f"✅ Центроиды доменов загружены: {len(self.centroids)} ({path})")
+        return bool(self.centroids)
+
+
+def build_centroids(embed_texts: Callable[[List[str]], List[List[float]]],
+                    domains: Optional[Dict[str, DomainSpec]] = None) -> Dict[str, List[float]]:
+    """Центроид домена - среднее эмбеддингов его примеров и ключевых слов"""
+    centroids = {}
+    for name, spec in (domains or DOMAINS).items():
+        texts = list(spec.examples) + list(spec.keywords)
+        vectors = embed_texts(texts)
+        centroids[name] = [sum(values) / len(vectors) for values in zip(*vectors)]
+    return centroids
+
+
+_classifier: Optional[DomainClassifier] = None
+_classifier_lock = threading.Lock()
+
+
+def get_domain_classifier() -> DomainClassifier:
+    """Классификатор процесса; центроиды подхватываются из DOMAIN_CENTROIDS_PATH, если файл есть"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                classifier = DomainClassifier()
+                path = os.getenv("DOMAIN_CENTROIDS_PATH", DEFAULT_CENTROIDS_PATH)
+                try:
+                    from src.utils.embeddings import retrieval_spec
+                    classifier.load_centroids(path, retrieval_spec())
+                except Exception as e:
+                    logger.warning(f"⚠️ Центроиды доменов не загружены: {e}")
+                _classifier = classifier
+    return _classifier
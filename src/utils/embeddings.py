@@ -4,6 +4,11 @@ Unified embedding utility with switchable backend:
 - OPENAI (default): uses text-embedding-ada-002 or TEXT_EMBEDDING_MODEL
 - HF (sentence-transformers): loads from HF_MODEL_NAME or HF_MODEL_PATH
 
+Every backend is loaded at most once per process through EmbeddingRegistry.
+Retrieval modules (pgvector search over vanna_vectors, VECTOR(384)) must use
+embed_query / aembed_query so that the question is encoded by the same HF
+model that produced the stored vectors (see src/tools/generate_embeddings_hf.py).
+
 Env vars:
 - EMBEDDER=OPENAI|HF
 - TEXT_EMBEDDING_MODEL (default: text-embedding-ada-002)
@@ -12,118 +17,271 @@ Env vars:
 """
 
 import os
+import math
+import time
+import asyncio
+import logging
 import threading
-from typing import List
-
-_init_lock = threading.Lock()
-_state = {
-    "backend": None,
-    "openai_client": None,
-    "openai_model": None,
-    "hf_model": None,
-    "hf_tokenizer": None,
-}
-
-
-def _ensure_initialized():
-    if _state["backend"] is not None:
-        return
-    with _init_lock:
-        if _state["backend"] is not None:
-            return
-        backend = (os.getenv("EMBEDDER") or "OPENAI").upper()
-        if backend not in ("OPENAI", "HF"):
-            backend = "OPENAI"
-        _state["backend"] = backend
-
-        if backend == "OPENAI":
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.utils import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def _hf_model_name() -> str:
+    return os.getenv("HF_MODEL_NAME") or os.getenv("HF_MODEL_PATH") or DEFAULT_HF_MODEL
+
+
+def default_spec() -> str:
+    """Backend spec selected by EMBEDDER (used by embed/embed_texts)."""
+    backend = (os.getenv("EMBEDDER") or "OPENAI").upper()
+    if backend == "HF":
+        return f"hf:{_hf_model_name()}"
+    return f"openai:{os.getenv('TEXT_EMBEDDING_MODEL', 'text-embedding-ada-002')}"
+
+
+def retrieval_spec() -> str:
+    """Backend spec used for pgvector retrieval over vanna_vectors."""
+    return f"hf:{_hf_model_name()}"
+
+
+@dataclass
+class LoadedBackend:
+    """A loaded embedding backend together with its load statistics."""
+    spec: str
+    kind: str  # sentence_transformers | transformers | openai
+    model: Any = None
+    tokenizer: Any = None
+    client: Any = None
+    model_name: str = ""
+    load_time: float = 0.0
+    memory_bytes: Optional[int] = None
+    rss_delta_bytes: Optional[int] = None
+    loaded_at: float = field(default_factory=time.time)
+    calls: int = 0
+    texts: int = 0
+    encode_time: float = 0.0
+
+
+def _process_rss() -> Optional[int]:
+    """Current resident set size of the process in bytes (Linux), if available."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+
+def _torch_model_bytes(model: Any) -> Optional[int]:
+    """Size of parameters and buffers of a torch module in bytes."""
+    try:
+        total = 0
+        for p in model.parameters():
+            total += p.numel() * p.element_size()
+        for b in model.buffers():
+            total += b.numel() * b.element_size()
+        return total
+    except Exception:
+        return None
+
+
+def _l2_normalize(vec: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+class EmbeddingRegistry:
+    """
+    Process-wide registry of embedding backends.
+
+    Backends are addressed by spec strings "hf:<model name or path>" and
+    "openai:<model>". Each spec is loaded once (double-checked locking with a
+    per-spec lock, so loading one model does not block users of another).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spec_locks: Dict[str, threading.Lock] = {}
+        self._backends: Dict[str, LoadedBackend] = {}
+
+    def _spec_lock(self, spec: str) -> threading.Lock:
+        with self._lock:
+            lock = self._spec_locks.get(spec)
+            if lock is None:
+                lock = self._spec_locks[spec] = threading.Lock()
+            return lock
+
+    def get(self, spec: Optional[str] = None) -> LoadedBackend:
+        """Return the loaded backend for spec, loading it on first use."""
+        spec = spec or default_spec()
+        backend = self._backends.get(spec)
+        if backend is not None:
+            return backend
+        with self._spec_lock(spec):
+            backend = self._backends.get(spec)
+            if backend is None:
+                backend = self._load(spec)
+                self._backends[spec] = backend
+        return backend
+
+    def is_loaded(self, spec: Optional[str] = None) -> bool:
+        return (spec or default_spec()) in self._backends
+
+    def _load(self, spec: str) -> LoadedBackend:
+        kind, _, name = spec.partition(":")
+        started = time.perf_counter()
+        rss_before = _process_rss()
+
+        if kind == "openai":
             from openai import OpenAI
             base_url = os.getenv("OPENAI_BASE_URL")
             api_key = os.getenv("PROXYAPI_KEY") or os.getenv("PROXYAPI_API_KEY") or os.getenv("OPENAI_API_KEY")
-            model = os.getenv("TEXT_EMBEDDING_MODEL", "text-embedding-ada-002")
-            _state["openai_client"] = OpenAI(api_key=api_key, base_url=base_url) if api_key else OpenAI()
-            _state["openai_model"] = model
-        else:
-            # HF sentence-transformers backend
-            model_name = os.getenv("HF_MODEL_NAME") or os.getenv("HF_MODEL_PATH") or "sentence-transformers/all-MiniLM-L6-v2"
+            client = OpenAI(api_key=api_key, base_url=base_url) if api_key else OpenAI()
+            backend = LoadedBackend(spec=spec, kind="openai", client=client, model_name=name)
+        elif kind == "hf":
             try:
                 from sentence_transformers import SentenceTransformer
-                _state["hf_model"] = SentenceTransformer(model_name)
-            except Exception:
+                model = SentenceTransformer(name)
+                backend = LoadedBackend(spec=spec, kind="sentence_transformers", model=model, model_name=name)
+            except ImportError:
                 # Fallback to transformers if sentence-transformers not available
                 from transformers import AutoTokenizer, AutoModel
-                import torch
-                tok = AutoTokenizer.from_pretrained(model_name)
-                mdl = AutoModel.from_pretrained(model_name)
-                _state["hf_tokenizer"] = tok
-                _state["hf_model"] = mdl
+                tok = AutoTokenizer.from_pretrained(name)
+                mdl = AutoModel.from_pretrained(name)
+                mdl.eval()
+                backend = LoadedBackend(spec=spec, kind="transformers", model=mdl, tokenizer=tok, model_name=name)
+            backend.memory_bytes = _torch_model_bytes(backend.model)
+        else:
+            raise ValueError(f"Unknown embedding backend spec: {spec}")
+
+        backend.load_time = time.perf_counter() - started
+        rss_after = _process_rss()
+        if rss_before is not None and rss_after is not None:
+            backend.rss_delta_bytes = max(rss_after - rss_before, 0)
+        logger.info(f"✅ Embedding backend {spec} loaded in {backend.load_time:.2f}s")
+        return backend
+
+    def encode(self, texts: Sequence[str], spec: Optional[str] = None) -> List[List[float]]:
+        """Encode texts with the given backend. HF vectors are L2-normalized."""
+        backend = self.get(spec)
+        texts = list(texts)
+        if not texts:
+            return []
+        started = time.perf_counter()
+
+        if backend.kind == "openai":
+            resp = backend.client.embeddings.create(model=backend.model_name, input=texts)
+            out = [d.embedding for d in resp.data]
+        elif backend.kind == "sentence_transformers":
+            mat = backend.model.encode(texts, normalize_embeddings=True)
+            out = [row.tolist() for row in mat]
+        else:
+            out = self._encode_transformers(backend, texts)
+
+        elapsed = time.perf_counter() - started
+        metrics.EMBEDDING_SECONDS.observe(elapsed, spec=backend.spec)
+        with self._lock:
+            backend.calls += 1
+            backend.texts += len(texts)
+            backend.encode_time += elapsed
+        return out
+
+    @staticmethod
+    def _encode_transformers(backend: LoadedBackend, texts: List[str]) -> List[List[float]]:
+        import torch
+        tok = backend.tokenizer
+        mdl = backend.model
+        out: List[List[float]] = []
+        with torch.no_grad():
+            for text in texts:
+                inputs = tok(text, return_tensors='pt', truncation=True, max_length=512)
+                outputs = mdl(**inputs)
+                # mean pooling over token embeddings
+                last_hidden = outputs.last_hidden_state  # (1, seq, hidden)
+                mask = inputs['attention_mask'].unsqueeze(-1)
+                summed = (last_hidden * mask).sum(dim=1)
+                counts = mask.sum(dim=1).clamp(min=1)
+                mean = summed / counts
+                out.append(_l2_normalize(mean[0].cpu().tolist()))
+        return out
+
+    def warmup(self, specs: Optional[Sequence[str]] = None) -> Dict[str, float]:
+        """Load the given backends (retrieval backend by default) and run one encode."""
+        specs = list(specs) if specs else [retrieval_spec()]
+        timings: Dict[str, float] = {}
+        for spec in specs:
+            started = time.perf_counter()
+            try:
+                self.encode(["warmup"], spec)
+                timings[spec] = time.perf_counter() - started
+            except Exception as e:
+                logger.error(f"❌ Прогрев эмбеддингов {spec} не удался: {e}")
+        return timings
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Load time, memory footprint and usage counters per loaded backend."""
+        with self._lock:
+            return {
+                spec: {
+                    "kind": b.kind,
+                    "model": b.model_name,
+                    "load_time": round(b.load_time, 4),
+                    "memory_bytes": b.memory_bytes,
+                    "rss_delta_bytes": b.rss_delta_bytes,
+                    "loaded_at": b.loaded_at,
+                    "calls": b.calls,
+                    "texts": b.texts,
+                    "avg_encode_time": round(b.encode_time / b.calls, 6) if b.calls else 0.0,
+                }
+                for spec, b in self._backends.items()
+            }
+
+
+registry = EmbeddingRegistry()
 
 
 def embed(text: str) -> List[float]:
     """Embed a single text to a vector (list[float])."""
-    _ensure_initialized()
-    backend = _state["backend"]
-
-    if backend == "OPENAI":
-        resp = _state["openai_client"].embeddings.create(model=_state["openai_model"], input=text)
-        return resp.data[0].embedding
-
-    # HF backend
-    if _state.get("hf_tokenizer") is None:
-        # sentence-transformers API
-        vec = _state["hf_model"].encode([text], normalize_embeddings=True)
-        return vec[0].tolist()
-
-    # transformers fallback (no sentence-transformers)
-    import torch
-    tok = _state["hf_tokenizer"]
-    mdl = _state["hf_model"]
-    with torch.no_grad():
-        inputs = tok(text, return_tensors='pt', truncation=True, max_length=512)
-        outputs = mdl(**inputs)
-        # mean pooling over token embeddings
-        last_hidden = outputs.last_hidden_state  # (1, seq, hidden)
-        mask = inputs['attention_mask'].unsqueeze(-1)
-        summed = (last_hidden * mask).sum(dim=1)
-        counts = mask.sum(dim=1).clamp(min=1)
-        mean = summed / counts
-        vec = mean[0].cpu().tolist()
-        # Optionally L2 normalize
-        import math
-        norm = math.sqrt(sum(x*x for x in vec)) or 1.0
-        return [x / norm for x in vec]
+    return registry.encode([text])[0]
 
 
 def embed_texts(texts: List[str]) -> List[List[float]]:
-    _ensure_initialized()
-    backend = _state["backend"]
-
-    if backend == "OPENAI":
-        # Batch embedding for efficiency
-        resp = _state["openai_client"].embeddings.create(model=_state["openai_model"], input=texts)
-        return [d.embedding for d in resp.data]
-
-    if _state.get("hf_tokenizer") is None:
-        mat = _state["hf_model"].encode(texts, normalize_embeddings=True)
-        return [row.tolist() for row in mat]
-
-    import torch
-    tok = _state["hf_tokenizer"]
-    mdl = _state["hf_model"]
-    out: List[List[float]] = []
-    with torch.no_grad():
-        for text in texts:
-            inputs = tok(text, return_tensors='pt', truncation=True, max_length=512)
-            outputs = mdl(**inputs)
-            last_hidden = outputs.last_hidden_state
-            mask = inputs['attention_mask'].unsqueeze(-1)
-            summed = (last_hidden * mask).sum(dim=1)
-            counts = mask.sum(dim=1).clamp(min=1)
-            mean = summed / counts
-            vec = mean[0].cpu().tolist()
-            import math
-            norm = math.sqrt(sum(x*x for x in vec)) or 1.0
-            out.append([x / norm for x in vec])
-    return out
+    return registry.encode(texts)
+
+
+def embed_query(text: str) -> List[float]:
+    """Embed a question for pgvector retrieval (HF backend, 384-dim by default)."""
+    return registry.encode([text], retrieval_spec())[0]
+
+
+def embed_queries(texts: List[str]) -> List[List[float]]:
+    return registry.encode(texts, retrieval_spec())
+
+
+async def aembed_query(text: str) -> List[float]:
+    """embed_query without blocking the event loop."""
+    with tracing.span("embedding", texts=1):
+        return await asyncio.to_thread(embed_query, text)
+
+
+async def aembed_queries(texts: List[str]) -> List[List[float]]:
+    with tracing.span("embedding", texts=len(texts)):
+        return await asyncio.to_thread(embed_queries, texts)
+
+
+def to_vector_literal(vec: Sequence[float]) -> str:
+    """pgvector text literal for use with $1::vector."""
+    return '[' + ','.join(map(str, vec)) + ']'
+
+
+def warmup(specs: Optional[Sequence[str]] = None) -> Dict[str, float]:
+    return registry.warmup(specs)
 
 
+def get_stats() -> Dict[str, Dict[str, Any]]:
+    return registry.stats()
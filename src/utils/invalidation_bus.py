@@ -0,0 +1,253 @@
+"""
+Шина инвалидации кэшей на Postgres LISTEN/NOTIFY
+
+Триггеры (src/tools/invalidation_triggers.sql) отправляют уведомление в канал
+nlsql_invalidation при изменении vanna_vectors (kind=kb) и при DDL в БД
+(kind=schema). Каждый процесс держит одно выделенное соединение с LISTEN и
+вызывает подписчиков: они сбрасывают версию KB, кэш SQL, кэш DDL и каталог
+схемы. Пачка уведомлений (массовый ingest) схлопывается за debounce секунд в
+один вызов на вид. После переподключения подписчики вызываются для всех видов:
+уведомления, пришедшие во время разрыва, потеряны.
+
+Переменные окружения:
+    INVALIDATION_BUS_ENABLED          1 - слушать канал (по умолчанию), 0 - только опрос отпечатка KB
+    INVALIDATION_BUS_CHANNEL          имя канала (по умолчанию nlsql_invalidation)
+    INVALIDATION_BUS_DEBOUNCE         окно схлопывания уведомлений, секунд
+    INVALIDATION_BUS_RECONNECT_DELAY  начальная пауза перед переподключением, секунд
+    INVALIDATION_BUS_PING_INTERVAL    период проверки соединения, секунд
+"""
+
+import os
+import json
+import time
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+import asyncpg
+
+from src.utils.db_pool import DEFAULT_DSN
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = "nlsql_invalidation"
+KINDS = ("kb", "schema")
+
+# Имя триггера на vanna_vectors из src/tools/invalidation_triggers.sql
+KB_TRIGGER_NAME = "vanna_vectors_notify_invalidation"
+MAX_RECONNECT_DELAY = 30.0
+
+Handler = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
+
+async def publish(conn, kind: str, channel: Optional[str] = None, **details):
+    """
+    Отправка уведомления через произвольное соединение asyncpg
+
+    Нужна скриптам, меняющим KB или схему там, где триггеры не установлены
+    (tools/ingest_ddl_from_db.py). Уведомление доставляется после фиксации
+    транзакции соединения.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Неизвестный вид инвалидации: {kind}")
+    payload = json.dumps({"kind": kind, **details}, ensure_ascii=False, default=str)
+    await conn.execute("SELECT pg_notify($1, $2)", channel or os.getenv("INVALIDATION_BUS_CHANNEL", DEFAULT_CHANNEL), payload)
+
+
+def describe_event(event: Dict[str, Any]) -> str:
+    """Краткое описание уведомления для логов"""
+    details = [str(event[key]) for key in ("op", "tag", "table", "source", "reason") if event.get(key)]
+    return f"NOTIFY {event['kind']}" + (f" {' '.join(details)}" if details else "")
+
+
+class InvalidationBus:
+    """
+    Подписка процесса на канал инвалидации
+
+    Соединение LISTEN выделенное, не из пула: оно занято все время работы
+    процесса, а при его разрыве пул не затрагивается.
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str] = None,
+        channel: Optional[str] = None,
+        debounce: Optional[float] = None,
+        reconnect_delay: Optional[float] = None,
+        ping_interval: Optional[float] = None,
+    ):
+        self.dsn = dsn or os.getenv("DATABASE_URL", DEFAULT_DSN)
+        self.channel = channel or os.getenv("INVALIDATION_BUS_CHANNEL", DEFAULT_CHANNEL)
+        self.debounce = debounce if debounce is not None else float(os.getenv("INVALIDATION_BUS_DEBOUNCE", "0.5"))
+        self.reconnect_delay = (
+            reconnect_delay if reconnect_delay is not None
+            else float(os.getenv("INVALIDATION_BUS_RECONNECT_DELAY", "1"))
+        )
+        self.ping_interval = (
+            ping_interval if ping_interval is not None
+            else float(os.getenv("INVALIDATION_BUS_PING_INTERVAL", "15"))
+        )
+
+        self._handlers: Dict[str, List[Handler]] = {kind: [] for kind in KINDS}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._task: Optional[asyncio.Task] = None
+        self._conn = None
+        self._lost: Optional[asyncio.Event] = None
+
+        self.listening = False
+        self.kb_triggers_installed = False
+        self.connects = 0
+        self.connect_errors = 0
+        self.received: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self.dispatched: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self.invalid_payloads = 0
+        self.last_event_at: Optional[float] = None
+
+    @property
+    def kb_push_active(self) -> bool:
+        """Изменения vanna_vectors приходят уведомлениями - опрос отпечатка KB не нужен"""
+        return self.listening and self.kb_triggers_installed
+
+    def subscribe(self, kind: str, handler: Handler):
+        """
+        Подписка на вид инвалидации
+
+        Args:
+            kind: 'kb' или 'schema'
+            handler: Функция (обычная или async), получает payload уведомления
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Неизвестный вид инвалидации: {kind}")
+        self._handlers[kind].append(handler)
+
+    def start(self):
+        """Запуск фонового слушателя в текущем event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+
+    async def _close(self):
+        conn, self._conn = self._conn, None
+        self.listening = False
+        if conn is not None and not conn.is_closed():
+            try:
+                await conn.remove_listener(self.channel, self._on_notify)
+            except Exception:
+                pass
+            await conn.close()
+
+    async def _connect(self):
+        self._lost = asyncio.Event()
+        conn = await asyncpg.connect(self.dsn)
+        try:
+            conn.add_termination_listener(lambda _conn: self._lost.set())
+            await conn.add_listener(self.channel, self._on_notify)
+            self.kb_triggers_installed = await conn.fetchval(
+                "SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = $1 AND NOT tgisinternal)",
+                KB_TRIGGER_NAME,
+            )
+        except Exception:
+            await conn.close()
+            raise
+        self._conn = conn
+        self.listening = True
+        self.connects += 1
+        if not self.kb_triggers_installed:
+            logger.warning(
+                "⚠️ Триггер уведомлений vanna_vectors не установлен (src/tools/invalidation_triggers.sql): "
+                "изменения KB замечаются опросом отпечатка"
+            )
+        logger.info(f"📡 Шина инвалидации слушает канал {self.channel}")
+
+    async def _run(self):
+        delay = self.reconnect_delay
+        first = True
+        while True:
+            try:
+                await self._connect()
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                self.connect_errors += 1
+                logger.warning(f"⚠️ Шина инвалидации: нет соединения ({e}), повтор через {delay:.1f}с")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+            delay = self.reconnect_delay
+            if not first:
+                # Пропущенные во время разрыва уведомления восстановить нельзя
+                for kind in KINDS:
+                    self._pending[kind] = {"kind": kind, "reason": "reconnect"}
+                await self._flush()
+            first = False
+            await self._watch()
+            await self._close()
+            logger.warning("⚠️ Шина инвалидации: соединение потеряно, переподключение")
+
+    async def _watch(self):
+        """Ожидание разрыва соединения; периодический ping ловит обрыв TCP без FIN"""
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), timeout=self.ping_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self._conn.fetchval("SELECT 1", timeout=self.ping_interval)
+            except Exception:
+                return
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str):
+        try:
+            event = json.loads(payload)
+            kind = event["kind"]
+            if kind not in KINDS:
+                raise ValueError(kind)
+        except (ValueError, KeyError, TypeError):
+            self.invalid_payloads += 1
+            logger.warning(f"⚠️ Шина инвалидации: некорректное уведомление {payload!r}")
+            return
+        self.received[kind] += 1
+        self.last_event_at = time.time()
+        self._pending[kind] = event
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.debounce, lambda: asyncio.create_task(self._flush()))
+
+    async def _flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        for kind, event in pending.items():
+            self.dispatched[kind] += 1
+            for handler in self._handlers[kind]:
+                try:
+                    result = handler(event)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"❌ Обработчик инвалидации {kind} завершился ошибкой: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "channel": self.channel,
+            "listening": self.listening,
+            "kb_triggers_installed": self.kb_triggers_installed,
+            "connects": self.connects,
+            "connect_errors": self.connect_errors,
+            "received": dict(self.received),
+            "dispatched": dict(self.dispatched),
+            "invalid_payloads": self.invalid_payloads,
+            "last_event_at": self.last_event_at,
+        }
@@ -0,0 +1,269 @@
+"""
+Метрики в текстовом формате Prometheus (без внешних зависимостей)
+
+Метрики процесса объявлены в конце модуля и отдаются эндпоинтом /metrics.
+"""
+
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Границы бакетов по умолчанию для времени (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+# Размер промпта в символах и токенах
+CHARS_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+TOKENS_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+LabelValues = Tuple[str, ...]
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и убывать"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Гистограмма с накопительными бакетами (le), суммой и количеством"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * len(self.buckets), [0.0, 0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Замер длительности блока (в том числе с await внутри)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), list(totals))) for key, (counts, totals) in self._values.items())
+        lines = []
+        for key, (counts, (total, count)) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {int(count)}")
+        return lines
+
+
+# Сборщик вычисляет значения в момент запроса /metrics (статистика пайплайна, кэшей, пула)
+Collector = Callable[[], List[_Metric]]
+
+
+class Registry:
+    """Набор метрик процесса и сборщиков, вызываемых при экспорте"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister_collector(self, collector: Collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self) -> str:
+        """Экспорт в текстовом формате Prometheus 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка сборщика метрик {collector}: {e}")
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+def single_flight_metrics(flights: Dict[str, "object"]) -> List[_Metric]:
+    """Счетчики SingleFlight (stats()) по имени операции"""
+    in_flight = Gauge("nlsql_single_flight_in_flight", "Выполняемые сейчас операции", ["operation"])
+    calls = Counter("nlsql_single_flight_calls_total", "Вызовы через SingleFlight", ["operation", "result"])
+    for operation, flight in flights.items():
+        stats = flight.stats()
+        in_flight.set(stats["in_flight"], operation=operation)
+        calls.inc(stats["executions"], operation=operation, result="executed")
+        calls.inc(stats["coalesced"], operation=operation, result="coalesced")
+        calls.inc(stats["cancelled"], operation=operation, result="cancelled")
+    return [in_flight, calls]
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry()
+
+# Этапы генерации QueryService: domain, semantic_cache, ddl, rag, payment, schema, docs, prompt, llm
+STAGE_SECONDS = REGISTRY.histogram(
+    "nlsql_stage_duration_seconds", "Длительность этапов генерации SQL", ["stage"]
+)
+EMBEDDING_SECONDS = REGISTRY.histogram(
+    "nlsql_embedding_duration_seconds", "Время вычисления эмбеддингов", ["spec"]
+)
+DB_ACQUIRE_SECONDS = REGISTRY.histogram(
+    "nlsql_db_acquire_wait_seconds", "Ожидание соединения из пула БД"
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "nlsql_llm_duration_seconds", "Время успешной генерации SQL моделью", ["model"]
+)
+PROMPT_CHARS = REGISTRY.histogram(
+    "nlsql_prompt_chars", "Размер промпта в символах", buckets=CHARS_BUCKETS
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "nlsql_prompt_tokens", "Размер промпта в токенах", buckets=TOKENS_BUCKETS
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "nlsql_cache_lookups_total", "Обращения к кэшам SQL", ["cache", "result"]
+)
+CONTEXT_RETRIEVALS = REGISTRY.counter(
+    "nlsql_context_retrievals_total", "Вызовы ретриверов контекста по результату", ["retriever", "status"]
+)
+CONTEXT_SNIPPETS = REGISTRY.counter(
+    "nlsql_context_snippets_total", "Фрагменты контекста по итогу сборки (included/truncated/duplicate/budget)",
+    ["source", "outcome"]
+)
+LLM_INPUT_TOKENS = REGISTRY.counter(
+    "nlsql_llm_input_tokens_total",
+    "Входные токены LLM по usage ответов API (kind=prompt - всего, cached - из кэша промпта провайдера)",
+    ["model", "kind"]
+)
+CUSTOMER_API_SECONDS = REGISTRY.histogram(
+    "nlsql_customer_api_duration_seconds", "Время обращения к API заказчика", ["endpoint", "outcome"]
+)
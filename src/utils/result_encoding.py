@@ -0,0 +1,183 @@
+"""
+Быстрая сериализация результатов запросов
+
+Результат выполнения SQL (десятки тысяч строк) сериализуется целиком одним
+вызовом orjson, без построчной валидации pydantic и jsonable_encoder. Строки
+передаются в одном из форматов:
+
+- rows     - {"data": [{колонка: значение}, ...]} (прежний формат);
+- columnar - {"columns": [...], "rows": [[...], ...]}: имена колонок не
+  повторяются в каждой строке, ответ меньше и собирается быстрее.
+
+Ответ сжимается gzip или brotli по заголовку Accept-Encoding.
+
+orjson и brotli необязательны: без orjson используется json, без brotli - gzip.
+
+Переменные окружения:
+    RESULT_COMPRESS_MIN_BYTES   ответы меньше не сжимаются
+    RESULT_GZIP_LEVEL           уровень gzip (1-9)
+    RESULT_BROTLI_QUALITY       качество brotli (0-11)
+"""
+
+import os
+import gzip
+import json
+import uuid
+import decimal
+import datetime
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость
+    brotli = None
+
+ROWS = "rows"
+COLUMNAR = "columnar"
+FORMATS = (ROWS, COLUMNAR)
+
+JSON_MEDIA_TYPE = "application/json"
+
+COMPRESS_MIN_BYTES = int(os.getenv("RESULT_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("RESULT_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("RESULT_BROTLI_QUALITY", "4"))
+
+
+def _default(value: Any) -> Any:
+    """Типы значений asyncpg, которые не сериализуются напрямую"""
+    if isinstance(value, decimal.Decimal):
+        # Как jsonable_encoder FastAPI: целое для Decimal без дробной части (SUM, COUNT), иначе float
+        if value.is_finite() and value.as_tuple().exponent >= 0:
+            return int(value)
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def dumps(payload: Any) -> bytes:
+    """JSON в байтах (orjson, иначе json)"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, default=_default).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """Разбор JSON ответа (orjson, иначе json)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def to_columnar(columns: Sequence[str], data: Iterable[Any]) -> List[List[Any]]:
+    """Строки в виде списков значений в порядке columns (из dict или asyncpg Record)"""
+    rows = []
+    for row in data:
+        if isinstance(row, dict):
+            rows.append([row.get(column) for column in columns])
+        else:
+            rows.append(list(row))
+    return rows
+
+
+def to_rows(columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    """Обратное преобразование: список словарей колонка → значение"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def result_rows(result: Dict[str, Any]) -> Tuple[List[str], List[List[Any]]]:
+    """Колонки и строки результата API заказчика в любом из форматов"""
+    columns = list(result.get("columns") or [])
+    if "rows" in result:
+        return columns, result["rows"]
+    data = result.get("data") or []
+    if not columns and data:
+        columns = list(data[0].keys())
+    return columns, to_columnar(columns, data)
+
+
+def shape_result(columns: List[str], rows: List[List[Any]], result_format: str) -> Dict[str, Any]:
+    """Поля строк ответа в запрошенном формате"""
+    if result_format == COLUMNAR:
+        return {"format": COLUMNAR, "columns": columns, "rows": rows}
+    return {"data": to_rows(columns, rows), "columns": columns}
+
+
+def _accepted(accept_encoding: str) -> Dict[str, float]:
+    """Кодировки из Accept-Encoding с весами q"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """br, если клиент принимает и brotli установлен, иначе gzip, иначе без сжатия"""
+    accepted = _accepted(accept_encoding or "")
+    wildcard = accepted.get("*", 0.0)
+    candidates = (("br", brotli is not None), ("gzip", True))
+    best, best_q = None, 0.0
+    for name, available in candidates:
+        q = accepted.get(name, wildcard)
+        if available and q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def encode(payload: Any, accept_encoding: Optional[str] = None) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Тело и заголовки ответа: JSON, при необходимости сжатый
+
+    Args:
+        payload: Данные ответа
+        accept_encoding: Заголовок Accept-Encoding запроса
+    """
+    body = dumps(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+def response(payload: Any, accept_encoding: Optional[str] = None, status_code: int = 200):
+    """Ответ Starlette с готовым телом (без повторной сериализации FastAPI)"""
+    from starlette.responses import Response
+
+    body, headers = encode(payload, accept_encoding)
+    return Response(content=body, status_code=status_code, headers=headers, media_type=JSON_MEDIA_TYPE)
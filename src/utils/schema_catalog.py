@@ -0,0 +1,317 @@
+"""
+Каталог схемы БД в памяти процесса
+
+Таблицы, колонки (тип, nullability, default, длина), внешние ключи и комментарии
+загружаются одним запросом к information_schema/pg_catalog вместо запроса на
+каждую таблицу при каждом вопросе. Каталог общий для всех модулей процесса
+(get_schema_catalog), обновляется по расписанию или по требованию; version
+растет при каждом изменении схемы и входит в ключи зависимых кэшей.
+
+Переменные окружения:
+    SCHEMA_CATALOG_SCHEMA            схема БД (по умолчанию public)
+    SCHEMA_CATALOG_REFRESH_INTERVAL  период фонового обновления, секунд (0 - только по требованию)
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from src.utils.db_pool import DatabasePool, acquire_connection, DEFAULT_DSN
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повторной синхронной загрузкой после ошибки (секунд)
+LOAD_RETRY_DELAY = 30.0
+
+# Один запрос: колонки всех таблиц схемы с комментариями и внешними ключами.
+# {schema} заменяется на плейсхолдер драйвера ($1 для asyncpg, %s для psycopg)
+CATALOG_QUERY = """
+SELECT
+    cols.table_name,
+    cols.column_name,
+    cols.data_type,
+    cols.is_nullable,
+    cols.column_default,
+    cols.character_maximum_length,
+    col_dsc.description AS column_comment,
+    tbl_dsc.description AS table_comment,
+    fk.foreign_table,
+    fk.foreign_column
+FROM information_schema.columns cols
+JOIN pg_catalog.pg_namespace ns ON ns.nspname = cols.table_schema
+JOIN pg_catalog.pg_class cls ON cls.relname = cols.table_name AND cls.relnamespace = ns.oid
+JOIN pg_catalog.pg_attribute att ON att.attrelid = cls.oid AND att.attname = cols.column_name
+LEFT JOIN pg_catalog.pg_description col_dsc
+    ON col_dsc.objoid = cls.oid AND col_dsc.classoid = 'pg_catalog.pg_class'::regclass AND col_dsc.objsubid = att.attnum
+LEFT JOIN pg_catalog.pg_description tbl_dsc
+    ON tbl_dsc.objoid = cls.oid AND tbl_dsc.classoid = 'pg_catalog.pg_class'::regclass AND tbl_dsc.objsubid = 0
+LEFT JOIN LATERAL (
+    SELECT ref.relname AS foreign_table, ref_att.attname AS foreign_column
+    FROM pg_catalog.pg_constraint con
+    JOIN pg_catalog.pg_class ref ON ref.oid = con.confrelid
+    JOIN pg_catalog.pg_attribute ref_att
+        ON ref_att.attrelid = con.confrelid
+        AND ref_att.attnum = con.confkey[array_position(con.conkey, att.attnum)]
+    WHERE con.contype = 'f' AND con.conrelid = cls.oid AND att.attnum = ANY(con.conkey)
+    LIMIT 1
+) fk ON TRUE
+WHERE cols.table_schema = {schema}
+ORDER BY cols.table_name, cols.ordinal_position
+"""
+
+
+@dataclass
+class ColumnInfo:
+    name: str
+    data_type: str
+    nullable: bool = True
+    default: Optional[str] = None
+    max_length: Optional[int] = None
+    comment: Optional[str] = None
+    foreign_table: Optional[str] = None
+    foreign_column: Optional[str] = None
+
+
+@dataclass
+class TableInfo:
+    name: str
+    columns: List[ColumnInfo] = field(default_factory=list)
+    comment: Optional[str] = None
+
+    @property
+    def column_names(self) -> List[str]:
+        return [column.name for column in self.columns]
+
+    @property
+    def foreign_keys(self) -> List[ColumnInfo]:
+        return [column for column in self.columns if column.foreign_table]
+
+
+class SchemaCatalog:
+    """
+    Снимок схемы БД, разделяемый всеми модулями процесса
+
+    Асинхронная загрузка (aload) идет через общий пул asyncpg, синхронная
+    (load) - через переданное DB-API соединение (psycopg/psycopg2 агентов Vanna).
+    """
+
+    def __init__(self, dsn: Optional[str] = None, schema: Optional[str] = None,
+                 refresh_interval: Optional[float] = None):
+        self.dsn = dsn or os.getenv("DATABASE_URL", DEFAULT_DSN)
+        self.schema = schema or os.getenv("SCHEMA_CATALOG_SCHEMA", "public")
+        self.refresh_interval = (
+            refresh_interval if refresh_interval is not None
+            else float(os.getenv("SCHEMA_CATALOG_REFRESH_INTERVAL", "300"))
+        )
+
+        self._tables: Dict[str, TableInfo] = {}
+        self._fingerprint: Optional[str] = None
+        self._lock = threading.Lock()
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self.loads = 0
+        self.load_errors = 0
+        self.last_load_seconds = 0.0
+        self._stale = True
+        self._retry_at = 0.0
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.loaded_at is not None
+
+    def _apply(self, rows: Iterable[Sequence[Any]], started: float) -> bool:
+        """Сборка таблиц из строк запроса; True, если схема изменилась"""
+        tables: Dict[str, TableInfo] = {}
+        digest = hashlib.sha1()
+        for row in rows:
+            (table_name, column_name, data_type, is_nullable, default,
+             max_length, column_comment, table_comment, foreign_table, foreign_column) = tuple(row)
+            digest.update(repr(tuple(row)).encode("utf-8"))
+            table = tables.get(table_name)
+            if table is None:
+                table = tables[table_name] = TableInfo(name=table_name, comment=table_comment)
+            table.columns.append(ColumnInfo(
+                name=column_name,
+                data_type=data_type,
+                nullable=is_nullable != "NO",
+                default=default,
+                max_length=max_length,
+                comment=column_comment,
+                foreign_table=foreign_table,
+                foreign_column=foreign_column,
+            ))
+
+        fingerprint = digest.hexdigest()
+        with self._lock:
+            changed = fingerprint != self._fingerprint
+            if changed:
+                self._tables = tables
+                self._fingerprint = fingerprint
+                self.version += 1
+            self.loaded_at = time.time()
+            self.loads += 1
+            self.last_load_seconds = round(time.perf_counter() - started, 4)
+            self._stale = False
+        if changed:
+            logger.info(
+                f"📚 Каталог схемы {self.schema} загружен: {len(tables)} таблиц, "
+                f"версия {self.version}, {self.last_load_seconds}с"
+            )
+        return changed
+
+    async def aload(self, db_pool: Optional[DatabasePool] = None) -> bool:
+        """Загрузка через пул asyncpg (или разовое соединение)"""
+        started = time.perf_counter()
+        try:
+            async with acquire_connection(db_pool, self.dsn) as conn:
+                rows = await conn.fetch(CATALOG_QUERY.format(schema="$1"), self.schema)
+        except Exception:
+            self.load_errors += 1
+            raise
+        return self._apply(rows, started)
+
+    def load(self, conn=None) -> bool:
+        """
+        Синхронная загрузка через DB-API соединение
+
+        Args:
+            conn: Соединение psycopg/psycopg2; без него открывается разовое
+        """
+        started = time.perf_counter()
+        own_conn = conn is None
+        try:
+            if own_conn:
+                conn = _connect(self.dsn)
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(CATALOG_QUERY.format(schema="%s"), (self.schema,))
+                    rows = cur.fetchall()
+            finally:
+                # Не оставляем чужое соединение в открытой транзакции
+                if not own_conn and getattr(conn, "autocommit", True) is False:
+                    conn.rollback()
+        except Exception:
+            self.load_errors += 1
+            raise
+        finally:
+            if own_conn and conn is not None:
+                conn.close()
+        return self._apply(rows, started)
+
+    def ensure_loaded(self, conn=None):
+        """Загрузка при первом обращении или после invalidate() (для синхронных модулей)"""
+        if not self._stale or time.monotonic() < self._retry_at:
+            return
+        with _load_lock:
+            if not self._stale:
+                return
+            try:
+                self.load(conn)
+            except Exception as e:
+                # До повтора используется прежний снимок (если он есть)
+                self._retry_at = time.monotonic() + LOAD_RETRY_DELAY
+                logger.error(f"❌ Не удалось загрузить каталог схемы: {e}")
+
+    def invalidate(self, reason: str = ""):
+        """Пометить каталог устаревшим: следующее обращение перезагрузит его"""
+        self._stale = True
+        logger.info(f"♻️ Каталог схемы помечен устаревшим{f' ({reason})' if reason else ''}")
+
+    async def run_refresh_loop(self, db_pool: Optional[DatabasePool] = None):
+        """Фоновое обновление раз в refresh_interval (и сразу после invalidate)"""
+        if self.refresh_interval <= 0:
+            return
+        next_refresh = time.monotonic() + self.refresh_interval
+        while True:
+            await asyncio.sleep(min(1.0, self.refresh_interval))
+            if not self._stale and time.monotonic() < next_refresh:
+                continue
+            try:
+                await self.aload(db_pool)
+            except Exception as e:
+                logger.warning(f"⚠️ Обновление каталога схемы не удалось: {e}")
+            next_refresh = time.monotonic() + self.refresh_interval
+
+    def table(self, name: str) -> Optional[TableInfo]:
+        with self._lock:
+            return self._tables.get(name)
+
+    def tables(self) -> List[str]:
+        with self._lock:
+            return sorted(self._tables)
+
+    def describe_table(self, name: str, include_lengths: bool = True, include_relations: bool = True) -> Optional[str]:
+        """
+        Текстовое описание таблицы для контекста LLM
+
+        Формат: "Таблица X:", список колонок, затем строка на колонку с типом и
+        длиной, NOT NULL, внешним ключом и комментарием.
+        """
+        table = self.table(name)
+        if table is None or not table.columns:
+            return None
+        header = f"Таблица {name}:"
+        if include_relations and table.comment:
+            header += f" -- {table.comment}"
+        lines = [header, f"Колонки: {', '.join(table.column_names)}"]
+        for column in table.columns:
+            line = f"- {column.name}: {column.data_type}"
+            if include_lengths and column.max_length:
+                line += f"({column.max_length})"
+            if not column.nullable:
+                line += " (NOT NULL)"
+            if include_relations and column.foreign_table:
+                line += f" -> {column.foreign_table}.{column.foreign_column}"
+            if include_relations and column.comment:
+                line += f" -- {column.comment}"
+            lines.append(line)
+        return "\n".join(lines) + "\n"
+
+    def describe_tables(self, names: Iterable[str], **kwargs) -> List[str]:
+        """Описания таблиц в заданном порядке (отсутствующие в схеме пропускаются)"""
+        descriptions = (self.describe_table(name, **kwargs) for name in names)
+        return [description for description in descriptions if description]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "schema": self.schema,
+                "version": self.version,
+                "tables": len(self._tables),
+                "columns": sum(len(table.columns) for table in self._tables.values()),
+                "loaded_at": self.loaded_at,
+                "stale": self._stale,
+                "loads": self.loads,
+                "load_errors": self.load_errors,
+                "last_load_seconds": self.last_load_seconds,
+                "refresh_interval": self.refresh_interval,
+            }
+
+
+def _connect(dsn: str):
+    try:
+        import psycopg
+        return psycopg.connect(dsn)
+    except ImportError:
+        import psycopg2
+        return psycopg2.connect(dsn)
+
+
+_load_lock = threading.Lock()
+_catalog: Optional[SchemaCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_schema_catalog() -> SchemaCatalog:
+    """Каталог схемы процесса (создается при первом обращении)"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = SchemaCatalog()
+    return _catalog
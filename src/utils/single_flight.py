@@ -0,0 +1,109 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight)
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Одновременные вызовы с одинаковым ключом ждут одну общую задачу
+
+    - Ошибка задачи передается всем ожидающим, следующий вызов начинает заново.
+    - Отмена одного ожидающего не отменяет общую задачу (asyncio.shield);
+      задача отменяется, только когда ее перестали ждать все.
+    - Ключ живет только пока задача выполняется: это не кэш результатов.
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._calls: Dict[Tuple[int, Hashable], _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def _forget(self, key: Tuple[int, Hashable], call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _on_done(self, key: Tuple[int, Hashable], call: _Call, task: asyncio.Future):
+        self._forget(key, call)
+        # Ошибку уже получили ожидающие; без них помечаем ее обработанной
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполнение fn() либо присоединение к уже идущему вызову с тем же ключом
+
+        Args:
+            key: Ключ объединения
+            fn: Фабрика корутины, вызывается только ведущим запросом
+
+        Returns:
+            Результат общей задачи
+        """
+        # Задачи привязаны к event loop, поэтому ключи разных loop не смешиваются
+        loop_key = (id(asyncio.get_running_loop()), key)
+        call = self._calls.get(loop_key)
+        if call is None or call.task.done():
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[loop_key] = call
+            call.task.add_done_callback(lambda t, k=loop_key, c=call: self._on_done(k, c, t))
+            with self._lock:
+                self.executions += 1
+        else:
+            with self._lock:
+                self.coalesced += 1
+            logger.debug(f"🔗 {self.name}: запрос присоединен к выполняющемуся")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # Последний ожидающий ушел - результат больше никому не нужен
+                self._forget(loop_key, call)
+                call.task.cancel()
+                with self._lock:
+                    self.cancelled += 1
+            raise
+        finally:
+            call.waiters -= 1
+
+    def forget(self, key: Optional[Hashable] = None):
+        """
+        Следующий вызов с ключом (или любой, если ключ не задан) начнет новую задачу
+
+        Уже идущая задача не отменяется: ее результат получат те, кто ее ждет.
+        """
+        for loop_key in list(self._calls):
+            if key is None or loop_key[1] == key:
+                self._calls.pop(loop_key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.executions + self.coalesced
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0,
+                "cancelled": self.cancelled,
+            }
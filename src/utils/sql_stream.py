@@ -0,0 +1,80 @@
+"""
+Утилиты потоковой генерации SQL: поиск завершенного запроса и формат SSE
+"""
+
+import json
+import re
+from typing import Any, Dict, Optional
+
+_FENCE_RE = re.compile(r"```(?:sql|postgresql|postgres)?[ \t]*\n?", re.IGNORECASE)
+_STATEMENT_START_RE = re.compile(r"^[ \t]*(select|with)\b", re.IGNORECASE | re.MULTILINE)
+
+
+def _scan_statement_end(text: str, start: int, fence_end: bool) -> Optional[int]:
+    """
+    Позиция конца запроса: ';' вне строк и комментариев либо закрывающий ```
+
+    Returns:
+        Optional[int]: Индекс символа-терминатора или None, если запрос еще не завершен
+    """
+    i = start
+    n = len(text)
+    quote = None
+    while i < n:
+        ch = text[i]
+        if quote:
+            if ch == quote:
+                # '' и "" внутри строки - экранированная кавычка
+                if i + 1 < n and text[i + 1] == quote:
+                    i += 2
+                    continue
+                quote = None
+        elif ch in ("'", '"'):
+            quote = ch
+        elif text.startswith("--", i):
+            newline = text.find("\n", i)
+            if newline == -1:
+                return None
+            i = newline
+        elif text.startswith("/*", i):
+            close = text.find("*/", i + 2)
+            if close == -1:
+                return None
+            i = close + 1
+        elif ch == ";":
+            return i
+        elif fence_end and text.startswith("```", i):
+            return i
+        i += 1
+    return None
+
+
+def find_complete_statement(text: str) -> Optional[str]:
+    """
+    Первый завершенный SQL запрос в частичном ответе LLM
+
+    Запрос в блоке ```sql завершается ';' или закрывающим ```, запрос без
+    блока кода - начинается с SELECT/WITH в начале строки и завершается ';'.
+
+    Returns:
+        Optional[str]: Текст запроса без терминатора или None
+    """
+    fence = _FENCE_RE.search(text)
+    if fence:
+        start, fence_end = fence.end(), True
+    else:
+        match = _STATEMENT_START_RE.search(text)
+        if not match:
+            return None
+        start, fence_end = match.start(1), False
+    end = _scan_statement_end(text, start, fence_end)
+    if end is None:
+        return None
+    statement = text[start:end].strip()
+    return statement or None
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Сообщение Server-Sent Events с JSON-данными"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
@@ -0,0 +1,77 @@
+"""
+Подсчет токенов промпта
+
+С установленным tiktoken (pip install tiktoken) - точный подсчет для моделей
+OpenAI, без него - оценка по числу символов (для русского текста ~3 символа на
+токен). Какой подсчет используется - stats(), он виден в /health (details.tokenizer)
+и в отчете сборщика контекста (exact_tokens).
+"""
+
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from src.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # необязательная зависимость
+    tiktoken = None
+
+CHARS_PER_TOKEN = 3.0
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # Модели Ollama и неизвестные имена - базовая кодировка GPT-4o
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"⚠️ tiktoken недоступен: {e}")
+            return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Количество токенов текста (точное с tiktoken, иначе оценка)"""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+
+def is_exact() -> bool:
+    """Подсчет точный (установлен tiktoken)"""
+    return tiktoken is not None
+
+
+def stats() -> Dict[str, Any]:
+    """Способ подсчета токенов: бюджеты контекста точны только с tiktoken"""
+    if is_exact():
+        return {"exact": True, "method": "tiktoken"}
+    return {"exact": False, "method": "estimate", "chars_per_token": CHARS_PER_TOKEN}
+
+
+def record_usage(model: str, usage: Any) -> Dict[str, int]:
+    """
+    Учет usage ответа OpenAI-совместимого API: входные и закэшированные токены
+
+    cached_tokens отдает OpenAI (prompt_tokens_details); совместимый API Ollama
+    его не сообщает, для него растет только kind=prompt.
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+    if prompt_tokens:
+        metrics.LLM_INPUT_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+        metrics.LLM_INPUT_TOKENS.inc(cached_tokens, model=model, kind="cached")
+        logger.info(f"🧾 {model}: входных токенов {prompt_tokens}, из кэша промпта {cached_tokens}")
+    return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens}
@@ -0,0 +1,391 @@
+"""
+Распределенная трассировка UI → core API → API заказчика (без внешних зависимостей)
+
+Контекст передается заголовком W3C traceparent, текущий span хранится в
+contextvars (наследуется задачами asyncio и asyncio.to_thread). Завершенные
+span'ы пишутся фоновым потоком в JSONL файл или в OTLP/HTTP коллектор (JSON).
+
+Переменные окружения:
+    TRACING_EXPORTER       none | file | otlp (по умолчанию none - только проброс контекста)
+    TRACING_FILE           путь JSONL файла для exporter=file
+    TRACING_OTLP_ENDPOINT  адрес коллектора для exporter=otlp
+    TRACING_SAMPLE_RATIO   доля трасс, начатых в этом процессе, которые экспортируются
+    TRACING_EXCLUDE_PATHS  пути HTTP без server span'ов (через запятую)
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT = "traceparent"
+
+# Коды SpanKind и StatusCode из OTLP
+_KIND_CODES = {"internal": 1, "server": 2, "client": 3}
+_STATUS_UNSET, _STATUS_OK, _STATUS_ERROR = 0, 1, 2
+
+
+@dataclass(frozen=True)
+class SpanContext:
+    """Идентификаторы span'а, передаваемые между процессами"""
+    trace_id: str
+    span_id: str
+    sampled: bool = True
+
+
+@dataclass
+class Span:
+    name: str
+    context: SpanContext
+    parent_id: Optional[str] = None
+    kind: str = "internal"
+    service: str = ""
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: int = _STATUS_UNSET
+    status_message: str = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = _STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"[:500]
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": self.service,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": {_STATUS_UNSET: "unset", _STATUS_OK: "ok", _STATUS_ERROR: "error"}[self.status],
+            "status_message": self.status_message or None,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("nlsql_current_span", default=None)
+_service_name = os.getenv("TRACING_SERVICE_NAME", "nlsql")
+_sample_ratio = float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))
+
+
+def _new_id(n_bytes: int) -> str:
+    value = random.getrandbits(n_bytes * 8)
+    return f"{value or 1:0{n_bytes * 2}x}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """Разбор заголовка traceparent: 00-<trace_id>-<span_id>-<flags>"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 0x01)
+    except ValueError:
+        return None
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id.lower(), span_id.lower(), sampled)
+
+
+def format_traceparent(context: SpanContext) -> str:
+    return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.context.trace_id if span is not None else None
+
+
+def inject_headers(headers: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Заголовки исходящего запроса с контекстом текущего span'а
+
+    Args:
+        headers: Уже подготовленные заголовки (дополняются)
+    """
+    headers = dict(headers or {})
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT] = format_traceparent(span.context)
+    return headers
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", parent: Optional[SpanContext] = None, **attributes) -> Iterator[Span]:
+    """
+    Span вокруг блока кода (в том числе с await внутри)
+
+    Args:
+        name: Имя операции
+        kind: internal | server | client
+        parent: Удаленный родитель (из traceparent); по умолчанию - текущий span
+        **attributes: Атрибуты span'а
+    """
+    if parent is None:
+        current = _current_span.get()
+        parent = current.context if current is not None else None
+    if parent is not None:
+        context = SpanContext(parent.trace_id, _new_id(8), parent.sampled)
+    else:
+        context = SpanContext(_new_id(16), _new_id(8), random.random() < _sample_ratio)
+
+    current = Span(
+        name=name,
+        context=context,
+        parent_id=parent.span_id if parent is not None else None,
+        kind=kind,
+        service=_service_name,
+        start_ns=time.time_ns(),
+        attributes=dict(attributes),
+    )
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        if context.sampled:
+            _processor.submit(current)
+
+
+class FileExporter:
+    """Span'ы построчно в JSONL файл"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for item in spans:
+                f.write(json.dumps(item.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPHTTPExporter:
+    """Span'ы в коллектор OpenTelemetry по OTLP/HTTP в JSON кодировке"""
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        by_service: Dict[str, List[Dict[str, Any]]] = {}
+        for item in spans:
+            by_service.setdefault(item.service, []).append({
+                "traceId": item.context.trace_id,
+                "spanId": item.context.span_id,
+                "parentSpanId": item.parent_id or "",
+                "name": item.name,
+                "kind": _KIND_CODES.get(item.kind, 1),
+                "startTimeUnixNano": str(item.start_ns),
+                "endTimeUnixNano": str(item.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in item.attributes.items()],
+                "status": {"code": item.status, "message": item.status_message},
+            })
+        return {"resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "nlsql"}, "spans": otlp_spans}],
+            }
+            for service, otlp_spans in by_service.items()
+        ]}
+
+    def export(self, spans: List[Span]):
+        import httpx
+
+        response = httpx.post(self.endpoint, json=self._payload(spans), timeout=self.timeout)
+        response.raise_for_status()
+
+
+class _BatchProcessor:
+    """
+    Очередь завершенных span'ов и фоновый поток экспорта
+
+    Запросы не ждут экспортера: при переполнении очереди span'ы отбрасываются.
+    """
+
+    def __init__(self, max_queue: int = 2048, max_batch: int = 256, interval: float = 2.0):
+        self.exporter = None
+        self.max_batch = max_batch
+        self.interval = interval
+        self.dropped = 0
+        self.exported = 0
+        self.failed = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def configure(self, exporter):
+        self.exporter = exporter
+
+    def submit(self, item: Span):
+        if self.exporter is None:
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name="tracing-exporter", daemon=True)
+                    self._thread.start()
+
+    def _drain(self, first: Optional[Span] = None) -> List[Span]:
+        batch = [first] if first is not None else []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[Span]):
+        if not batch or self.exporter is None:
+            return
+        try:
+            self.exporter.export(batch)
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"⚠️ Не удалось экспортировать {len(batch)} span'ов: {e}")
+
+    def _worker(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+            self._export(self._drain(first))
+
+    def flush(self):
+        while not self._queue.empty():
+            self._export(self._drain())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "exporter": type(self.exporter).__name__ if self.exporter is not None else None,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+_processor = _BatchProcessor()
+atexit.register(_processor.flush)
+
+
+def configure(service_name: Optional[str] = None):
+    """
+    Имя сервиса процесса и экспортер из переменных окружения
+
+    Args:
+        service_name: Имя сервиса в span'ах (если не задано TRACING_SERVICE_NAME)
+    """
+    global _service_name
+    _service_name = os.getenv("TRACING_SERVICE_NAME") or service_name or _service_name
+
+    exporter_name = os.getenv("TRACING_EXPORTER", "none").lower()
+    if exporter_name == "file":
+        _processor.configure(FileExporter(os.getenv("TRACING_FILE", "logs/traces.jsonl")))
+    elif exporter_name == "otlp":
+        _processor.configure(OTLPHTTPExporter(os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")))
+    else:
+        _processor.configure(None)
+    logger.info(f"🧵 Трассировка {_service_name}: exporter={exporter_name}")
+
+
+def get_stats() -> Dict[str, Any]:
+    return {"service": _service_name, **_processor.stats()}
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware: server span на каждый HTTP запрос с родителем из traceparent
+
+    Реализован на уровне ASGI, чтобы span покрывал и потоковые ответы
+    (SSE, NDJSON) целиком. В ответ добавляется заголовок X-Trace-Id.
+    """
+
+    def __init__(self, app, service_name: str):
+        self.app = app
+        configure(service_name)
+        self.exclude_paths = {
+            path.strip()
+            for path in os.getenv("TRACING_EXCLUDE_PATHS", "/health,/metrics").split(",")
+            if path.strip()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        parent = parse_traceparent(headers.get(TRACEPARENT))
+        method = scope.get("method", "GET")
+        path = scope.get("path", "")
+
+        with span(f"{method} {path}", kind="server", parent=parent,
+                  **{"http.method": method, "http.target": path}) as server_span:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    status = message.get("status", 200)
+                    server_span.set_attribute("http.status_code", status)
+                    if status >= 500:
+                        server_span.status = _STATUS_ERROR
+                    message = {
+                        **message,
+                        "headers": list(message.get("headers", [])) + [
+                            (b"x-trace-id", server_span.context.trace_id.encode("latin-1"))
+                        ],
+                    }
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
@@ -7,7 +7,13 @@
 import os
 import logging
 import time
-from typing import Optional, Dict, Any, List
+import asyncio
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from typing import Optional, Dict, Any, List, AsyncIterator, Callable, Union
 from pathlib import Path
 import sys
 
@@ -16,9 +22,19 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from src.vanna.vanna_pgvector_native import DocStructureVannaNative
 from src.vanna.vanna_fixed_context import DocStructureVannaFixed
+from src.utils.circuit_breaker import CircuitBreaker, OPEN, HALF_OPEN, is_fatal_error
+from src.utils import metrics, tracing
+from src.utils.schema_catalog import get_schema_catalog
 
 logger = logging.getLogger(__name__)
 
+# Признак завершения рабочего потока в очереди событий astream_sql
+_STREAM_DONE = object()
+
+# Вопрос для всех моделей или промпты по моделям (контекст в бюджете каждой модели)
+Prompt = Union[str, Dict[str, str]]
+
+
 class OptimizedDualPipeline:
     """
     Оптимизированный двухмодельный пайплайн
@@ -96,10 +112,54 @@ class OptimizedDualPipeline:
         
         # Статистика использования
         self.usage_stats = {
-            'gpt4': {'calls': 0, 'success': 0, 'errors': 0, 'total_time': 0},
-            'ollama': {'calls': 0, 'success': 0, 'errors': 0, 'total_time': 0},
-            'sqlcoder': {'calls': 0, 'success': 0, 'errors': 0, 'total_time': 0}
+            model_name: {'calls': 0, 'success': 0, 'errors': 0, 'total_time': 0,
+                         'races': 0, 'wins': 0, 'hedged': 0, 'cancelled': 0}
+            for model_name in ('gpt4', 'ollama', 'sqlcoder')
         }
+        # Последние времена успешных генераций - основа задержки хеджирования (p95)
+        self._latency_samples = {model_name: deque(maxlen=200) for model_name in self.usage_stats}
+        self._stats_lock = threading.Lock()
+        self._agent_lock = threading.Lock()
+        
+        # Лимиты одновременных вызовов на модель (блокирующие HTTP/DB вызовы идут в пул потоков)
+        self.max_concurrency = {
+            'gpt4': int(os.getenv('LLM_MAX_CONCURRENCY_GPT4', '8')),
+            'sqlcoder': int(os.getenv('LLM_MAX_CONCURRENCY_SQLCODER', '2')),
+            'ollama': int(os.getenv('LLM_MAX_CONCURRENCY_OLLAMA', '2'))
+        }
+        self.max_concurrency.update(config.get('max_concurrency', {}))
+        executor_workers = int(os.getenv('LLM_EXECUTOR_WORKERS', '0')) or sum(self.max_concurrency.values())
+        self._executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix='llm')
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        
+        # Хеджирование: если модель не ответила за p95 своего времени, параллельно
+        # запускается следующая, берется первый валидный SQL
+        hedging = config.get('hedging', {})
+        self.hedging_enabled = hedging.get('enabled', os.getenv('LLM_HEDGING', 'true').lower() in ('1', 'true', 'yes'))
+        self.hedge_default_delay = float(hedging.get('default_delay', os.getenv('LLM_HEDGE_DEFAULT_DELAY', '8')))
+        self.hedge_min_delay = float(hedging.get('min_delay', os.getenv('LLM_HEDGE_MIN_DELAY', '1')))
+        self.hedge_quantile = float(hedging.get('quantile', os.getenv('LLM_HEDGE_QUANTILE', '0.95')))
+        self.hedge_min_samples = int(hedging.get('min_samples', os.getenv('LLM_HEDGE_MIN_SAMPLES', '20')))
+        
+        # Circuit breaker на модель: ошибки и медленные вызовы размыкают цепь,
+        # разомкнутая модель пропускается без ожидания таймаута
+        breaker = config.get('circuit_breaker', {})
+        slow_call = float(breaker.get('slow_call_threshold', os.getenv('LLM_BREAKER_SLOW_CALL', '25')))
+        self.breakers = {
+            model_name: CircuitBreaker(
+                model_name,
+                failure_threshold=int(breaker.get('failure_threshold', os.getenv('LLM_BREAKER_FAILURES', '3'))),
+                recovery_timeout=float(breaker.get('recovery_timeout', os.getenv('LLM_BREAKER_RECOVERY', '30'))),
+                slow_call_threshold=slow_call or None
+            )
+            for model_name in self.usage_stats
+        }
+        
+        # Легкие пробы доступности провайдеров (без генерации), кэшируются на probe_ttl
+        self.probe_ttl = float(config.get('probe_ttl', os.getenv('LLM_PROBE_TTL', '30')))
+        self.probe_timeout = float(config.get('probe_timeout', os.getenv('LLM_PROBE_TIMEOUT', '3')))
+        self._probe_cache: Dict[str, Dict[str, Any]] = {}
+        self._probe_lock = threading.Lock()
         
         logger.info("✅ OptimizedDualPipeline инициализирован")
     
@@ -107,8 +167,10 @@ class OptimizedDualPipeline:
         """Инициализация GPT-4o агента"""
         try:
             if self.gpt4_agent is None:
-                self.gpt4_agent = DocStructureVannaNative(self.gpt4_config)
-                logger.info("✅ GPT-4o агент инициализирован")
+                with self._agent_lock:
+                    if self.gpt4_agent is None:
+                        self.gpt4_agent = DocStructureVannaNative(self.gpt4_config)
+                        logger.info("✅ GPT-4o агент инициализирован")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации GPT-4o: {e}")
@@ -118,8 +180,10 @@ class OptimizedDualPipeline:
         """Инициализация Ollama агента"""
         try:
             if self.ollama_agent is None:
-                self.ollama_agent = DocStructureVannaNative(self.ollama_config)
-                logger.info("✅ Ollama агент инициализирован")
+                with self._agent_lock:
+                    if self.ollama_agent is None:
+                        self.ollama_agent = DocStructureVannaNative(self.ollama_config)
+                        logger.info("✅ Ollama агент инициализирован")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации Ollama: {e}")
@@ -129,8 +193,10 @@ class OptimizedDualPipeline:
         """Инициализация SQLCoder агента"""
         try:
             if self.sqlcoder_agent is None:
-                self.sqlcoder_agent = DocStructureVannaNative(self.sqlcoder_config)
-                logger.info("✅ SQLCoder агент инициализирован")
+                with self._agent_lock:
+                    if self.sqlcoder_agent is None:
+                        self.sqlcoder_agent = DocStructureVannaNative(self.sqlcoder_config)
+                        logger.info("✅ SQLCoder агент инициализирован")
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации SQLCoder: {e}")
@@ -150,37 +216,10 @@ class OptimizedDualPipeline:
         try:
             context_parts = []
             
-            # 1. Получаем DDL для приоритетных бизнес-таблиц
-            for table in self.priority_tables:
-                try:
-                    ddl_query = f"""
-                    SELECT 
-                        table_name, column_name, data_type, is_nullable, 
-                        column_default, character_maximum_length
-                    FROM information_schema.columns 
-                    WHERE table_name = '{table}' AND table_schema = 'public'
-                    ORDER BY ordinal_position
-                    """
-                    
-                    df = agent.run_sql(ddl_query)
-                    
-                    if not df.empty:
-                        table_ddl = f"Таблица {table}:\n"
-                        table_ddl += f"Колонки: {', '.join(df['column_name'].tolist())}\n"
-                        
-                        for _, row in df.iterrows():
-                            col_info = f"- {row['column_name']}: {row['data_type']}"
-                            if row['is_nullable'] == 'NO':
-                                col_info += " (NOT NULL)"
-                            if row['character_maximum_length']:
-                                col_info += f"({row['character_maximum_length']})"
-                            table_ddl += col_info + "\n"
-                        
-                        context_parts.append(table_ddl)
-                        
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось получить DDL для {table}: {e}")
-                    continue
+            # 1. DDL приоритетных бизнес-таблиц из каталога схемы (без запросов на каждую таблицу)
+            catalog = get_schema_catalog()
+            catalog.ensure_loaded(getattr(agent, 'conn', None))
+            context_parts.extend(catalog.describe_tables(self.priority_tables))
             
             # 2. Получаем связанную документацию
             try:
@@ -208,20 +247,26 @@ class OptimizedDualPipeline:
             logger.error(f"❌ Ошибка получения оптимизированного контекста: {e}")
             return ""
     
-    def _generate_sql_with_optimized_context(self, question: str, agent: DocStructureVannaNative) -> str:
+    def _generate_sql_with_optimized_context(self, question: str, agent: DocStructureVannaNative,
+                                             retrieve_context: bool = True) -> str:
         """
         Генерация SQL с оптимизированным контекстом
         
         Args:
             question: Вопрос
             agent: Агент для генерации
+            retrieve_context: False - контекст уже собран в вопросе, агент свой не добавляет
             
         Returns:
             str: Сгенерированный SQL
+            
+        Raises:
+            Exception: Ошибка провайдера передается как есть - circuit breaker
+                размыкает цепь сразу по ее status_code (401/403)
         """
         try:
             # Используем стандартный метод Vanna AI (контекст уже оптимизирован в get_related_ddl)
-            response = agent.generate_sql(question)
+            response = agent.generate_sql(question, retrieve_context=retrieve_context)
             
             # Post-process SQL to fix PostgreSQL dialect issues
             response = self._clean_sql(response)
@@ -230,7 +275,7 @@ class OptimizedDualPipeline:
             
         except Exception as e:
             logger.error(f"❌ Ошибка генерации SQL с оптимизированным контекстом: {e}")
-            return f"Ошибка генерации SQL: {e}"
+            raise
     
     def _clean_sql(self, sql: str) -> str:
         """
@@ -256,7 +301,129 @@ class OptimizedDualPipeline:
             
         return sql
     
-    def generate_sql(self, question: str, prefer_model: str = 'auto', timeout: int = 30) -> Dict[str, Any]:
+    @staticmethod
+    def prompt_for(question: Prompt, model_name: str) -> str:
+        """
+        Промпт для модели
+        
+        question - одна строка для всех моделей или словарь модель → промпт
+        (контекст собран в бюджет токенов каждой модели); модели без своего
+        промпта получают первый из словаря.
+        """
+        if isinstance(question, dict):
+            return question.get(model_name) or next(iter(question.values()))
+        return question
+    
+    def _models_order(self, prefer_model: str) -> List[str]:
+        """Порядок перебора моделей для предпочитаемой модели"""
+        if prefer_model == 'gpt4':
+            return ['gpt4', 'sqlcoder', 'ollama']
+        elif prefer_model == 'ollama':
+            return ['ollama', 'sqlcoder', 'gpt4']
+        elif prefer_model == 'sqlcoder':
+            return ['sqlcoder', 'gpt4', 'ollama']
+        return ['gpt4', 'sqlcoder', 'ollama']  # auto: GPT-4o по умолчанию
+    
+    def _get_agent(self, model_name: str) -> Optional[DocStructureVannaNative]:
+        """Ленивая инициализация и получение агента модели"""
+        if model_name == 'gpt4':
+            return self.gpt4_agent if self._init_gpt4_agent() else None
+        elif model_name == 'sqlcoder':
+            return self.sqlcoder_agent if self._init_sqlcoder_agent() else None
+        return self.ollama_agent if self._init_ollama_agent() else None
+    
+    def _record_success(self, model_name: str, model_time: float):
+        with self._stats_lock:
+            self.usage_stats[model_name]['calls'] += 1
+            self.usage_stats[model_name]['success'] += 1
+            self.usage_stats[model_name]['total_time'] += model_time
+            self._latency_samples[model_name].append(model_time)
+        metrics.LLM_SECONDS.observe(model_time, model=model_name)
+        self.breakers[model_name].record_success(model_time)
+    
+    def _record_race(self, model_name: str, key: str):
+        with self._stats_lock:
+            self.usage_stats[model_name][key] += 1
+    
+    def hedge_delay(self, model_name: str) -> float:
+        """
+        Задержка перед запуском следующей модели: квантиль времени успешных генераций
+        
+        Пока замеров мало, используется hedge_default_delay.
+        """
+        with self._stats_lock:
+            samples = sorted(self._latency_samples[model_name])
+        if len(samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        index = min(int(len(samples) * self.hedge_quantile), len(samples) - 1)
+        return max(samples[index], self.hedge_min_delay)
+    
+    @staticmethod
+    def _is_valid_sql(sql: Optional[str]) -> bool:
+        """SQL пригоден к выдаче: непустой SELECT/WITH, а не текст ошибки"""
+        return bool(sql) and re.match(r'\s*(select|with)\b', sql, re.IGNORECASE) is not None
+    
+    def _record_error(self, model_name: str, error: Optional[BaseException] = None):
+        with self._stats_lock:
+            self.usage_stats[model_name]['errors'] += 1
+        self.breakers[model_name].record_failure(error)
+    
+    def _allow(self, model_name: str) -> bool:
+        """Разрешает ли circuit breaker вызов модели"""
+        if self.breakers[model_name].allow():
+            return True
+        logger.info(f"⛔ {model_name}: цепь разомкнута, модель пропущена")
+        return False
+    
+    def _run_model(self, model_name: str, question: Prompt, start_time: float,
+                   retrieve_context: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Синхронная генерация SQL одной моделью (блокирующие вызовы LLM и БД)
+        
+        Returns:
+            Dict с результатом или None, если агент недоступен
+        """
+        logger.info(f"🔄 Попытка генерации SQL с {model_name}...")
+        question = self.prompt_for(question, model_name)
+        agent = self._get_agent(model_name)
+        if agent is None:
+            self.breakers[model_name].record_failure(reason="агент не инициализирован")
+            return None
+        
+        # Генерируем SQL с оптимизированным контекстом
+        model_start = time.time()
+        sql = self._generate_sql_with_optimized_context(question, agent, retrieve_context)
+        model_end = time.time()
+        if not self._is_valid_sql(sql):
+            raise ValueError(f"Модель {model_name} вернула невалидный SQL: {sql[:200]}")
+        
+        # Обновляем статистику
+        self._record_success(model_name, model_end - model_start)
+        
+        self.current_model = model_name
+        total_time = time.time() - start_time
+        
+        logger.info(f"✅ SQL сгенерирован с {model_name} за {total_time:.2f} сек")
+        return {
+            'success': True,
+            'sql': sql,
+            'model': model_name,
+            'time': total_time,
+            'model_time': model_end - model_start,
+            'question': question,
+            'context_used': True
+        }
+    
+    def _failure_result(self, question: Prompt, start_time: float) -> Dict[str, Any]:
+        return {
+            'success': False,
+            'error': 'Все модели недоступны',
+            'time': time.time() - start_time,
+            'question': question
+        }
+    
+    def generate_sql(self, question: Prompt, prefer_model: str = 'auto', timeout: int = 30,
+                     retrieve_context: bool = True) -> Dict[str, Any]:
         """
         Генерация SQL с оптимизированным контекстом
         
@@ -264,78 +431,284 @@ class OptimizedDualPipeline:
             question: Вопрос на естественном языке
             prefer_model: Предпочитаемая модель ('gpt4', 'ollama', 'auto')
             timeout: Таймаут для запроса в секундах
+            retrieve_context: False - вопрос уже содержит собранный контекст
             
         Returns:
             Dict с результатом генерации
         """
         start_time = time.time()
         
-        # Определяем порядок моделей
-        if prefer_model == 'gpt4':
-            models_order = ['gpt4', 'sqlcoder', 'ollama']
-        elif prefer_model == 'ollama':
-            models_order = ['ollama', 'sqlcoder', 'gpt4']
-        elif prefer_model == 'sqlcoder':
-            models_order = ['sqlcoder', 'gpt4', 'ollama']
-        else:  # auto
-            models_order = ['gpt4', 'sqlcoder', 'ollama']  # GPT-4o по умолчанию
+        for model_name in self._models_order(prefer_model):
+            if not self._allow(model_name):
+                continue
+            try:
+                result = self._run_model(model_name, question, start_time, retrieve_context)
+                if result is not None:
+                    return result
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка с {model_name}: {e}")
+                self._record_error(model_name, e)
+                continue
         
-        for model_name in models_order:
+        # Если все модели не сработали
+        return self._failure_result(question, start_time)
+    
+    def _semaphore(self, model_name: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(model_name)
+        if semaphore is None:
+            semaphore = self._semaphores[model_name] = asyncio.Semaphore(max(self.max_concurrency.get(model_name, 1), 1))
+        return semaphore
+    
+    async def _arun_model(self, model_name: str, question: Prompt, start_time: float, timeout: float,
+                          retrieve_context: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Генерация одной моделью в пуле потоков с лимитом параллельности на модель
+        
+        Слот модели освобождается только после завершения потока, даже если
+        ожидание прервано по таймауту, поэтому лимит действительно ограничивает
+        число одновременных запросов к провайдеру.
+        """
+        with tracing.span(f"llm.{model_name}", model=model_name):
+            semaphore = self._semaphore(model_name)
+            await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+            loop = asyncio.get_running_loop()
             try:
-                logger.info(f"🔄 Попытка генерации SQL с {model_name}...")
+                future = loop.run_in_executor(
+                    self._executor, self._run_model, model_name, question, start_time, retrieve_context
+                )
+            except BaseException:
+                semaphore.release()
+                raise
+            future.add_done_callback(lambda _: semaphore.release())
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+    
+    async def agenerate_sql(self, question: Prompt, prefer_model: str = 'auto', timeout: int = 30,
+                            hedging: Optional[bool] = None, retrieve_context: bool = True) -> Dict[str, Any]:
+        """
+        Асинхронная генерация SQL: не блокирует event loop FastAPI
+        
+        Args:
+            question: Вопрос на естественном языке или промпты по моделям (prompt_for)
+            prefer_model: Предпочитаемая модель ('gpt4', 'ollama', 'auto')
+            timeout: Таймаут на попытку одной модели в секундах
+            hedging: Хеджирование (по умолчанию hedging_enabled)
+            retrieve_context: False - вопрос уже содержит собранный контекст
+            
+        Returns:
+            Dict с результатом генерации
+        """
+        start_time = time.time()
+        order = self._models_order(prefer_model)
+        
+        if hedging if hedging is not None else self.hedging_enabled:
+            return await self._agenerate_hedged(question, order, start_time, timeout, retrieve_context)
+        
+        for model_name in order:
+            if not self._allow(model_name):
+                continue
+            try:
+                result = await self._arun_model(model_name, question, start_time, timeout, retrieve_context)
+                if result is not None:
+                    return result
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Таймаут {timeout}с с {model_name}")
+                self._record_error(model_name)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка с {model_name}: {e}")
+                self._record_error(model_name, e)
+        
+        return self._failure_result(question, start_time)
+    
+    async def _agenerate_hedged(self, question: str, order: List[str], start_time: float,
+                                timeout: float, retrieve_context: bool = True) -> Dict[str, Any]:
+        """
+        Хеджированная генерация: следующая модель стартует, если текущая не ответила
+        за hedge_delay, либо сразу после ошибки; побеждает первый валидный SQL
+        
+        Проигравшие задачи отменяются. Уже выполняющийся в потоке вызов LLM
+        прервать нельзя, но его результат отбрасывается, а слот модели
+        освобождается по завершении потока.
+        """
+        pending: Dict[asyncio.Task, str] = {}
+        next_index = 0
+        last_model = None
+        
+        def launch(hedged: bool) -> bool:
+            """Запуск следующей модели, чья цепь не разомкнута"""
+            nonlocal next_index, last_model
+            while next_index < len(order):
+                model_name = order[next_index]
+                next_index += 1
+                if not self._allow(model_name):
+                    continue
+                task = asyncio.ensure_future(
+                    self._arun_model(model_name, question, start_time, timeout, retrieve_context)
+                )
+                pending[task] = model_name
+                last_model = model_name
+                self._record_race(model_name, 'races')
+                if hedged:
+                    self._record_race(model_name, 'hedged')
+                return True
+            return False
+        
+        launch(hedged=False)
+        try:
+            while pending:
+                delay = self.hedge_delay(last_model) if next_index < len(order) else None
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    slow_model = last_model
+                    if launch(hedged=True):
+                        logger.warning(f"⏱️ {slow_model} не ответил за {delay:.1f}с, запускаем {last_model} параллельно")
+                    continue
                 
-                if model_name == 'gpt4':
-                    if not self._init_gpt4_agent():
+                failed = False
+                for task in done:
+                    model_name = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except asyncio.TimeoutError:
+                        logger.warning(f"⚠️ Таймаут {timeout}с с {model_name}")
+                        self._record_error(model_name)
+                        failed = True
                         continue
-                    agent = self.gpt4_agent
-                elif model_name == 'sqlcoder':
-                    if not self._init_sqlcoder_agent():
+                    except Exception as e:
+                        logger.warning(f"⚠️ Ошибка с {model_name}: {e}")
+                        self._record_error(model_name, e)
+                        failed = True
                         continue
-                    agent = self.sqlcoder_agent
-                else:  # ollama
-                    if not self._init_ollama_agent():
+                    if result is None:
+                        failed = True
                         continue
-                    agent = self.ollama_agent
-                
-                # Генерируем SQL с оптимизированным контекстом
-                model_start = time.time()
-                sql = self._generate_sql_with_optimized_context(question, agent)
-                model_end = time.time()
-                
-                # Обновляем статистику
-                self.usage_stats[model_name]['calls'] += 1
-                self.usage_stats[model_name]['success'] += 1
-                self.usage_stats[model_name]['total_time'] += (model_end - model_start)
-                
-                self.current_model = model_name
-                total_time = time.time() - start_time
-                
-                result = {
-                    'success': True,
-                    'sql': sql,
-                    'model': model_name,
-                    'time': total_time,
-                    'model_time': model_end - model_start,
-                    'question': question,
-                    'context_used': True
-                }
-                
-                logger.info(f"✅ SQL сгенерирован с {model_name} за {total_time:.2f} сек")
-                return result
+                    self._record_race(model_name, 'wins')
+                    if pending or model_name != order[0]:
+                        logger.info(f"🏁 Хеджирование: победил {model_name}")
+                    return result
                 
+                # Ошибка модели - следующая стартует без ожидания
+                if failed:
+                    launch(hedged=False)
+        finally:
+            for task, model_name in pending.items():
+                task.cancel()
+                self._record_race(model_name, 'cancelled')
+        
+        return self._failure_result(question, start_time)
+    
+    def _stream_model(self, model_name: str, question: Prompt, emit: Callable[[Dict[str, Any]], None],
+                      stop: threading.Event, retrieve_context: bool = True) -> Optional[float]:
+        """
+        Потоковая генерация одной моделью в рабочем потоке
+
+        Returns:
+            Время работы модели или None, если агент недоступен
+        """
+        question = self.prompt_for(question, model_name)
+        agent = self._get_agent(model_name)
+        if agent is None:
+            self.breakers[model_name].record_failure(reason="агент не инициализирован")
+            return None
+        model_start = time.time()
+        for event in agent.stream_sql(question, should_stop=stop.is_set, retrieve_context=retrieve_context):
+            emit(event)
+        return time.time() - model_start
+
+    async def astream_sql(self, question: Prompt, prefer_model: str = 'auto', timeout: int = 30,
+                          retrieve_context: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковая генерация SQL: события передаются из рабочего потока по мере готовности
+
+        Следующая модель пробуется, только если предыдущая не успела отдать
+        ни одного токена. При закрытии генератора (клиент отключился) поток
+        LLM останавливается на следующем чанке.
+
+        Args:
+            question: Вопрос на естественном языке
+            prefer_model: Предпочитаемая модель ('gpt4', 'ollama', 'auto')
+            timeout: Таймаут ожидания слота модели и каждого следующего события
+            retrieve_context: False - вопрос уже содержит собранный контекст
+
+        Yields:
+            Dict[str, Any]: События 'stage', 'token', 'sql' или 'error'
+        """
+        start_time = time.time()
+        loop = asyncio.get_running_loop()
+
+        for model_name in self._models_order(prefer_model):
+            if not self._allow(model_name):
+                continue
+            semaphore = self._semaphore(model_name)
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Таймаут {timeout}с ожидания слота {model_name}")
+                self._record_error(model_name)
+                continue
+
+            queue: asyncio.Queue = asyncio.Queue()
+            stop = threading.Event()
+            emit = lambda event: loop.call_soon_threadsafe(queue.put_nowait, event)
+            try:
+                future = loop.run_in_executor(
+                    self._executor, self._stream_model, model_name, question, emit, stop, retrieve_context
+                )
+            except BaseException:
+                semaphore.release()
+                raise
+            future.add_done_callback(lambda _: semaphore.release())
+            future.add_done_callback(lambda _: queue.put_nowait(_STREAM_DONE))
+
+            emitted_tokens = False
+            sql_event = None
+            try:
+                yield {'event': 'stage', 'stage': 'model_selected', 'model': model_name}
+                while True:
+                    event = await asyncio.wait_for(queue.get(), timeout=timeout)
+                    if event is _STREAM_DONE:
+                        break
+                    if event['event'] == 'sql':
+                        sql_event = event
+                        continue
+                    emitted_tokens = emitted_tokens or event['event'] == 'token'
+                    yield event
+                model_time = future.result()
             except Exception as e:
-                logger.warning(f"⚠️ Ошибка с {model_name}: {e}")
-                self.usage_stats[model_name]['errors'] += 1
+                stop.set()
+                logger.warning(f"⚠️ Ошибка потоковой генерации с {model_name}: {e!r}")
+                self._record_error(model_name, e)
+                if emitted_tokens:
+                    yield {'event': 'error', 'error': f"Ошибка генерации SQL ({model_name}): {e!r}"}
+                    return
                 continue
-        
-        # Если все модели не сработали
-        total_time = time.time() - start_time
-        return {
-            'success': False,
-            'error': 'Все модели недоступны',
-            'time': total_time,
-            'question': question
-        }
+            finally:
+                # Генератор закрыт до конца потока - останавливаем чтение LLM
+                if not future.done():
+                    stop.set()
+
+            if model_time is None or sql_event is None:
+                continue
+
+            self._record_success(model_name, model_time)
+            self.current_model = model_name
+            total_time = time.time() - start_time
+            logger.info(f"✅ SQL сгенерирован потоково с {model_name} за {total_time:.2f} сек")
+            yield {
+                'event': 'sql',
+                'sql': sql_event['sql'],
+                'model': model_name,
+                'time': total_time,
+                'model_time': model_time,
+                'early_stop': sql_event.get('early_stop', False)
+            }
+            return
+
+        yield {'event': 'error', 'error': 'Все модели недоступны'}
+
+    def shutdown(self):
+        """Остановка пула потоков генерации"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
     
     def train_on_schema(self) -> bool:
         """Обучение на схеме БД для обеих моделей"""
@@ -421,7 +794,10 @@ class OptimizedDualPipeline:
         """Получение статистики использования"""
         stats = {}
         
-        for model_name, model_stats in self.usage_stats.items():
+        with self._stats_lock:
+            snapshot = {name: dict(values) for name, values in self.usage_stats.items()}
+        
+        for model_name, model_stats in snapshot.items():
             if model_stats['calls'] > 0:
                 stats[model_name] = {
                     'calls': model_stats['calls'],
@@ -436,50 +812,165 @@ class OptimizedDualPipeline:
                     'error_rate': 0,
                     'avg_time': 0
                 }
+            stats[model_name].update({
+                'races': model_stats['races'],
+                'wins': model_stats['wins'],
+                'win_rate': model_stats['wins'] / model_stats['races'] if model_stats['races'] > 0 else 0,
+                'hedged': model_stats['hedged'],
+                'cancelled': model_stats['cancelled'],
+                'hedge_delay': self.hedge_delay(model_name)
+            })
         
         return stats
     
-    def health_check(self) -> Dict[str, bool]:
-        """Проверка здоровья обеих моделей"""
-        health = {}
+    def collect_metrics(self) -> List[Any]:
+        """Сборщик для /metrics: счетчики usage_stats, состояние breaker и задержка хеджирования"""
+        with self._stats_lock:
+            snapshot = {name: dict(values) for name, values in self.usage_stats.items()}
+        
+        calls = metrics.Counter("nlsql_llm_calls_total", "Вызовы моделей по исходу", ["model", "outcome"])
+        races = metrics.Counter("nlsql_llm_hedging_total", "События хеджирования по моделям", ["model", "event"])
+        breaker_state = metrics.Gauge("nlsql_llm_breaker_state", "Состояние circuit breaker (0 closed, 1 half_open, 2 open)", ["model"])
+        hedge_delay = metrics.Gauge("nlsql_llm_hedge_delay_seconds", "Текущая задержка хеджирования", ["model"])
+        state_codes = {OPEN: 2, HALF_OPEN: 1}
+        for model_name, values in snapshot.items():
+            calls.inc(values['success'], model=model_name, outcome='success')
+            calls.inc(values['errors'], model=model_name, outcome='error')
+            for event in ('races', 'wins', 'hedged', 'cancelled'):
+                races.inc(values[event], model=model_name, event=event)
+            breaker_state.set(state_codes.get(self.breakers[model_name].state, 0), model=model_name)
+            hedge_delay.set(self.hedge_delay(model_name), model=model_name)
+        return [calls, races, breaker_state, hedge_delay]
+    
+    def _model_config(self, model_name: str) -> Dict[str, Any]:
+        if model_name == 'gpt4':
+            return self.gpt4_config
+        elif model_name == 'sqlcoder':
+            return self.sqlcoder_config
+        return self.ollama_config
+    
+    def model_id(self, model_name: str) -> Optional[str]:
+        """Имя модели у провайдера (gpt-4o, llama3.1:8b) - для подсчета токенов"""
+        return self._model_config(model_name).get('model')
+    
+    def _probe_model(self, model_name: str) -> Dict[str, Any]:
+        """
+        Легкая проба провайдера без генерации
         
-        # Проверяем GPT-4o
+        Ollama - GET /api/tags (и наличие нужной модели), OpenAI-совместимый API -
+        GET /models с ключом. Цепь размыкается только когда провайдер точно
+        недоступен: нет соединения или ключ отвергнут (401/403). Прочие неудачи
+        (нет маршрута /models, 429/5xx, модель не найдена в /api/tags) только
+        попадают в результат пробы - решают исходы реальных генераций.
+        """
+        config = self._model_config(model_name)
+        base_url = (config.get('base_url') or '').rstrip('/')
+        started = time.perf_counter()
+        result: Dict[str, Any] = {'ok': False, 'fatal': False, 'checked_at': time.time()}
         try:
-            if self._init_gpt4_agent():
-                # Простой тест
-                test_result = self.gpt4_agent.generate_sql("SELECT 1")
-                health['gpt4'] = True
+            if config.get('api_key') == 'ollama':
+                root = base_url[:-3] if base_url.endswith('/v1') else base_url
+                response = httpx.get(f"{root}/api/tags", timeout=self.probe_timeout)
+                response.raise_for_status()
+                names = {m.get('name') for m in response.json().get('models', [])}
+                model = config.get('model', '')
+                result['ok'] = model in names or f"{model}:latest" in names
+                if not result['ok']:
+                    result['error'] = f"модель {model} не загружена в Ollama"
+            elif not config.get('api_key'):
+                # Без ключа генерация получит 401 - то же, что отвергнутый ключ
+                result['error'] = "не задан API ключ"
+                result['fatal'] = True
             else:
-                health['gpt4'] = False
+                response = httpx.get(
+                    f"{base_url}/models",
+                    headers={'Authorization': f"Bearer {config['api_key']}"},
+                    timeout=self.probe_timeout
+                )
+                result['status_code'] = response.status_code
+                result['ok'] = response.status_code == 200
+                if not result['ok']:
+                    result['error'] = f"HTTP {response.status_code}"
+                    result['fatal'] = is_fatal_error(response)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            result['error'] = repr(e)
+            result['fatal'] = True
         except Exception as e:
-            logger.warning(f"⚠️ GPT-4o недоступен: {e}")
-            health['gpt4'] = False
+            result['error'] = repr(e)
+            result['fatal'] = is_fatal_error(e)
+        result['latency'] = round(time.perf_counter() - started, 4)
+        
+        breaker = self.breakers[model_name]
+        if result['ok']:
+            breaker.probe_succeeded()
+        elif result['fatal']:
+            breaker.trip(f"проба: {result.get('error')}")
+        return result
+    
+    def probe(self, model_name: str, force: bool = False) -> Dict[str, Any]:
+        """Результат пробы модели из кэша (не старше probe_ttl)"""
+        with self._probe_lock:
+            cached = self._probe_cache.get(model_name)
+        if not force and cached is not None and time.time() - cached['checked_at'] < self.probe_ttl:
+            return cached
+        result = self._probe_model(model_name)
+        with self._probe_lock:
+            self._probe_cache[model_name] = result
+        return result
+    
+    def _model_health(self, model_name: str, probe: Dict[str, Any]) -> Dict[str, Any]:
+        breaker = self.breakers[model_name].snapshot()
+        # Неудачная, но не фатальная проба не делает модель недоступной: это решает breaker
+        return {
+            'available': breaker['state'] != OPEN and not probe.get('fatal'),
+            'probe': probe,
+            'breaker': breaker
+        }
+    
+    def health_check(self, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Проверка здоровья моделей по кэшируемым пробам и состоянию circuit breaker
         
-        # Проверяем Ollama
-        try:
-            if self._init_ollama_agent():
-                # Простой тест
-                test_result = self.ollama_agent.generate_sql("SELECT 1")
-                health['ollama'] = True
-            else:
-                health['ollama'] = False
-        except Exception as e:
-            logger.warning(f"⚠️ Ollama недоступен: {e}")
-            health['ollama'] = False
+        Генерации SQL не выполняются.
+        """
+        return {
+            model_name: self._model_health(model_name, self.probe(model_name, force))
+            for model_name in self.breakers
+        }
+    
+    async def ahealth_check(self, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """health_check без блокировки event loop: пробы выполняются параллельно в потоках"""
+        models = list(self.breakers)
+        probes = await asyncio.gather(*(asyncio.to_thread(self.probe, model_name, force) for model_name in models))
+        return {
+            model_name: self._model_health(model_name, probe)
+            for model_name, probe in zip(models, probes)
+        }
+    
+    async def awarmup(self, models: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Прогрев при старте: создание агентов моделей и пробы провайдеров параллельно
         
-        # Проверяем SQLCoder
-        try:
-            if self._init_sqlcoder_agent():
-                # Простой тест
-                test_result = self.sqlcoder_agent.generate_sql("SELECT 1")
-                health['sqlcoder'] = True
-            else:
-                health['sqlcoder'] = False
-        except Exception as e:
-            logger.warning(f"⚠️ SQLCoder недоступен: {e}")
-            health['sqlcoder'] = False
+        Агенты создаются в потоках (импорт vanna/openai и клиентов не блокирует
+        event loop), пробы заодно выставляют начальное состояние circuit breaker.
         
-        return health
+        Args:
+            models: Модели для прогрева (по умолчанию LLM_WARMUP_MODELS)
+        """
+        if models is None:
+            models = [m.strip() for m in os.getenv('LLM_WARMUP_MODELS', 'gpt4,ollama').split(',') if m.strip()]
+        models = [model_name for model_name in models if model_name in self.breakers]
+        agents = await asyncio.gather(*(asyncio.to_thread(self._get_agent, model_name) for model_name in models))
+        probes = await asyncio.gather(*(asyncio.to_thread(self.probe, model_name, True) for model_name in models))
+        return {
+            model_name: {
+                'agent': agent is not None,
+                'available': self.breakers[model_name].state != OPEN,
+                'probe_ok': probe['ok'],
+            }
+            for model_name, agent, probe in zip(models, agents, probes)
+        }
+
 
 def create_optimized_dual_pipeline(config: Optional[Dict[str, Any]] = None) -> OptimizedDualPipeline:
     """
@@ -21,6 +21,9 @@ except ImportError:
 
 from vanna.base import VannaBase
 
+from src.utils.embeddings import embed_query
+from src.utils.schema_catalog import get_schema_catalog
+
 logger = logging.getLogger(__name__)
 
 class DocStructureVectorDBFixed(VannaBase):
@@ -135,47 +138,10 @@ class DocStructureVectorDBFixed(VannaBase):
                 logger.error("❌ Нет подключения к базе данных")
                 return []
                 
-            # Получаем DDL для приоритетных таблиц
-            ddl_list = []
-            
-            for table in self.priority_tables:
-                try:
-                    # Получаем DDL для таблицы
-                    ddl_query = f"""
-                    SELECT 
-                        table_name,
-                        column_name,
-                        data_type,
-                        is_nullable,
-                        column_default,
-                        character_maximum_length
-                    FROM information_schema.columns 
-                    WHERE table_name = '{table}'
-                    AND table_schema = 'public'
-                    ORDER BY ordinal_position
-                    """
-                    
-                    with self.conn.cursor() as cur:
-                        cur.execute(ddl_query)
-                        results = cur.fetchall()
-                        
-                        if results:
-                            # Формируем DDL для таблицы
-                            table_ddl = f"Таблица {table}:\n"
-                            table_ddl += f"Колонки: {', '.join([row[1] for row in results])}\n"
-                            
-                            for row in results:
-                                col_name, data_type, is_nullable = row[1], row[2], row[3]
-                                col_info = f"- {col_name}: {data_type}"
-                                if is_nullable == 'NO':
-                                    col_info += " (NOT NULL)"
-                                table_ddl += col_info + "\n"
-                            
-                            ddl_list.append(table_ddl)
-                            
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось получить DDL для таблицы {table}: {e}")
-                    continue
+            # Получаем DDL для приоритетных таблиц из каталога схемы процесса
+            catalog = get_schema_catalog()
+            catalog.ensure_loaded(self.conn)
+            ddl_list = catalog.describe_tables(self.priority_tables, include_lengths=False)
             
             logger.info(f"✅ Получено {len(ddl_list)} DDL для приоритетных таблиц")
             return ddl_list
@@ -281,9 +247,11 @@ class DocStructureVectorDBFixed(VannaBase):
     
     def generate_embedding(self, text: str, **kwargs) -> List[float]:
         """Генерация эмбеддинга для текста"""
-        # Упрощенная реализация - возвращаем пустой список
-        # В реальной реализации здесь должен быть вызов модели эмбеддингов
-        return []
+        try:
+            return embed_query(text)
+        except Exception as e:
+            logger.error(f"❌ Ошибка генерации эмбеддинга: {e}")
+            return []
     
     def run_sql(self, sql: str) -> pd.DataFrame:
         """Выполнение SQL запроса"""
@@ -7,7 +7,7 @@ https://vanna.ai/docs/postgres-openai-standard-other-vectordb/
 
 import os
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, Iterator
 try:
     from vanna.openai import OpenAI_Chat
 except ImportError:
@@ -19,6 +19,11 @@ except ImportError:
 from vanna.base import VannaBase
 import pandas as pd
 
+from src.utils.embeddings import embed_query
+from src.utils.sql_stream import find_complete_statement
+from src.utils.schema_catalog import get_schema_catalog
+from src.utils.tokens import record_usage
+
 logger = logging.getLogger(__name__)
 
 class DocStructureVectorDB(VannaBase):
@@ -186,50 +191,10 @@ class DocStructureVectorDB(VannaBase):
                 "tbl_personal_account"         # Личные кабинеты
             ]
             
-            ddl_list = []
-            
-            for table in priority_tables:
-                try:
-                    # Получаем DDL для таблицы
-                    ddl_query = f"""
-                    SELECT 
-                        table_name,
-                        column_name,
-                        data_type,
-                        is_nullable,
-                        column_default,
-                        character_maximum_length
-                    FROM information_schema.columns 
-                    WHERE table_name = '{table}'
-                    AND table_schema = 'public'
-                    ORDER BY ordinal_position
-                    """
-                    
-                    with self.conn.cursor() as cur:
-                        cur.execute(ddl_query)
-                        results = cur.fetchall()
-                        
-                        if results:
-                            # Формируем DDL для таблицы
-                            table_ddl = f"Таблица {table}:\n"
-                            
-                            # Добавляем имена колонок
-                            column_names = [row[1] for row in results]
-                            table_ddl += f"Колонки: {', '.join(column_names)}\n"
-                            
-                            for row in results:
-                                col_info = f"- {row[1]}: {row[2]}"
-                                if row[3] == 'NO':
-                                    col_info += " (NOT NULL)"
-                                if row[5]:
-                                    col_info += f"({row[5]})"
-                                table_ddl += col_info + "\n"
-                            
-                            ddl_list.append(table_ddl)
-                            
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось получить DDL для {table}: {e}")
-                    continue
+            # DDL из каталога схемы процесса (загружается одним запросом)
+            catalog = get_schema_catalog()
+            catalog.ensure_loaded(self.conn)
+            ddl_list = catalog.describe_tables(priority_tables)
             
             logger.info(f"✅ Получено {len(ddl_list)} DDL элементов для бизнес-таблиц")
             return ddl_list
@@ -372,10 +337,8 @@ class DocStructureVectorDB(VannaBase):
             list: Вектор эмбеддинга
         """
         try:
-            # Используем HF модель для генерации эмбеддингов (384 размерность)
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-            return model.encode(text, convert_to_tensor=True).tolist()
+            # Используем HF модель из общего реестра (384 размерность)
+            return embed_query(text)
         except Exception as e:
             logger.error(f"❌ Ошибка генерации эмбеддинга: {e}")
             return [0.0] * 384
@@ -581,19 +544,38 @@ class DocStructureVannaNative(DocStructureVectorDB, OpenAI_Chat):
             logger.error(f"❌ Ошибка обучения: {e}")
             raise
     
-    def generate_sql(self, question: str) -> str:
+    def _agent_context(self, question: str, retrieve_context: bool) -> Dict[str, list]:
+        """DDL, документация и Q/A агента; пусто, если контекст уже собран в вопросе"""
+        if not retrieve_context:
+            return {'question_sql_list': [], 'ddl_list': [], 'doc_list': []}
+        return {
+            'question_sql_list': self.get_similar_question_sql(question),
+            'ddl_list': self.get_related_ddl(question),
+            'doc_list': self.get_related_documentation(question),
+        }
+
+    def generate_sql(self, question: str, retrieve_context: bool = True) -> str:
         """
         Генерация SQL с использованием Vanna AI и пост-обработкой для PostgreSQL
         
         Args:
             question: Вопрос на естественном языке
+            retrieve_context: False - вопрос уже содержит собранный контекст
+                (QueryService), агент не добавляет свои DDL, документацию и Q/A
             
         Returns:
             str: Сгенерированный SQL запрос
         """
         try:
-            # Используем стандартный метод Vanna AI
-            sql = super().generate_sql(question)
+            if retrieve_context:
+                # Используем стандартный метод Vanna AI
+                sql = super().generate_sql(question)
+            else:
+                initial_prompt = self.config.get("initial_prompt", None) if self.config is not None else None
+                prompt = self.get_sql_prompt(
+                    initial_prompt=initial_prompt, question=question, **self._agent_context(question, False)
+                )
+                sql = self.extract_sql(self.submit_prompt(prompt))
             
             # Post-process SQL to fix PostgreSQL dialect issues
             sql = self._clean_sql(sql)
@@ -603,7 +585,84 @@ class DocStructureVannaNative(DocStructureVectorDB, OpenAI_Chat):
         except Exception as e:
             logger.error(f"❌ Ошибка генерации SQL: {e}")
             raise
-    
+
+    def submit_prompt(self, prompt, **kwargs) -> str:
+        """
+        Запрос к LLM с учетом usage ответа (входные и закэшированные токены)
+
+        Args:
+            prompt: Сообщения чата из get_sql_prompt
+
+        Returns:
+            str: Текст ответа модели
+        """
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=prompt,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+        )
+        record_usage(self.model, getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    def stream_sql(self, question: str, should_stop: Optional[Callable[[], bool]] = None,
+                   retrieve_context: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Потоковая генерация SQL: события этапов, токены и итоговый SQL
+
+        Поток LLM закрывается, как только в ответе появился завершенный запрос,
+        поэтому пояснения после SQL не генерируются и не оплачиваются.
+
+        Args:
+            question: Вопрос на естественном языке
+            should_stop: Проверка отмены (клиент отключился)
+            retrieve_context: False - вопрос уже содержит собранный контекст
+
+        Yields:
+            Dict[str, Any]: {'event': 'stage'|'token'|'sql', ...}
+        """
+        initial_prompt = self.config.get("initial_prompt", None) if self.config is not None else None
+        context = self._agent_context(question, retrieve_context)
+        yield {
+            'event': 'stage',
+            'stage': 'agent_context',
+            'ddl': len(context['ddl_list']),
+            'documentation': len(context['doc_list']),
+            'examples': len(context['question_sql_list'])
+        }
+        prompt = self.get_sql_prompt(initial_prompt=initial_prompt, question=question, **context)
+
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=prompt,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stream=True,
+        )
+        text = ""
+        statement = None
+        try:
+            for chunk in stream:
+                if should_stop is not None and should_stop():
+                    logger.info("⏹️ Потоковая генерация остановлена: клиент отключился")
+                    return
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if not delta:
+                    continue
+                text += delta
+                yield {'event': 'token', 'text': delta}
+                statement = find_complete_statement(text)
+                if statement:
+                    logger.info(f"✂️ Поток LLM остановлен после завершенного SQL ({len(text)} символов)")
+                    break
+        finally:
+            stream.close()
+
+        sql = statement or self.extract_sql(text)
+        yield {'event': 'sql', 'sql': self._clean_sql(sql), 'early_stop': statement is not None}
+
     def _clean_sql(self, sql: str) -> str:
         """
         Очистка SQL от проблем с диалектом PostgreSQL
@@ -10,13 +10,17 @@ import asyncpg
 from typing import List, Dict, Any, Optional
 from openai import OpenAI
 
+from src.utils.embeddings import aembed_query, to_vector_literal
+from src.utils.db_pool import acquire_connection
+
 logger = logging.getLogger(__name__)
 
 class SemanticRAG:
     """RAG с семантическим поиском через pgvector"""
     
-    def __init__(self, dsn: str, api_key: str, base_url: str = None):
+    def __init__(self, dsn: str, api_key: str, base_url: str = None, db_pool=None):
         self.dsn = dsn
+        self.db_pool = db_pool
         self.client = OpenAI(
             api_key=api_key,
             base_url=base_url or "https://api.proxyapi.ru/openai/v1"
@@ -37,19 +41,16 @@ class SemanticRAG:
             # Генерируем эмбеддинг для вопроса
             question_embedding = await self._generate_embedding(question)
             
-            # Подключаемся к БД
-            conn = await asyncpg.connect(self.dsn)
-            
-            # Семантический поиск по документации
-            docs = await self._semantic_search(conn, question_embedding, 'documentation', limit)
-            
-            # Семантический поиск по Q/A парам
-            qa_pairs = await self._semantic_search(conn, question_embedding, 'question_sql', limit)
-            
-            # Семантический поиск по DDL
-            ddl = await self._semantic_search(conn, question_embedding, 'ddl', limit)
-            
-            await conn.close()
+            # Соединение из общего пула (или разовое подключение без пула)
+            async with acquire_connection(self.db_pool, self.dsn) as conn:
+                # Семантический поиск по документации
+                docs = await self._semantic_search(conn, question_embedding, 'documentation', limit)
+                
+                # Семантический поиск по Q/A парам
+                qa_pairs = await self._semantic_search(conn, question_embedding, 'question_sql', limit)
+                
+                # Семантический поиск по DDL
+                ddl = await self._semantic_search(conn, question_embedding, 'ddl', limit)
             
             return {
                 'documentation': docs,
@@ -64,9 +65,7 @@ class SemanticRAG:
     async def _generate_embedding(self, text: str) -> List[float]:
         """Генерация эмбеддинга для текста"""
         try:
-            from sentence_transformers import SentenceTransformer
-            model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-            return model.encode(text, convert_to_tensor=True).tolist()
+            return await aembed_query(text)
         except Exception as e:
             logger.error(f"❌ Ошибка генерации эмбеддинга: {e}")
             return []
@@ -76,7 +75,7 @@ class SemanticRAG:
         """Семантический поиск по типу контента"""
         try:
             # Конвертируем эмбеддинг в строку для pgvector
-            embedding_str = '[' + ','.join(map(str, query_embedding)) + ']'
+            embedding_str = to_vector_literal(query_embedding)
             
             # Семантический поиск с использованием cosine distance
             query = """
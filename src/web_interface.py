@@ -14,6 +14,7 @@ import os
 from typing import Optional, Dict
 from src.vanna.vanna_pgvector_native import create_native_vanna_client
 from src.utils.plan_sql_converter import sql_to_plan
+from src.utils import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +24,7 @@ web_app = FastAPI(
     description="Тестовый веб-интерфейс для отладки NL→SQL системы",
     version="1.0.0"
 )
+web_app.add_middleware(tracing.TracingMiddleware, service_name="nlsql-web-ui")
 
 # Настройка шаблонов
 templates = Jinja2Templates(directory="templates")
@@ -436,8 +438,8 @@ async def api_generate_chain(payload: Dict[str, str]):
             return JSONResponse(status_code=400, content={"success": False, "error": "question is required"})
 
         # Получение SQL от Core API
-        async with httpx.AsyncClient() as client:
-            r = await client.post("http://localhost:8000/query", json={
+        async with httpx.AsyncClient() as client, tracing.span("core_api.query", kind="client"):
+            r = await client.post("http://localhost:8000/query", headers=tracing.inject_headers(), json={
                 "question": question,
                 "user_id": "web_ui",
                 "role": "admin",
@@ -454,8 +456,8 @@ async def api_generate_chain(payload: Dict[str, str]):
         # Пробуем прогнать план через Mock API (без исполнения)
         decoded_sql = None
         try:
-            async with httpx.AsyncClient() as client:
-                r2 = await client.post("http://localhost:8081/api/plan/execute", json={
+            async with httpx.AsyncClient() as client, tracing.span("customer_api.plan_execute", kind="client"):
+                r2 = await client.post("http://localhost:8081/api/plan/execute", headers=tracing.inject_headers(), json={
                     "plan": plan,
                     "user_context": {"user_id": "admin", "role": "admin", "department": "IT"},
                     "request_id": "web_ui_generate_chain"
@@ -481,8 +483,8 @@ async def api_execute_chain(payload: Dict[str, str]):
             return JSONResponse(status_code=400, content={"success": False, "error": "question is required"})
 
         # Получение SQL от Core API
-        async with httpx.AsyncClient() as client:
-            r = await client.post("http://localhost:8000/query", json={
+        async with httpx.AsyncClient() as client, tracing.span("core_api.query", kind="client"):
+            r = await client.post("http://localhost:8000/query", headers=tracing.inject_headers(), json={
                 "question": question,
                 "user_id": user_id,
                 "role": role,
@@ -502,24 +504,26 @@ async def api_execute_chain(payload: Dict[str, str]):
             try:
                 if ('платеж' in question.lower() or 'payment' in question.lower()) or not plan.get("tables"):
                     raise RuntimeError("empty_plan_tables")
-                r2 = await client.post("http://localhost:8081/api/plan/execute", json={
-                    "plan": plan,
-                    "user_context": {"user_id": user_id, "role": role, "department": department},
-                    "request_id": "web_ui_execute_chain"
-                })
-                r2.raise_for_status()
-                exec_resp = r2.json()
+                with tracing.span("customer_api.plan_execute", kind="client"):
+                    r2 = await client.post("http://localhost:8081/api/plan/execute", headers=tracing.inject_headers(), json={
+                        "plan": plan,
+                        "user_context": {"user_id": user_id, "role": role, "department": department},
+                        "request_id": "web_ui_execute_chain"
+                    })
+                    r2.raise_for_status()
+                    exec_resp = r2.json()
             except Exception:
                 # Фоллбек: используем исходный SQL; быстрые подстановки для платежей
                 safe_sql = sql
                 safe_sql = safe_sql.replace("amount_payment_rubles", "credit").replace("business_unit_id", "client_name")
-                r3 = await client.post("http://localhost:8081/api/sql/execute", json={
-                    "sql_template": safe_sql,
-                    "user_context": {"user_id": user_id, "role": role, "department": department},
-                    "request_id": "web_ui_execute_chain_sql"
-                })
-                r3.raise_for_status()
-                j = r3.json()
+                with tracing.span("customer_api.sql_execute", kind="client"):
+                    r3 = await client.post("http://localhost:8081/api/sql/execute", headers=tracing.inject_headers(), json={
+                        "sql_template": safe_sql,
+                        "user_context": {"user_id": user_id, "role": role, "department": department},
+                        "request_id": "web_ui_execute_chain_sql"
+                    })
+                    r3.raise_for_status()
+                    j = r3.json()
                 exec_resp = {
                     "decoded_sql": sql,
                     "final_sql": j.get("final_sql", safe_sql),
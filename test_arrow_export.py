@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Тестирование выгрузки в Arrow/Parquet: numeric в нескольких пачках курсора
+"""
+
+import sys
+import os
+import asyncio
+import decimal
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils import arrow_export
+
+D = decimal.Decimal
+
+
+async def frames():
+    """Кадры как из stream_sql_against_db: в первой пачке numeric только NULL и целые"""
+    yield {"type": "meta", "columns": ["id", "amount", "ratio"], "types": ["int4", "numeric(12,2)", "numeric"]}
+    yield {"type": "rows", "rows": [(1, None, D("5")), (2, D("10"), None)]}
+    yield {"type": "rows", "rows": [(3, D("1234567890.12"), D("0.33333333333333333333")), (4, D("0.5"), D("-2.5E+3"))]}
+
+
+def check_table(table):
+    import pyarrow as pa
+
+    assert table.schema.field("amount").type == pa.decimal128(12, 2)
+    assert table.schema.field("ratio").type == pa.string()
+    assert table.schema.field("ratio").metadata == {b"pg_type": b"numeric"}
+    assert table.column("amount").to_pylist() == [None, D("10.00"), D("1234567890.12"), D("0.50")]
+    assert table.column("ratio").to_pylist() == ["5", None, "0.33333333333333333333", "-2500"]
+
+
+def test_arrow_export():
+    """numeric(p, s) - decimal128 по typmod, numeric без ограничений - точной строкой, во всех пачках"""
+    if arrow_export.pa is None:
+        print("⚠️ pyarrow не установлен, тест пропущен")
+        return
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    assert arrow_export.numeric_typmod("numeric(12,2)") == (12, 2)
+    assert arrow_export.numeric_typmod("numeric(10)") == (10, 0)
+    assert arrow_export.numeric_typmod("numeric") is None
+
+    async def run():
+        stream = b"".join([chunk async for chunk in arrow_export.ipc_stream(frames())])
+        check_table(pa.ipc.open_stream(stream).read_all())
+        print("✅ Arrow IPC: numeric во второй пачке не ломает поток")
+
+        path, rows = await arrow_export.write_parquet(frames())
+        try:
+            assert rows == 4
+            check_table(pq.read_table(path))
+        finally:
+            os.unlink(path)
+        print("✅ Parquet: numeric во второй пачке записан без потерь")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_arrow_export()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Тестирование circuit breaker провайдеров LLM: размыкание по ошибкам и 401/403,
+пробные вызовы half_open, медленные вызовы
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, is_fatal_error
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class ResponseError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = Response(status_code)
+
+
+def test_is_fatal_error():
+    """401/403 - фатальные как у исключения, так и у его response; 5xx и таймауты - нет"""
+    assert is_fatal_error(ProviderError(401)) and is_fatal_error(ResponseError(403))
+    assert not is_fatal_error(ProviderError(503))
+    assert not is_fatal_error(TimeoutError())
+    assert not is_fatal_error(None)
+    print("✅ is_fatal_error")
+
+
+def test_opens_after_threshold_or_fatal():
+    """Цепь размыкается после failure_threshold ошибок подряд или сразу после 401"""
+    breaker = CircuitBreaker("gpt4", failure_threshold=3, recovery_timeout=60)
+    breaker.record_failure(ProviderError(503))
+    breaker.record_failure(ProviderError(503))
+    breaker.record_success()
+    breaker.record_failure(ProviderError(503))
+    breaker.record_failure(ProviderError(503))
+    assert breaker.state == CLOSED
+    breaker.record_failure(ProviderError(503))
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.snapshot()['rejected'] == 1 and breaker.snapshot()['retry_in'] > 0
+
+    fatal = CircuitBreaker("gpt4", failure_threshold=3, recovery_timeout=60)
+    fatal.record_failure(ProviderError(401))
+    assert fatal.state == OPEN
+    print("✅ Размыкание по порогу ошибок и по 401")
+
+
+def test_half_open_path():
+    """После recovery_timeout пропускается один пробный вызов: успех замыкает, ошибка размыкает"""
+    breaker = CircuitBreaker("ollama", failure_threshold=1, recovery_timeout=0.05, half_open_max_calls=1)
+    breaker.record_failure(ProviderError(503))
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure(ProviderError(503))
+    assert breaker.state == OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+    assert breaker.snapshot()['consecutive_failures'] == 0
+
+    # Пробный вызов не отчитался: через recovery_timeout разрешается новая попытка
+    breaker.record_failure(ProviderError(503))
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    print("✅ half_open: пробный вызов, замыкание и повторное размыкание")
+
+
+def test_probe_and_slow_calls():
+    """Успешная проба переводит open в half_open; медленный вызов считается ошибкой"""
+    breaker = CircuitBreaker("sqlcoder", failure_threshold=1, recovery_timeout=60)
+    breaker.trip("ключ API не задан")
+    assert breaker.state == OPEN and breaker.snapshot()['last_error'] == "ключ API не задан"
+    breaker.probe_succeeded()
+    assert breaker.state == HALF_OPEN
+
+    slow = CircuitBreaker("gpt4", failure_threshold=2, recovery_timeout=60, slow_call_threshold=1.0)
+    slow.record_success(latency=0.5)
+    slow.record_success(latency=2.0)
+    slow.record_success(latency=3.0)
+    snapshot = slow.snapshot()
+    assert snapshot['state'] == OPEN and snapshot['slow_calls'] == 2 and snapshot['successes'] == 1, snapshot
+    print("✅ Проба и медленные вызовы")
+
+
+if __name__ == "__main__":
+    test_is_fatal_error()
+    test_opens_after_threshold_or_fatal()
+    test_half_open_path()
+    test_probe_and_slow_calls()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Тестирование сборщика контекста: дедупликация по таблице и содержимому,
+приоритет источников, усечение и отбрасывание по бюджету токенов
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils.context_assembler import (
+    MAX_SNIPPET_SHARE, TRUNCATION_MARK, ContextAssembler, budget_for, detect_table
+)
+from src.utils.tokens import count_tokens
+
+
+def table_ddl(table: str, columns: int = 3, prefix: str = "TABLE: public.") -> str:
+    body = ",\n".join(f"    column_{i} varchar(255)" for i in range(columns))
+    return f"{prefix}{table}\nCREATE TABLE {table} (\n{body}\n)"
+
+
+def test_detect_table():
+    """Таблица распознается в DDL из vanna_vectors, каталоге схемы и pg_dump"""
+    assert detect_table("TABLE: public.equsers\nCREATE TABLE equsers (id int)") == "equsers"
+    assert detect_table("Таблица eq_departments:\nКолонки: id") == "eq_departments"
+    assert detect_table('CREATE TABLE IF NOT EXISTS public."EqRoles" (id int)') == "eqroles"
+    assert detect_table("Q: сколько пользователей\nSQL: SELECT count(*) FROM equsers") is None
+    print("✅ Распознавание таблицы фрагмента")
+
+
+def test_dedup():
+    """Таблица остается из источника с большим приоритетом, одинаковый текст - один раз"""
+    assembler = ContextAssembler(10000)
+    assembler.add('schema', ["Таблица equsers:\nКолонки: id, login"], ddl=True)
+    assembler.add('ddl', [table_ddl('equsers'), table_ddl('eq_departments')], ddl=True)
+    assembler.add('rag', ["Q: все\nSQL: SELECT * FROM equsers", "q: все   sql: select * from EQUSERS"])
+    context = assembler.assemble()
+
+    assert [detect_table(part) for part in context.sections['ddl']] == ['equsers', 'eq_departments']
+    assert 'schema' not in context.sections
+    assert context.sections['rag'] == ["Q: все\nSQL: SELECT * FROM equsers"]
+    reasons = sorted(item['reason'] for item in context.dropped)
+    assert reasons == ['duplicate', 'duplicate_table:ddl'], context.dropped
+    report = context.report()
+    assert report['candidates'] == 5 and report['included'] == 3
+    print("✅ Дедупликация по таблице и содержимому")
+
+
+def test_budget_trimming():
+    """Большой DDL усекается по строкам в свою долю бюджета, текст без таблицы отбрасывается целиком"""
+    budget = 400
+    assembler = ContextAssembler(budget)
+    assembler.add('ddl', [table_ddl('equsers', columns=200)], ddl=True)
+    assembler.add('rag', ["Q: пример\nSQL: " + "SELECT 1 UNION ALL " * 200])
+    assembler.add('docs', ["Отдел пользователя - equsers.department_id"])
+    context = assembler.assemble()
+
+    [ddl] = context.sections['ddl']
+    assert ddl.endswith(TRUNCATION_MARK) and ddl.startswith("TABLE: public.equsers")
+    assert count_tokens(ddl) <= int(budget * MAX_SNIPPET_SHARE)
+    assert context.truncated[0]['table'] == 'equsers'
+    assert 'rag' not in context.sections
+    assert {'source': 'rag', 'table': None, 'reason': 'budget'}.items() <= context.dropped[0].items()
+    # Меньший фрагмент после отброшенного все еще попадает в бюджет
+    assert context.sections['docs'] == ["Отдел пользователя - equsers.department_id"]
+    assert context.used_tokens <= budget
+    print(f"✅ Бюджет {budget}: использовано {context.used_tokens}, DDL усечен, большой пример отброшен")
+
+
+def test_priority_order():
+    """При нехватке бюджета остаются фрагменты приоритетных источников и более релевантные в источнике"""
+    first, second = "Q: первый\nSQL: SELECT 1 " + "x" * 300, "Q: второй\nSQL: SELECT 2 " + "y" * 300
+    budget = count_tokens(first) + 5
+    assembler = ContextAssembler(budget)
+    assembler.add('docs', ["Документация " + "z" * 300])
+    assembler.add('rag', [first, second])
+    context = assembler.assemble()
+    assert context.sections == {'rag': [first]}, context.sections
+    print("✅ Приоритет источников и порядок релевантности")
+
+
+def test_budget_for():
+    """Бюджет модели из CONTEXT_TOKEN_BUDGET_<MODEL>, иначе общий"""
+    os.environ["CONTEXT_TOKEN_BUDGET"] = "2000"
+    os.environ["CONTEXT_TOKEN_BUDGET_OLLAMA"] = "700"
+    try:
+        assert budget_for() == 2000 and budget_for('gpt4') == 2000 and budget_for('ollama') == 700
+    finally:
+        del os.environ["CONTEXT_TOKEN_BUDGET"], os.environ["CONTEXT_TOKEN_BUDGET_OLLAMA"]
+    print("✅ Бюджеты моделей")
+
+
+if __name__ == "__main__":
+    test_detect_table()
+    test_dedup()
+    test_budget_trimming()
+    test_priority_order()
+    test_budget_for()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Тестирование общего пула БД: повторы при открытии, учет ожидания соединения,
+привязка к event loop и разовое подключение без пула
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils import db_pool
+from src.utils.db_pool import DatabasePool, acquire_connection
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    async def fetchval(self, query, *args):
+        return 1
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePool:
+    def __init__(self, size):
+        self.free = [FakeConnection() for _ in range(size)]
+        self.size = size
+        self.closed = False
+
+    async def acquire(self, timeout=None):
+        if not self.free:
+            raise asyncio.TimeoutError()
+        return self.free.pop()
+
+    async def release(self, conn):
+        self.free.append(conn)
+
+    async def close(self):
+        self.closed = True
+
+    def get_size(self):
+        return self.size
+
+    def get_idle_size(self):
+        return len(self.free)
+
+
+class FakeAsyncpg:
+    """Замена asyncpg.create_pool/connect: первые попытки создания пула падают"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.attempts = 0
+        self.connections = []
+
+    async def create_pool(self, dsn, min_size, max_size, **kwargs):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise OSError("connection refused")
+        return FakePool(max_size)
+
+    async def connect(self, dsn):
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+
+def run_with(fake, scenario):
+    saved = db_pool.asyncpg.create_pool, db_pool.asyncpg.connect
+    db_pool.asyncpg.create_pool, db_pool.asyncpg.connect = fake.create_pool, fake.connect
+    try:
+        return asyncio.run(scenario())
+    finally:
+        db_pool.asyncpg.create_pool, db_pool.asyncpg.connect = saved
+
+
+def make_pool(**kwargs) -> DatabasePool:
+    pool = DatabasePool(dsn="postgresql://test", min_size=1, max_size=2, acquire_timeout=0.1, **kwargs)
+    pool.open_retry_delay = 0.001
+    return pool
+
+
+def test_open_retries():
+    """Недоступная при старте БД: пул создается после повторов; исчерпание повторов - ошибка"""
+    fake = FakeAsyncpg(failures=2)
+    pool = make_pool()
+
+    async def scenario():
+        await pool.open()
+        assert pool.is_open and pool.is_usable()
+        await pool.close()
+        assert not pool.is_open
+
+    run_with(fake, scenario)
+    assert fake.attempts == 3
+
+    failing = make_pool()
+    failing.open_retries = 1
+
+    async def exhausted():
+        try:
+            await failing.open()
+            raise AssertionError("ожидался OSError")
+        except OSError:
+            pass
+
+    run_with(FakeAsyncpg(failures=5), exhausted)
+    assert not failing.is_open
+    print("✅ Повторы создания пула")
+
+
+def test_acquire_stats():
+    """Занятые соединения и ошибки ожидания учитываются в статистике и метриках"""
+    pool = make_pool()
+
+    async def scenario():
+        await pool.open()
+        async with pool.acquire():
+            async with pool.acquire():
+                assert pool.stats()["in_use"] == 2 and pool.stats()["idle"] == 0
+                try:
+                    async with pool.acquire():
+                        pass
+                    raise AssertionError("ожидался TimeoutError")
+                except asyncio.TimeoutError:
+                    pass
+        assert await pool.fetchval("SELECT 1") == 1
+        health = await pool.health()
+        await pool.close()
+        return health
+
+    health = run_with(FakeAsyncpg(), scenario)
+    assert health["status"] == "healthy", health
+    stats = pool.stats()
+    assert stats["acquires"] == 4 and stats["acquire_errors"] == 1 and stats["in_use"] == 0, stats
+    assert stats["acquire_wait_max"] >= stats["acquire_wait_avg"] >= 0
+    connections, errors = pool.collect_metrics()
+    assert 'nlsql_db_pool_acquire_errors_total 1' in errors.samples()
+    print("✅ Статистика ожидания соединения")
+
+
+def test_acquire_connection_fallback():
+    """Без пула или из другого event loop - разовое подключение, которое закрывается"""
+    fake = FakeAsyncpg()
+    pool = make_pool()
+
+    async def open_pool():
+        await pool.open()
+
+    async def use(target):
+        async with acquire_connection(target, "postgresql://test") as conn:
+            return conn
+
+    async def scenario():
+        assert (await use(None)).closed
+        # Пул открыт в другом loop: asyncpg не переносит соединения между loop
+        assert not pool.is_usable()
+        assert (await use(pool)).closed
+
+    run_with(fake, open_pool)
+    run_with(fake, scenario)
+    assert len(fake.connections) == 2
+    assert pool.stats()["acquires"] == 0
+
+    same_loop = make_pool()
+
+    async def pooled():
+        await same_loop.open()
+        conn = await use(same_loop)
+        assert not conn.closed and len(fake.connections) == 2
+
+    run_with(fake, pooled)
+    assert same_loop.stats()["acquires"] == 1
+    print("✅ Разовое подключение без пула")
+
+
+if __name__ == "__main__":
+    test_open_retries()
+    test_acquire_stats()
+    test_acquire_connection_fallback()
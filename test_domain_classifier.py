@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Тестирование классификатора домена: префиксное дерево ключевых слов,
+словоформы, порядок доменов и центроиды эмбеддингов
+"""
+
+import sys
+import os
+import json
+import tempfile
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils.domain_classifier import GENERAL, DomainClassifier, DomainSpec, build_centroids, stem
+
+
+def test_stem():
+    """Снимается одно окончание, основа не короче MIN_STEM"""
+    assert stem("Платежами") == "платеж"
+    assert stem("отчёты") == "отчет"
+    assert stem("users") == "user" and stem("sums") == "sums"
+    assert stem("итог") == "итог"
+    print("✅ Основы слов")
+
+
+def test_trie_keywords():
+    """Основа совпадает с началом слова вопроса, но не с серединой"""
+    classifier = DomainClassifier()
+    assert classifier.classify("Покажи входящие платежами за май").domain == 'payments'
+    assert classifier.classify("Список администраторов").domain == 'users'
+    # 'user' внутри слова не считается
+    assert classifier.match("superuser") == {}
+    assert classifier.match("users") == {'users': ['user']}
+    assert classifier.classify("как дела").domain == GENERAL
+    assert classifier.classify("как дела").method is None
+    print("✅ Ключевые слова через префиксное дерево")
+
+
+def test_overlapping_stems():
+    """Совпадение длинной основы засчитывает и ее префиксы из других доменов"""
+    domains = {
+        'short': DomainSpec(keywords=('плат',), tables=()),
+        'long': DomainSpec(keywords=('платеж',), tables=()),
+    }
+    classifier = DomainClassifier(domains=domains)
+    assert classifier.match("платежи") == {'short': ['плат'], 'long': ['платеж']}
+    assert classifier.match("платина") == {'short': ['плат']}
+    # Равный счет - побеждает объявленный раньше
+    assert classifier.classify("платежи").domain == 'short'
+    print("✅ Пересекающиеся основы и порядок доменов")
+
+
+def test_ranking():
+    """Домен с большим числом найденных ключевых слов выше"""
+    result = DomainClassifier().classify("отчет по платежам: сумма оплат и статистика входящих")
+    assert result.domain == 'payments', result.as_dict()
+    scores = {s['domain']: s['score'] for s in result.as_dict()['scores']}
+    assert scores['payments'] > scores['reports'] > 0
+    print(f"✅ Ранжирование доменов: {scores}")
+
+
+def test_centroid_fallback():
+    """Без ключевых слов домен определяется по ближайшему центроиду выше порога"""
+    centroids = {'payments': [1.0, 0.0, 0.0], 'users': [0.0, 1.0, 0.0]}
+    classifier = DomainClassifier(centroids=centroids, centroid_threshold=0.8)
+    result = classifier.classify("кто больше всех получил", embedding=[0.1, 0.9, 0.0])
+    assert result.domain == 'users' and result.method == 'centroid'
+    assert classifier.classify("непонятно", embedding=[0.0, 0.0, 1.0]).domain == GENERAL
+    # Эмбеддинг другой размерности не сравнивается
+    assert classifier.classify("непонятно", embedding=[1.0, 0.0]).scores == []
+    # Ключевые слова важнее центроидов
+    assert classifier.classify("платежи", embedding=[0.0, 1.0, 0.0]).domain == 'payments'
+    print("✅ Центроиды эмбеддингов")
+
+
+def test_load_centroids():
+    """Центроиды другой модели эмбеддингов не загружаются"""
+    centroids = build_centroids(lambda texts: [[1.0, float(len(text))] for text in texts])
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"spec": "model-a", "centroids": {**centroids, 'unknown': [0.0, 0.0]}}, f)
+    try:
+        classifier = DomainClassifier()
+        assert not classifier.load_centroids(f.name, "model-b") and classifier.centroids == {}
+        assert classifier.load_centroids(f.name, "model-a")
+        assert set(classifier.centroids) == {'payments', 'users', 'assignments', 'reports'}
+        assert not DomainClassifier().load_centroids(f.name + ".missing")
+    finally:
+        os.unlink(f.name)
+    print("✅ Загрузка центроидов с проверкой модели")
+
+
+if __name__ == "__main__":
+    test_stem()
+    test_trie_keywords()
+    test_overlapping_stems()
+    test_ranking()
+    test_centroid_fallback()
+    test_load_centroids()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Тестирование промпта генерации: /query/batch дает те же секции, что одиночный
+запрос, а каждая модель пайплайна получает контекст в своем бюджете токенов;
+ответ фоллбэка ollama не кэшируется
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.services.query_service import QueryService
+from src.vanna.vanna_semantic_fixed import RetrievalResult, RetrievedItem
+
+QUESTION = "Список пользователей по отделам"
+QA = ["Q: сколько пользователей\nSQL: SELECT count(*) FROM equsers"]
+DOCS = ["Отдел пользователя - equsers.department_id -> eq_departments.id"]
+
+
+class FakeSemanticVanna:
+    """Одиночные ретриверы и пакетный поиск по одной и той же KB"""
+
+    def __init__(self):
+        self.single_calls = 0
+
+    async def get_similar_question_sql(self, question, **kwargs):
+        self.single_calls += 1
+        return list(QA)
+
+    async def get_related_documentation(self, question, **kwargs):
+        self.single_calls += 1
+        return list(DOCS)
+
+    async def retrieve_context_bulk(self, embeddings, limits=None, chunk_size=100):
+        kb = {'question_sql': QA, 'documentation': DOCS}
+        # Как в vanna_semantic_fixed: в результате только запрошенные типы контента
+        return [
+            RetrievalResult(items={
+                content_type: [RetrievedItem(text, content_type, 0.1) for text in kb.get(content_type, [])[:k]]
+                for content_type, k in limits.items()
+            })
+            for _ in embeddings
+        ]
+
+
+class FakePipeline:
+    priority_tables = ['equsers']
+    breakers = {'gpt4': None, 'sqlcoder': None, 'ollama': None}
+
+    def model_id(self, model_name):
+        return None
+
+    async def agenerate_sql(self, prompts, prefer_model=None, retrieve_context=True):
+        if prefer_model == 'ollama':
+            return {'success': True, 'sql': 'SELECT 1', 'model': 'ollama'}
+        raise RuntimeError("HTTP 503")
+
+
+class FakeCache:
+    enabled = True
+
+    def __init__(self):
+        self.stored = []
+
+    def set(self, *args):
+        self.stored.append(args)
+
+    def add(self, *args):
+        self.stored.append(args)
+
+
+def make_service() -> QueryService:
+    service = QueryService.__new__(QueryService)
+    service.semantic_vanna = FakeSemanticVanna()
+    service.pipeline = FakePipeline()
+    service.primary_model = 'gpt4'
+    service.prompt_layout = 'stable'
+    service.context_timeouts = {}
+
+    async def tables_ddl(tables):
+        return [f"TABLE: public.{table}\nCREATE TABLE {table} (id int)" for table in tables]
+
+    async def schema_context():
+        return ["Таблица equsers:\nКолонки: id"]
+
+    service._get_tables_ddl = tables_ddl
+    service._get_schema_context = schema_context
+    return service
+
+
+def sections(prompt: str):
+    return [line for line in prompt.split("\n") if line.startswith("===")]
+
+
+def test_batch_prompt_matches_single():
+    """Пакетный поиск дает те же секции промпта (включая документацию), что одиночный"""
+    service = make_service()
+
+    async def run():
+        single, _ = await service._build_generation_prompt(QUESTION, 'users')
+        [retrieval] = await service.semantic_vanna.retrieve_context_bulk([[0.0]], service.BATCH_RETRIEVAL_LIMITS)
+        service.semantic_vanna.single_calls = 0
+        batch, _ = await service._build_generation_prompt(QUESTION, 'users', retrieval)
+        return single, batch
+
+    single_prompts, batch_prompts = asyncio.run(run())
+    assert batch_prompts == single_prompts
+    single, batch = single_prompts['gpt4'], batch_prompts['gpt4']
+    # Пакетный поиск покрывает все ретриверы KB: одиночные запросы к KB не нужны
+    assert service.semantic_vanna.single_calls == 0, service.semantic_vanna.single_calls
+    assert "===Documentation" in sections(single), sections(single)
+    assert sections(batch) == sections(single), (sections(batch), sections(single))
+    assert batch == single
+    print(f"✅ Секции пакетного и одиночного промпта совпадают: {sections(single)}")
+
+
+def test_prompt_per_model_budget():
+    """Модель с меньшим бюджетом получает свой, более короткий промпт; основная - полный"""
+    service = make_service()
+    long_ddl = "\n".join(f"    column_{i} varchar(255)," for i in range(400))
+
+    async def tables_ddl(tables):
+        return [f"TABLE: public.{table}\nCREATE TABLE {table} (\n{long_ddl}\n)" for table in tables]
+
+    service._get_tables_ddl = tables_ddl
+    os.environ["CONTEXT_TOKEN_BUDGET_GPT4"] = "3000"
+    os.environ["CONTEXT_TOKEN_BUDGET_OLLAMA"] = "300"
+    try:
+        prompts, info = asyncio.run(service._build_generation_prompt(QUESTION, 'users'))
+    finally:
+        del os.environ["CONTEXT_TOKEN_BUDGET_GPT4"], os.environ["CONTEXT_TOKEN_BUDGET_OLLAMA"]
+
+    assert list(prompts)[0] == 'gpt4' and set(prompts) == {'gpt4', 'sqlcoder', 'ollama'}
+    assert info['context_budgets']['ollama'] == 300
+    assert len(prompts['ollama']) < len(prompts['gpt4'])
+    # Вопрос в конце промпта остается при любом бюджете
+    assert all(prompt.endswith(QUESTION) for prompt in prompts.values())
+    print(f"✅ Промпты по моделям: " + ", ".join(f"{name}={len(prompt)} симв." for name, prompt in prompts.items()))
+
+
+def test_fallback_not_cached():
+    """Ответ ollama после ошибки основной модели помечен fallback и не попадает в кэши"""
+    service = make_service()
+    service.sql_cache, service.semantic_cache = FakeCache(), FakeCache()
+    lookup = {'key': 'k', 'embedding': [0.1], 'domain': 'users', 'kb_version': 1}
+
+    result = asyncio.run(service._generate_sql_uncached(QUESTION, {'role': 'admin'}, domain='users'))
+    assert result == {'sql': 'SELECT 1', 'model': 'ollama', 'source': 'fallback'}, result
+    service._store_cached_sql(QUESTION, 'admin', lookup, result)
+    assert service.sql_cache.stored == [] and service.semantic_cache.stored == []
+
+    service._store_cached_sql(QUESTION, 'admin', lookup, {**result, 'source': 'llm'})
+    assert len(service.sql_cache.stored) == 1 and len(service.semantic_cache.stored) == 1
+    print("✅ Ответ фоллбэка не кэшируется, ответ основной модели - кэшируется")
+
+
+if __name__ == "__main__":
+    test_batch_prompt_matches_single()
+    test_prompt_per_model_budget()
+    test_fallback_not_cached()
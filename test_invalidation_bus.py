@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Тестирование шины инвалидации: схлопывание уведомлений за окно debounce,
+некорректные уведомления, переподключение после разрыва соединения
+"""
+
+import sys
+import os
+import json
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils import invalidation_bus
+from src.utils.invalidation_bus import InvalidationBus
+
+
+class FakeConnection:
+    """Соединение LISTEN: уведомления и разрыв вызываются из теста"""
+
+    def __init__(self, triggers_installed=True):
+        self.triggers_installed = triggers_installed
+        self.listeners = {}
+        self.termination = None
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        self.termination = callback
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    async def remove_listener(self, channel, callback):
+        self.listeners.pop(channel, None)
+
+    async def fetchval(self, query, *args, timeout=None):
+        if self.closed:
+            raise ConnectionError("соединение закрыто")
+        return self.triggers_installed if "pg_trigger" in query else 1
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    def notify(self, channel, payload):
+        self.listeners[channel](self, 1, channel, payload if isinstance(payload, str) else json.dumps(payload))
+
+    def terminate(self):
+        self.closed = True
+        self.termination(self)
+
+
+class FakeConnect:
+    """Замена asyncpg.connect: первые попытки падают, затем выдаются новые соединения"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.attempts = 0
+        self.connections = []
+
+    async def __call__(self, dsn):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise OSError("connection refused")
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("условие не выполнено за отведенное время")
+        await asyncio.sleep(0.005)
+
+
+def run_bus(scenario, connect):
+    saved = invalidation_bus.asyncpg.connect
+    invalidation_bus.asyncpg.connect = connect
+    try:
+        asyncio.run(scenario())
+    finally:
+        invalidation_bus.asyncpg.connect = saved
+
+
+def make_bus(events):
+    bus = InvalidationBus(dsn="postgresql://test", channel="test_channel", debounce=0.05,
+                          reconnect_delay=0.01, ping_interval=0.05)
+    bus.subscribe('kb', lambda event: events.append(('kb', event)))
+
+    async def on_schema(event):
+        events.append(('schema', event))
+
+    bus.subscribe('schema', on_schema)
+    return bus
+
+
+def test_debounce():
+    """Пачка уведомлений одного вида дает один вызов подписчика с последним payload"""
+    connect = FakeConnect()
+    events = []
+    bus = make_bus(events)
+
+    async def scenario():
+        bus.start()
+        await wait_for(lambda: bus.listening)
+        conn = connect.connections[0]
+        assert bus.kb_push_active
+        for i in range(20):
+            conn.notify("test_channel", {"kind": "kb", "op": "INSERT", "n": i})
+        conn.notify("test_channel", {"kind": "schema", "tag": "ALTER TABLE"})
+        conn.notify("test_channel", "не json")
+        conn.notify("test_channel", {"kind": "unknown"})
+        assert events == []
+        await wait_for(lambda: len(events) == 2)
+        await asyncio.sleep(0.1)
+        await bus.stop()
+        assert conn.closed
+
+    run_bus(scenario, connect)
+    assert sorted(kind for kind, _ in events) == ['kb', 'schema']
+    assert dict(events)['kb']['n'] == 19
+    stats = bus.stats()
+    assert stats['received'] == {'kb': 20, 'schema': 1} and stats['dispatched'] == {'kb': 1, 'schema': 1}, stats
+    assert stats['invalid_payloads'] == 2 and not stats['listening']
+    print("✅ Схлопывание уведомлений и некорректные payload")
+
+
+def test_reconnect():
+    """Недоступная БД не останавливает слушателя; после разрыва подписчики вызываются для всех видов"""
+    connect = FakeConnect(failures=2)
+    events = []
+    bus = make_bus(events)
+
+    async def scenario():
+        bus.start()
+        await wait_for(lambda: bus.listening)
+        assert connect.attempts == 3 and events == []
+
+        # Разрыв соединения: уведомления за время разрыва потеряны
+        connect.connections[0].terminate()
+        await wait_for(lambda: len(connect.connections) == 2 and bus.listening)
+        await wait_for(lambda: len(events) == 2)
+        assert all(event['reason'] == 'reconnect' for _, event in events)
+
+        # Обрыв без уведомления о закрытии ловит ping
+        connect.connections[1].closed = True
+        await wait_for(lambda: len(connect.connections) == 3 and bus.listening)
+        await wait_for(lambda: len(events) == 4)
+        await bus.stop()
+
+    run_bus(scenario, connect)
+    stats = bus.stats()
+    assert stats['connects'] == 3 and stats['connect_errors'] == 2, stats
+    print("✅ Переподключение и сброс кэшей после разрыва")
+
+
+def test_publish():
+    """publish отправляет pg_notify с JSON и проверяет вид"""
+    sent = []
+
+    class Conn:
+        async def execute(self, query, *args):
+            sent.append((query, args))
+
+    async def scenario():
+        await invalidation_bus.publish(Conn(), 'kb', channel='test_channel', source='ingest')
+        try:
+            await invalidation_bus.publish(Conn(), 'other')
+            raise AssertionError("ожидался ValueError")
+        except ValueError:
+            pass
+
+    asyncio.run(scenario())
+    [(query, (channel, payload))] = sent
+    assert "pg_notify" in query and channel == 'test_channel'
+    assert json.loads(payload) == {'kind': 'kb', 'source': 'ingest'}
+    print("✅ publish")
+
+
+if __name__ == "__main__":
+    test_debounce()
+    test_reconnect()
+    test_publish()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Тестирование метрик Prometheus и подсчета токенов: формат экспорта,
+накопительные бакеты гистограмм, сборщики, usage ответов LLM
+"""
+
+import sys
+import os
+from types import SimpleNamespace
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils import metrics, tokens
+from src.utils.metrics import Registry
+from src.utils.single_flight import SingleFlight
+
+
+def test_counter_gauge_format():
+    """Счетчики и gauge с метками, экранирование значений меток"""
+    registry = Registry()
+    calls = registry.counter("test_calls_total", "Вызовы", ["model"])
+    calls.inc(model="gpt4")
+    calls.inc(2, model='ol"la\nma')
+    in_use = registry.gauge("test_in_use", "Занято")
+    in_use.set(5)
+    in_use.dec(2)
+
+    assert calls.value(model="gpt4") == 1
+    text = registry.render()
+    assert "# HELP test_calls_total Вызовы\n# TYPE test_calls_total counter\n" in text
+    assert 'test_calls_total{model="gpt4"} 1\n' in text
+    assert 'test_calls_total{model="ol\\"la\\nma"} 2\n' in text
+    assert "test_in_use 3\n" in text
+    try:
+        calls.inc(role="admin")
+        raise AssertionError("ожидался ValueError")
+    except ValueError:
+        pass
+    try:
+        registry.counter("test_calls_total", "Дубликат")
+        raise AssertionError("ожидался ValueError")
+    except ValueError:
+        pass
+    print("✅ Counter, Gauge и формат Prometheus")
+
+
+def test_histogram():
+    """Бакеты накопительные, +Inf равен count, sum - сумма наблюдений"""
+    registry = Registry()
+    latency = registry.histogram("test_seconds", "Время", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, stage="llm")
+    with latency.time(stage="db"):
+        pass
+
+    lines = registry.render().splitlines()
+    assert 'test_seconds_bucket{stage="llm",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{stage="llm",le="1"} 3' in lines
+    assert 'test_seconds_bucket{stage="llm",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{stage="llm"} 3.65' in lines
+    assert 'test_seconds_count{stage="llm"} 4' in lines
+    assert 'test_seconds_count{stage="db"} 1' in lines
+    print("✅ Гистограммы")
+
+
+def test_collectors():
+    """Сборщики вызываются при экспорте; ошибка сборщика не ломает /metrics"""
+    registry = Registry()
+    flight = SingleFlight("test")
+    flight.executions, flight.coalesced = 3, 2
+
+    def collect():
+        return metrics.single_flight_metrics({'generation': flight})
+
+    def broken():
+        raise RuntimeError("boom")
+
+    registry.register_collector(collect)
+    registry.register_collector(broken)
+    text = registry.render()
+    assert 'nlsql_single_flight_calls_total{operation="generation",result="coalesced"} 2' in text
+    assert 'nlsql_single_flight_in_flight{operation="generation"} 0' in text
+
+    registry.unregister_collector(collect)
+    assert "nlsql_single_flight" not in registry.render()
+    print("✅ Сборщики метрик")
+
+
+def test_tokens():
+    """Подсчет токенов (точный или оценка) и учет usage ответа LLM"""
+    text = "Покажи все входящие платежи за март"
+    assert tokens.count_tokens("") == 0
+    count = tokens.count_tokens(text)
+    if tokens.is_exact():
+        assert tokens.stats() == {"exact": True, "method": "tiktoken"}
+        assert 0 < count < len(text)
+    else:
+        assert tokens.stats()["method"] == "estimate"
+        assert count == round(len(text) / tokens.CHARS_PER_TOKEN)
+
+    before = metrics.LLM_INPUT_TOKENS.value(model="test", kind="cached")
+    usage = SimpleNamespace(prompt_tokens=1500, prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+    assert tokens.record_usage("test", usage) == {"prompt_tokens": 1500, "cached_tokens": 1024}
+    assert metrics.LLM_INPUT_TOKENS.value(model="test", kind="cached") == before + 1024
+    # Ollama не сообщает cached_tokens
+    assert tokens.record_usage("test", SimpleNamespace(prompt_tokens=10)) == {"prompt_tokens": 10, "cached_tokens": 0}
+    assert tokens.record_usage("test", None) == {"prompt_tokens": 0, "cached_tokens": 0}
+    print(f"✅ Токены ({tokens.stats()['method']}) и usage ответов")
+
+
+if __name__ == "__main__":
+    test_counter_gauge_format()
+    test_histogram()
+    test_collectors()
+    test_tokens()
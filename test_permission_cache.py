@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Тестирование кэша прав пользователей: свежие, устаревшие (stale-while-revalidate)
+и отрицательные записи, поколения при сбросе и загрузка через CustomerAPIService
+"""
+
+import sys
+import os
+import time
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+import httpx
+
+from src.services.permission_cache import FRESH, NEGATIVE, STALE, PermissionCache
+from services.customer_api_service import CustomerAPIService, UserNotFoundError
+
+PERMISSIONS = {"user_id": "u1", "role": "user", "department": "Support", "permissions": ["read"]}
+
+
+def test_fresh_stale_negative():
+    """Запись свежая до TTL, затем устаревшая до конца окна stale, затем промах"""
+    cache = PermissionCache(max_size=10, ttl=0.05, stale_ttl=0.05, negative_ttl=0.05)
+    cache.set("u1", PERMISSIONS)
+    cache.set_negative("ghost")
+    assert cache.get("u1") == (FRESH, PERMISSIONS)
+    assert cache.get("ghost") == (NEGATIVE, None)
+
+    time.sleep(0.06)
+    assert cache.get("u1") == (STALE, PERMISSIONS)
+    # У отрицательной записи нет окна stale
+    assert cache.get("ghost") == (None, None)
+
+    time.sleep(0.05)
+    assert cache.get("u1") == (None, None)
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['stale_hits'] == 1 and stats['negative_hits'] == 1, stats
+    assert stats['misses'] == 2 and stats['size'] == 0, stats
+
+    # TTL записи из Cache-Control: max-age
+    cache.set("u2", PERMISSIONS, ttl=0)
+    assert cache.get("u2") == (None, None)
+    print("✅ Свежие, устаревшие и отрицательные записи")
+
+
+def test_generation_discards_stale_writes():
+    """Права, загруженные до сброса, в кэш не записываются"""
+    cache = PermissionCache(max_size=10, ttl=60, stale_ttl=60, negative_ttl=60)
+    generation = cache.generation("u1")
+    assert cache.invalidate("u1") == 0
+    cache.set("u1", PERMISSIONS, generation=generation)
+    cache.set_negative("u1", generation=generation)
+    assert cache.get("u1") == (None, None)
+
+    other = cache.generation("u2")
+    cache.invalidate("u1")
+    cache.set("u2", PERMISSIONS, generation=other)
+    assert cache.get("u2")[0] == FRESH
+
+    generation = cache.generation("u2")
+    assert cache.invalidate() == 1
+    cache.set("u2", PERMISSIONS, generation=generation)
+    assert cache.get("u2") == (None, None)
+    assert cache.stats()['discarded'] == 3
+    print("✅ Поколения: загрузка до сброса не попадает в кэш")
+
+
+def test_lru_and_disabled():
+    cache = PermissionCache(max_size=2, ttl=60, stale_ttl=0, negative_ttl=60)
+    cache.set("a", PERMISSIONS)
+    cache.set("b", PERMISSIONS)
+    cache.get("a")
+    cache.set("c", PERMISSIONS)
+    assert cache.get("b") == (None, None) and cache.get("a")[0] == FRESH
+    assert cache.stats()['evictions'] == 1
+
+    disabled = PermissionCache(max_size=0, ttl=60, stale_ttl=60, negative_ttl=60)
+    disabled.set("a", PERMISSIONS)
+    assert disabled.get("a") == (None, None)
+    print("✅ Вытеснение LRU и выключенный кэш")
+
+
+def make_service(handler) -> CustomerAPIService:
+    service = CustomerAPIService()
+    service.permission_cache = PermissionCache(max_size=10, ttl=60, stale_ttl=60, negative_ttl=60)
+    client = httpx.AsyncClient(base_url="http://customer-api", transport=httpx.MockTransport(handler))
+    service._get_client = lambda: client
+    return service
+
+
+def test_service_stale_and_negative():
+    """Устаревшие права отдаются сразу и обновляются фоном; 404 кэшируется отрицательно"""
+    requests = []
+
+    def handler(request):
+        user_id = request.url.path.split("/")[3]
+        requests.append(user_id)
+        if user_id == "ghost":
+            return httpx.Response(404)
+        return httpx.Response(200, json={**PERMISSIONS, "user_id": user_id, "version": len(requests)})
+
+    service = make_service(handler)
+
+    async def run():
+        first = await service.get_user_permissions("u1")
+        assert first["version"] == 1
+        assert (await service.get_user_permissions("u1"))["version"] == 1
+        assert requests == ["u1"]
+
+        # Запись устарела: ответ сразу из кэша, обновление - фоном
+        service.permission_cache._data["u1"].expires_at = time.monotonic() - 1
+        assert (await service.get_user_permissions("u1"))["version"] == 1
+        await asyncio.gather(*service._permission_refreshes.values())
+        assert (await service.get_user_permissions("u1"))["version"] == 2
+
+        for _ in range(2):
+            try:
+                await service.get_user_permissions("ghost")
+                raise AssertionError("ожидался UserNotFoundError")
+            except UserNotFoundError:
+                pass
+        assert requests == ["u1", "u1", "ghost"], requests
+
+    asyncio.run(run())
+    assert service.permission_stats()['refreshes'] == 1
+    print("✅ CustomerAPIService: stale-while-revalidate и отрицательный кэш")
+
+
+def test_service_invalidate_during_fetch():
+    """Сброс во время загрузки: ответ не кэшируется, следующий запрос идет в API заново"""
+    requests = []
+    release = asyncio.Event()
+
+    async def handler(request):
+        requests.append(request.url.path)
+        version = len(requests)
+        if version == 1:
+            await release.wait()
+        return httpx.Response(200, json={**PERMISSIONS, "version": version})
+
+    service = make_service(handler)
+
+    async def run():
+        pending = asyncio.ensure_future(service.get_user_permissions("u1"))
+        await asyncio.sleep(0.01)
+        service.invalidate_permissions("u1")
+        fresh = await service.get_user_permissions("u1")
+        release.set()
+        old = await pending
+        assert old["version"] == 1 and fresh["version"] == 2
+        assert (await service.get_user_permissions("u1"))["version"] == 2
+
+    asyncio.run(run())
+    assert len(requests) == 2
+    assert service.permission_cache.stats()['discarded'] == 1
+    print("✅ Сброс во время загрузки прав")
+
+
+if __name__ == "__main__":
+    test_fresh_stale_negative()
+    test_generation_discards_stale_writes()
+    test_lru_and_disabled()
+    test_service_stale_and_negative()
+    test_service_invalidate_during_fetch()
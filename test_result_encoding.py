@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Тестирование сериализации результатов: Decimal, даты и прочие типы asyncpg
+одинаково с orjson и json, форматы rows/columnar, сжатие по Accept-Encoding
+"""
+
+import sys
+import os
+import gzip
+import uuid
+import decimal
+import datetime
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils import result_encoding
+
+D = decimal.Decimal
+
+ROW = {
+    "count": D("42"),
+    "sum": D("1.5E+3"),
+    "amount": D("1234.50"),
+    "ratio": D("0.333"),
+    "nan": D("NaN"),
+    "created": datetime.datetime(2024, 3, 5, 14, 30, 15, 120000),
+    "created_tz": datetime.datetime(2024, 3, 5, 14, 30, tzinfo=datetime.timezone.utc),
+    "day": datetime.date(2024, 3, 5),
+    "at": datetime.time(9, 15),
+    "duration": datetime.timedelta(hours=1, seconds=30),
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "raw": b"\x00\xff",
+    "tags": ("a", "b"),
+    "missing": None,
+}
+EXPECTED = {
+    "count": 42,
+    "sum": 1500,
+    "amount": 1234.5,
+    "ratio": 0.333,
+    "created": "2024-03-05T14:30:15.120000",
+    "created_tz": "2024-03-05T14:30:00+00:00",
+    "day": "2024-03-05",
+    "at": "09:15:00",
+    "duration": 3630.0,
+    "id": "12345678-1234-5678-1234-567812345678",
+    "raw": "00ff",
+    "tags": ["a", "b"],
+    "missing": None,
+}
+
+
+def check_types():
+    decoded = result_encoding.loads(result_encoding.dumps([ROW]))[0]
+    nan = decoded.pop("nan")
+    # orjson пишет NaN как null, json - как NaN
+    assert nan is None or nan != nan, nan
+    assert decoded == EXPECTED, decoded
+    assert type(decoded["count"]) is int and type(decoded["amount"]) is float
+
+
+def test_types_orjson_and_json():
+    """Decimal: целое без дробной части, иначе float; даты - ISO 8601; результат не зависит от orjson"""
+    check_types()
+    saved = result_encoding.orjson
+    result_encoding.orjson = None
+    try:
+        check_types()
+    finally:
+        result_encoding.orjson = saved
+    print(f"✅ Типы asyncpg (orjson {'установлен' if saved else 'не установлен'} и json)")
+
+
+def test_formats():
+    """rows и columnar из ответа API в любом формате"""
+    columns, rows = result_encoding.result_rows({"data": [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]})
+    assert columns == ["id", "name"] and rows == [[1, "a"], [2, "b"]]
+    assert result_encoding.result_rows({"columns": ["id"], "rows": [[1]]}) == (["id"], [[1]])
+    assert result_encoding.shape_result(columns, rows, "columnar") == {"format": "columnar", "columns": columns, "rows": rows}
+    assert result_encoding.shape_result(columns, rows, "rows")["data"] == [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+    print("✅ Форматы rows и columnar")
+
+
+def test_compression():
+    """Маленький ответ не сжимается, большой - gzip (или br, если установлен brotli)"""
+    assert result_encoding.negotiate_encoding("gzip;q=0.5, identity") == "gzip"
+    assert result_encoding.negotiate_encoding("identity") is None
+    assert result_encoding.negotiate_encoding("gzip;q=0") is None
+
+    body, headers = result_encoding.encode({"ok": True}, "gzip")
+    assert "Content-Encoding" not in headers and result_encoding.loads(body) == {"ok": True}
+
+    payload = {"rows": [[i, "значение"] for i in range(1000)]}
+    body, headers = result_encoding.encode(payload, "gzip")
+    assert headers["Content-Encoding"] == "gzip" and headers["Vary"] == "Accept-Encoding"
+    assert result_encoding.loads(gzip.decompress(body)) == payload
+    print("✅ Сжатие по Accept-Encoding")
+
+
+if __name__ == "__main__":
+    test_types_orjson_and_json()
+    test_formats()
+    test_compression()
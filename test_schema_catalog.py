@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Тестирование каталога схемы: сборка таблиц из строк каталога, версия при
+изменении схемы, описание таблиц для контекста LLM, загрузка после сброса
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils.schema_catalog import SchemaCatalog
+
+# Строки CATALOG_QUERY: table, column, type, nullable, default, length, comments, внешний ключ
+ROWS = [
+    ("equsers", "id", "integer", "NO", "nextval('equsers_id_seq')", None, None, "Пользователи", None, None),
+    ("equsers", "login", "character varying", "NO", None, 64, "Логин", "Пользователи", None, None),
+    ("equsers", "department_id", "integer", "YES", None, None, None, "Пользователи", "eq_departments", "id"),
+    ("eq_departments", "id", "integer", "NO", None, None, None, None, None, None),
+    ("eq_departments", "name", "text", "YES", None, None, None, None, None, None),
+]
+
+
+class Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params):
+        self.conn.queries.append((query, params))
+        if self.conn.fail:
+            raise RuntimeError("БД недоступна")
+
+    def fetchall(self):
+        return list(self.conn.rows)
+
+
+class Connection:
+    """DB-API соединение агентов Vanna (psycopg2) с заданными строками каталога"""
+
+    def __init__(self, rows, fail=False):
+        self.rows = rows
+        self.fail = fail
+        self.queries = []
+        self.autocommit = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return Cursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_load_and_version():
+    """Таблицы собираются из строк; версия растет только при изменении схемы"""
+    catalog = SchemaCatalog(dsn="postgresql://test", schema="public", refresh_interval=0)
+    conn = Connection(ROWS)
+    assert catalog.load(conn) and catalog.version == 1
+    assert "%s" in conn.queries[0][0] and conn.queries[0][1] == ("public",)
+    # Чужое соединение не остается в открытой транзакции
+    assert conn.rollbacks == 1
+
+    assert catalog.tables() == ["eq_departments", "equsers"]
+    users = catalog.table("equsers")
+    assert users.column_names == ["id", "login", "department_id"] and users.comment == "Пользователи"
+    assert [(c.name, c.foreign_table, c.foreign_column) for c in users.foreign_keys] == [("department_id", "eq_departments", "id")]
+    assert not users.columns[0].nullable and users.columns[2].nullable
+
+    assert not catalog.load(Connection(ROWS)) and catalog.version == 1
+    assert catalog.load(Connection(ROWS[:-1])) and catalog.version == 2
+    assert catalog.table("eq_departments").column_names == ["id"]
+    stats = catalog.stats()
+    assert stats['tables'] == 2 and stats['columns'] == 4 and stats['loads'] == 3, stats
+    print("✅ Загрузка каталога и версия схемы")
+
+
+def test_describe_table():
+    """Тип, длина сразу после типа, NOT NULL, внешний ключ и комментарии"""
+    catalog = SchemaCatalog(dsn="postgresql://test", refresh_interval=0)
+    catalog.load(Connection(ROWS))
+    assert catalog.describe_table("equsers") == (
+        "Таблица equsers: -- Пользователи\n"
+        "Колонки: id, login, department_id\n"
+        "- id: integer (NOT NULL)\n"
+        "- login: character varying(64) (NOT NULL) -- Логин\n"
+        "- department_id: integer -> eq_departments.id\n"
+    )
+    assert catalog.describe_table("equsers", include_lengths=False, include_relations=False) == (
+        "Таблица equsers:\n"
+        "Колонки: id, login, department_id\n"
+        "- id: integer (NOT NULL)\n"
+        "- login: character varying (NOT NULL)\n"
+        "- department_id: integer\n"
+    )
+    assert catalog.describe_table("missing") is None
+    assert [d.split(":")[0] for d in catalog.describe_tables(["equsers", "missing", "eq_departments"])] == [
+        "Таблица equsers", "Таблица eq_departments"
+    ]
+    print("✅ Описание таблиц для контекста")
+
+
+def test_ensure_loaded_and_invalidate():
+    """Загрузка при первом обращении и после invalidate; ошибка оставляет прежний снимок"""
+    catalog = SchemaCatalog(dsn="postgresql://test", refresh_interval=0)
+    conn = Connection(ROWS)
+    catalog.ensure_loaded(conn)
+    catalog.ensure_loaded(conn)
+    assert len(conn.queries) == 1 and catalog.is_loaded
+
+    catalog.invalidate("тест")
+    assert catalog.stats()['stale']
+    failing = Connection(ROWS, fail=True)
+    catalog.ensure_loaded(failing)
+    assert catalog.stats()['load_errors'] == 1 and catalog.tables() == ["eq_departments", "equsers"]
+    # До истечения паузы повторная загрузка не выполняется
+    catalog.ensure_loaded(failing)
+    assert len(failing.queries) == 1
+    print("✅ Загрузка по требованию и после сброса")
+
+
+if __name__ == "__main__":
+    test_load_and_version()
+    test_describe_table()
+    test_ensure_loaded_and_invalidate()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Тестирование семантического кэша SQL: порог близости, литералы вопроса,
+домен и роль, TTL и вытеснение LRU
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.services.semantic_cache import SemanticSQLCache, extract_literals
+
+SQL = {'sql': "SELECT * FROM tbl_incoming_payments", 'model': 'gpt4', 'source': 'llm'}
+
+
+def make_cache(**kwargs) -> SemanticSQLCache:
+    options = {'max_entries': 4, 'ttl': 60, 'threshold': 0.9, 'domain_thresholds': {}}
+    options.update(kwargs)
+    return SemanticSQLCache(**options)
+
+
+def test_extract_literals():
+    """Строки в кавычках, даты, месяцы и числа приводятся к одному виду"""
+    assert extract_literals('платежи "Ромашка" за 2024') == extract_literals("за 2024 платежи «ромашка»")
+    assert extract_literals("с 05.03.2024") == extract_literals("с 2024-03-05") == ('d:2024-03-05',)
+    assert extract_literals("платежи за май") == ('m:5',)
+    assert extract_literals("платежи за маркетинг") == ()
+    # Число в кавычках и дата не дают отдельных чисел
+    assert extract_literals("договор '42'") == ('s:42',)
+    assert extract_literals("сумма 1500,50") == ('n:1500.50',)
+    print("✅ Литералы вопроса извлекаются и нормализуются")
+
+
+def test_literals_guard_semantic_hit():
+    """Близкие эмбеддинги с разными литералами не дают попадания"""
+    cache = make_cache()
+    cache.add([1.0, 0.0], 'платежи клиента "Ромашка" за январь', 'payments', 'admin', 1, SQL)
+
+    hit = cache.lookup([0.99, 0.05], 'покажи платежи клиента «ромашка» за январь', 'payments', 'admin', 1)
+    assert hit is not None and hit.value == SQL and hit.similarity > 0.9
+    for question in ('платежи клиента "Лютик" за январь', 'платежи клиента "Ромашка" за февраль',
+                     'платежи клиента "Ромашка" за январь 2023'):
+        assert cache.lookup([0.99, 0.05], question, 'payments', 'admin', 1) is None, question
+    print("✅ Попадание только при равных литералах вопросов")
+
+
+def test_scope_and_threshold():
+    """Домен, роль, версия KB и порог домена ограничивают попадание"""
+    cache = make_cache(domain_thresholds={'payments': 0.999})
+    cache.add([1.0, 0.0], "список пользователей", 'users', 'admin', 1, SQL)
+    cache.add([1.0, 0.0], "все платежи", 'payments', 'admin', 1, SQL)
+
+    assert cache.lookup([0.95, 0.3], "пользователи", 'users', 'admin', 1) is not None
+    assert cache.lookup([0.95, 0.3], "пользователи", 'users', 'user', 1) is None
+    assert cache.lookup([0.95, 0.3], "пользователи", 'users', 'admin', 2) is None
+    assert cache.lookup([0.95, 0.3], "платежи", 'payments', 'admin', 1) is None
+    assert cache.lookup([0.0, 1.0], "пользователи", 'users', 'admin', 1) is None
+    print("✅ Домен, роль, версия KB и порог домена учитываются")
+
+
+def test_ttl_and_lru():
+    """Устаревшая запись не отдается, при заполнении вытесняется давно не использованная"""
+    cache = make_cache(max_entries=2, ttl=0.05)
+    cache.add([1.0, 0.0], "первый", 'users', 'admin', 1, SQL)
+    time.sleep(0.1)
+    assert cache.lookup([1.0, 0.0], "первый", 'users', 'admin', 1) is None
+    assert cache.stats()['expirations'] == 1
+
+    cache = make_cache(max_entries=2)
+    cache.add([1.0, 0.0, 0.0], "первый", 'users', 'admin', 1, {'sql': 'SELECT 1'})
+    cache.add([0.0, 1.0, 0.0], "второй", 'users', 'admin', 1, {'sql': 'SELECT 2'})
+    assert cache.lookup([1.0, 0.0, 0.0], "первый", 'users', 'admin', 1).value == {'sql': 'SELECT 1'}
+    cache.add([0.0, 0.0, 1.0], "третий", 'users', 'admin', 1, {'sql': 'SELECT 3'})
+    assert cache.lookup([0.0, 1.0, 0.0], "второй", 'users', 'admin', 1) is None
+    assert cache.lookup([1.0, 0.0, 0.0], "первый", 'users', 'admin', 1) is not None
+    stats = cache.stats()
+    assert stats['size'] == 2 and stats['evictions'] == 1, stats
+
+    cache.clear()
+    assert cache.stats()['size'] == 0
+    assert cache.lookup([1.0, 0.0, 0.0], "первый", 'users', 'admin', 1) is None
+    print("✅ TTL, вытеснение LRU и очистка кэша")
+
+
+if __name__ == "__main__":
+    test_extract_literals()
+    test_literals_guard_semantic_hit()
+    test_scope_and_threshold()
+    test_ttl_and_lru()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Тестирование объединения одинаковых запросов: один вызов на ключ, ошибка всем
+ожидающим, отмена ожидающих и сброс ключа
+"""
+
+import sys
+import os
+import asyncio
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils.single_flight import SingleFlight
+
+
+def test_coalesces_concurrent_calls():
+    """Одновременные вызовы с одним ключом выполняют fn один раз"""
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return {'key': key}
+
+    async def run():
+        results = await asyncio.gather(*(flight.do(k, lambda k=k: fetch(k)) for k in ('a', 'a', 'a', 'b')))
+        assert [r['key'] for r in results] == ['a', 'a', 'a', 'b']
+        # Ключ живет только пока идет задача
+        await flight.do('a', lambda: fetch('a'))
+
+    asyncio.run(run())
+    assert calls == ['a', 'b', 'a'], calls
+    stats = flight.stats()
+    assert stats['executions'] == 3 and stats['coalesced'] == 2 and stats['in_flight'] == 0, stats
+    print("✅ Одинаковые запросы выполняются один раз")
+
+
+def test_exception_fan_out():
+    """Ошибку общей задачи получают все ожидающие, следующий вызов начинает заново"""
+    flight = SingleFlight("test")
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("HTTP 503")
+
+    async def run():
+        results = await asyncio.gather(*(flight.do('k', failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) and str(r) == "HTTP 503" for r in results), results
+        assert len(attempts) == 1
+        try:
+            await flight.do('k', failing)
+        except ValueError:
+            pass
+        assert len(attempts) == 2
+
+    asyncio.run(run())
+    print("✅ Ошибка передается всем ожидающим")
+
+
+def test_cancellation():
+    """Отмена одного ожидающего не отменяет задачу; уход последнего - отменяет"""
+    flight = SingleFlight("test")
+    started = []
+    cancelled = []
+
+    async def slow():
+        started.append(1)
+        try:
+            await asyncio.sleep(0.05)
+            return 'done'
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def run():
+        first = asyncio.ensure_future(flight.do('k', slow))
+        second = asyncio.ensure_future(flight.do('k', slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == 'done'
+        assert first.cancelled() and not cancelled
+
+        only = asyncio.ensure_future(flight.do('k', slow))
+        await asyncio.sleep(0.01)
+        only.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled == [1]
+
+    asyncio.run(run())
+    assert started == [1, 1]
+    assert flight.stats()['cancelled'] == 1 and flight.stats()['in_flight'] == 0
+    print("✅ Отмена ожидающих и общей задачи")
+
+
+def test_forget():
+    """После forget новый вызов не присоединяется к идущей задаче, а прежние ожидающие получают ее результат"""
+    flight = SingleFlight("test")
+    versions = iter(['old', 'new'])
+
+    async def fetch():
+        version = next(versions)
+        await asyncio.sleep(0.02 if version == 'old' else 0.0)
+        return version
+
+    async def run():
+        before = asyncio.ensure_future(flight.do('k', fetch))
+        await asyncio.sleep(0)
+        flight.forget('k')
+        after = await flight.do('k', fetch)
+        assert after == 'new' and await before == 'old'
+
+    asyncio.run(run())
+    print("✅ forget: новые вызовы не получают результат, начатый до сброса")
+
+
+if __name__ == "__main__":
+    test_coalesces_concurrent_calls()
+    test_exception_fan_out()
+    test_cancellation()
+    test_forget()
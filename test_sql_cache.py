@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Тестирование кэша SQL: нормализация вопроса, ключи с версией KB, TTL и LRU
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.services.sql_cache import SQLCache, normalize_question
+
+
+def test_normalize_question():
+    """Регистр, ё, пробелы и завершающая пунктуация не меняют ключ; числа и операторы - меняют"""
+    assert normalize_question("  Покажи   ВСЕ платежи Ёлкина?! ") == "покажи все платежи елкина"
+    assert normalize_question("платежи > 100") != normalize_question("платежи < 100")
+    assert normalize_question("топ 10") != normalize_question("топ 20")
+    print("✅ Нормализация вопроса")
+
+
+def test_version_keys():
+    """Роль и версия KB входят в ключ: новая версия не видит старых ответов"""
+    cache = SQLCache(max_size=10, ttl=60)
+    cache.set(SQLCache.make_key("Все пользователи", "admin", 1), {'sql': 'SELECT 1'})
+
+    assert cache.get(SQLCache.make_key("все пользователи.", "admin", 1)) == {'sql': 'SELECT 1'}
+    assert cache.get(SQLCache.make_key("все пользователи", "user", 1)) is None
+    assert cache.get(SQLCache.make_key("все пользователи", "admin", 2)) is None
+    assert cache.get(SQLCache.make_key("все пользователи", None, 1)) is None
+    print("✅ Ключ учитывает роль и версию KB")
+
+
+def test_returned_value_is_copy():
+    """Изменение отданного словаря не портит запись кэша"""
+    cache = SQLCache(max_size=10, ttl=60)
+    cache.set('k', {'sql': 'SELECT 1'})
+    cache.get('k')['sql'] = 'DROP TABLE equsers'
+    assert cache.get('k') == {'sql': 'SELECT 1'}
+    print("✅ Кэш отдает копию записи")
+
+
+def test_ttl_and_lru():
+    """Устаревшие записи удаляются при чтении, при переполнении вытесняется давно не читанная"""
+    cache = SQLCache(max_size=10, ttl=0.05)
+    cache.set('old', {'sql': 'SELECT 1'})
+    time.sleep(0.1)
+    assert cache.get('old') is None
+    assert cache.stats()['expirations'] == 1 and cache.stats()['size'] == 0
+
+    cache = SQLCache(max_size=2, ttl=60)
+    cache.set('a', {'sql': 'a'})
+    cache.set('b', {'sql': 'b'})
+    assert cache.get('a') is not None
+    cache.set('c', {'sql': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['size'] == 2, stats
+    assert stats['hits'] == 3 and stats['misses'] == 1, stats
+
+    cache.clear()
+    assert cache.get('a') is None and cache.stats()['invalidations'] == 1
+
+    disabled = SQLCache(max_size=0, ttl=60)
+    disabled.set('a', {'sql': 'a'})
+    assert disabled.get('a') is None
+    print("✅ TTL, вытеснение LRU, очистка и выключенный кэш")
+
+
+if __name__ == "__main__":
+    test_normalize_question()
+    test_version_keys()
+    test_returned_value_is_copy()
+    test_ttl_and_lru()
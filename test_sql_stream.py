@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Тестирование поиска завершенного SQL в частичном ответе LLM: блоки кода,
+кавычки и комментарии
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils.sql_stream import find_complete_statement, format_sse
+
+
+def prefixes(text: str):
+    return [text[:i] for i in range(len(text) + 1)]
+
+
+def test_fenced_statement():
+    """Запрос в ```sql завершается ';' или закрывающим ```"""
+    assert find_complete_statement("Вот запрос:\n```sql\nSELECT id FROM equsers;\n```") == "SELECT id FROM equsers"
+    assert find_complete_statement("```sql\nSELECT id FROM equsers\n```") == "SELECT id FROM equsers"
+    assert find_complete_statement("```\nSELECT 1\n```") == "SELECT 1"
+    assert find_complete_statement("```sql\nSELECT id FROM equ") is None
+    print("✅ Запрос в блоке кода")
+
+
+def test_plain_statement():
+    """Без блока кода запрос начинается с SELECT/WITH в начале строки и завершается ';'"""
+    assert find_complete_statement("Запрос:\nWITH t AS (SELECT 1) SELECT * FROM t;") == "WITH t AS (SELECT 1) SELECT * FROM t"
+    assert find_complete_statement("Нужно выбрать пользователей; select id from equsers") is None
+    assert find_complete_statement("SELECT id FROM equsers") is None
+    print("✅ Запрос без блока кода")
+
+
+def test_quotes():
+    """';' и ``` внутри строк и идентификаторов не завершают запрос"""
+    sql = "SELECT 'a;b', 'it''s; ok', \"col;name\", '```' FROM t"
+    text = f"```sql\n{sql};\n```"
+    assert find_complete_statement(text) == sql
+    # Пока строка не закрыта, запрос не завершен ни на одном префиксе
+    for prefix in prefixes(text)[:text.index(" FROM")]:
+        assert find_complete_statement(prefix) is None, prefix
+    print("✅ Кавычки и экранированные кавычки")
+
+
+def test_comments():
+    """';' в комментариях не завершает запрос; незакрытый комментарий - запрос не завершен"""
+    sql = "SELECT id -- id; пользователя\nFROM equsers /* ; ``` */ WHERE deleted = FALSE"
+    assert find_complete_statement(f"```sql\n{sql};") == sql
+    assert find_complete_statement("```sql\nSELECT id /* ; ") is None
+    assert find_complete_statement("```sql\nSELECT id -- ; без перевода строки") is None
+    print("✅ Строчные и блочные комментарии")
+
+
+def test_format_sse():
+    """Событие SSE: JSON с кириллицей без экранирования"""
+    message = format_sse("sql", {"sql": "SELECT 1", "вопрос": "тест"})
+    assert message.startswith("event: sql\ndata: ") and message.endswith("\n\n")
+    assert json.loads(message.split("data: ", 1)[1]) == {"sql": "SELECT 1", "вопрос": "тест"}
+    assert "тест" in message
+    print("✅ Формат SSE")
+
+
+if __name__ == "__main__":
+    test_fenced_statement()
+    test_plain_statement()
+    test_quotes()
+    test_comments()
+    test_format_sse()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Тестирование трассировки: разбор traceparent, вложенные span'ы в задачах
+asyncio, заголовки исходящих запросов, ASGI middleware и экспорт в JSONL
+"""
+
+import sys
+import os
+import json
+import time
+import asyncio
+import tempfile
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.utils import tracing
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class MemoryExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+def test_traceparent():
+    """Корректный заголовок разбирается, некорректный и нулевые id отбрасываются"""
+    context = tracing.parse_traceparent(f"00-{TRACE_ID.upper()}-{PARENT_ID}-01")
+    assert context == tracing.SpanContext(TRACE_ID, PARENT_ID, True)
+    assert tracing.format_traceparent(context) == f"00-{TRACE_ID}-{PARENT_ID}-01"
+    assert not tracing.parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00").sampled
+    for value in (None, "", "garbage", f"ff-{TRACE_ID}-{PARENT_ID}-01", f"00-{'0' * 32}-{PARENT_ID}-01",
+                  f"00-{TRACE_ID}-{'0' * 16}-01", f"00-{TRACE_ID[:-1]}x-{PARENT_ID}-01", f"00-{TRACE_ID}-{PARENT_ID}"):
+        assert tracing.parse_traceparent(value) is None, value
+    print("✅ Разбор traceparent")
+
+
+def test_nested_spans_and_tasks():
+    """Дочерние span'ы в задачах и потоках наследуют трассу; ошибка помечает span"""
+    exporter = MemoryExporter()
+    tracing._processor.configure(exporter)
+    tracing._processor._export = lambda batch: exporter.export(batch)
+    tracing._processor.submit = lambda item: exporter.export([item])
+    try:
+        async def child(name):
+            with tracing.span(name, kind="client") as current:
+                assert tracing.inject_headers({"a": "b"}) == {
+                    "a": "b", "traceparent": tracing.format_traceparent(current.context)
+                }
+
+        def in_thread():
+            with tracing.span("thread"):
+                pass
+
+        async def run():
+            parent = tracing.parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01")
+            with tracing.span("request", kind="server", parent=parent) as root:
+                await asyncio.gather(child("first"), child("second"))
+                await asyncio.to_thread(in_thread)
+            assert tracing.current_span() is None
+            return root
+
+        root = asyncio.run(run())
+        try:
+            with tracing.span("failing"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+    finally:
+        del tracing._processor._export, tracing._processor.submit
+        tracing._processor.configure(None)
+
+    by_name = {item.name: item for item in exporter.spans}
+    assert set(by_name) == {"request", "first", "second", "thread", "failing"}
+    assert root.parent_id == PARENT_ID and root.context.trace_id == TRACE_ID
+    for name in ("first", "second", "thread"):
+        assert by_name[name].context.trace_id == TRACE_ID and by_name[name].parent_id == root.context.span_id
+    assert by_name["failing"].to_dict()["status"] == "error" and "boom" in by_name["failing"].status_message
+    assert tracing.inject_headers() == {}
+    print("✅ Вложенные span'ы в задачах asyncio и потоках")
+
+
+def test_middleware_and_file_export():
+    """Server span с родителем из traceparent, X-Trace-Id в ответе, JSONL экспорт"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "traces.jsonl")
+        os.environ["TRACING_EXPORTER"] = "file"
+        os.environ["TRACING_FILE"] = path
+        sent = []
+        exported = tracing._processor.exported
+
+        async def app(scope, receive, send):
+            with tracing.span("handler"):
+                await send({"type": "http.response.start", "status": 500, "headers": []})
+                await send({"type": "http.response.body", "body": b""})
+
+        async def send(message):
+            sent.append(message)
+
+        try:
+            middleware = tracing.TracingMiddleware(app, service_name="test-api")
+            scope = {"type": "http", "method": "POST", "path": "/query",
+                     "headers": [(b"traceparent", f"00-{TRACE_ID}-{PARENT_ID}-01".encode())]}
+            asyncio.run(middleware(scope, None, send))
+            asyncio.run(middleware({**scope, "path": "/health"}, None, send))
+            # Экспорт идет фоновым потоком: ждем, пока все span'ы окажутся в файле
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline and tracing._processor.exported < exported + 3:
+                tracing._processor.flush()
+                time.sleep(0.01)
+        finally:
+            del os.environ["TRACING_EXPORTER"], os.environ["TRACING_FILE"]
+            tracing.configure()
+
+        with open(path, encoding="utf-8") as f:
+            spans = [json.loads(line) for line in f]
+
+    # /health исключен: server span'а нет, span обработчика - корневой
+    assert sorted(item["name"] for item in spans) == ["POST /query", "handler", "handler"], spans
+    [server] = [item for item in spans if item["kind"] == "server"]
+    [handler] = [item for item in spans if item["name"] == "handler" and item["trace_id"] == TRACE_ID]
+    assert server["trace_id"] == TRACE_ID and server["parent_id"] == PARENT_ID and server["name"] == "POST /query"
+    assert server["status"] == "error" and server["attributes"]["http.status_code"] == 500
+    assert handler["parent_id"] == server["span_id"] and handler["service"] == "test-api"
+    assert (b"x-trace-id", TRACE_ID.encode()) in sent[0]["headers"]
+    print("✅ ASGI middleware и экспорт в JSONL")
+
+
+if __name__ == "__main__":
+    test_traceparent()
+    test_nested_spans_and_tasks()
+    test_middleware_and_file_export()
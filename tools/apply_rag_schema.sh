@@ -8,6 +8,7 @@ set -euo pipefail
 
 REPO_DIR="$(cd "$(dirname "$0")/.." && pwd)"
 SCHEMA_SQL="$REPO_DIR/src/tools/rag_schema.sql"
+TRIGGERS_SQL="$REPO_DIR/src/tools/invalidation_triggers.sql"
 DSN="${CUSTOMER_DB_DSN:-}"
 
 if ! command -v psql >/dev/null 2>&1; then
@@ -27,6 +28,20 @@ fi
 
 echo "Applying RAG schema to: $DSN"
 psql "$DSN" -v ON_ERROR_STOP=1 -f "$SCHEMA_SQL"
+
+# Cache invalidation triggers (LISTEN/NOTIFY). The schema event trigger needs
+# superuser, so a failure here is a warning, not an error: the caches keep
+# working by polling (KB fingerprint, periodic schema catalog refresh).
+# The channel must match INVALIDATION_BUS_CHANNEL of the API processes.
+if [ -f "$TRIGGERS_SQL" ]; then
+  CHANNEL="${INVALIDATION_BUS_CHANNEL:-nlsql_invalidation}"
+  echo "Applying invalidation triggers (channel: $CHANNEL)"
+  if ! psql "$DSN" -v ON_ERROR_STOP=1 -v channel="$CHANNEL" -f "$TRIGGERS_SQL"; then
+    echo "WARNING: invalidation triggers were not fully applied (the event trigger requires superuser)." >&2
+    echo "WARNING: the invalidation bus falls back to polling: KB fingerprint (KB_VERSION_CHECK_INTERVAL)" >&2
+    echo "WARNING: and schema catalog refresh (SCHEMA_CATALOG_REFRESH_INTERVAL)." >&2
+  fi
+fi
 echo "Done."
 
 
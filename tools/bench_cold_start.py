@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark of core API cold start (src/api/main.py).
+- import: time to import src.api.main in a fresh interpreter
+- listening: time from process start until GET /health answers
+- ready: time from process start until GET /ready returns 200 (warmup done)
+Each run starts a separate uvicorn process on a free port.
+
+Usage:
+    PYTHONPATH=. python tools/bench_cold_start.py --runs 5 [--json results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Optional
+
+import httpx
+
+APP = "src.api.main:app"
+
+
+def measure_import() -> float:
+    code = "import time; t = time.perf_counter(); import src.api.main; print(time.perf_counter() - t)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True, env=os.environ.copy()
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, started: float, timeout: float, expect_ok: bool) -> Optional[float]:
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        try:
+            r = httpx.get(url, timeout=1.0)
+            if not expect_ok or r.status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def measure_startup(timeout: float) -> Dict[str, Optional[float]]:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", APP, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=os.environ.copy(),
+    )
+    try:
+        listening = wait_for(f"{base}/health", started, timeout, expect_ok=False)
+        ready = wait_for(f"{base}/ready", started, timeout, expect_ok=True) if listening is not None else None
+        components = None
+        if ready is not None:
+            components = httpx.get(f"{base}/ready", timeout=2.0).json().get("components")
+        return {"listening": listening, "ready": ready, "components": components}
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def summarize(values: List[Optional[float]]) -> Dict[str, Optional[float]]:
+    ok = [v for v in values if v is not None]
+    if not ok:
+        return {"median": None, "min": None, "max": None, "failed": len(values)}
+    return {
+        "median": round(statistics.median(ok), 3),
+        "min": round(min(ok), 3),
+        "max": round(max(ok), 3),
+        "failed": len(values) - len(ok),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark for the core API")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=180.0, help="Max seconds to wait for /ready")
+    parser.add_argument("--json", dest="json_path", help="Write raw results to a JSON file")
+    args = parser.parse_args()
+
+    imports, listening, ready, runs = [], [], [], []
+    for i in range(args.runs):
+        import_time = measure_import()
+        startup = measure_startup(args.timeout)
+        imports.append(import_time)
+        listening.append(startup["listening"])
+        ready.append(startup["ready"])
+        runs.append({"import": import_time, **startup})
+        print(f"run {i + 1}: import={import_time:.3f}s listening={startup['listening']} ready={startup['ready']}")
+        if startup["components"]:
+            for name, state in startup["components"].items():
+                print(f"    {name:<14} {state.get('status'):<8} {state.get('seconds')}s")
+
+    summary = {"import": summarize(imports), "listening": summarize(listening), "ready": summarize(ready)}
+    print(json.dumps(summary, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of domain detection.
+- legacy: the former QueryService._detect_domain (dict rebuilt per call,
+  substring scan of every keyword)
+- compiled: DomainClassifier.classify (keyword-stem trie compiled to one regex)
+Also reports how often both agree and lists the questions where they differ.
+
+Usage:
+    PYTHONPATH=. python tools/bench_domain_classifier.py [--number 20000] [--questions file.txt]
+"""
+
+import json
+import timeit
+import argparse
+from typing import List
+
+from src.utils.domain_classifier import DomainClassifier
+
+QUESTIONS = [
+    "покажи все входящие платежи за май",
+    "сумма платежами по клиентам за квартал",
+    "сколько денег поступило от клиента",
+    "список пользователей отдела продаж",
+    "кто из администраторов не заходил в систему",
+    "покажи поручения по клиенту Ромашка",
+    "просроченные задания менеджеров",
+    "договоры без подписанных документов",
+    "сводка по отделам за прошлый месяц",
+    "отчёт по платежам в статусе ошибка",
+    "статистика поручений по департаментам",
+    "сколько всего записей в системе",
+    "show all payments for last week",
+    "list users with admin role",
+]
+
+
+def legacy_detect_domain(question: str) -> str:
+    question_lower = question.lower()
+    domain_configs = {
+        'payments': {
+            'keywords': ['платеж', 'payment', 'оплата', 'деньги', 'денег', 'сумма', 'рубль', 'рублей', 'входящий', 'исходящий'],
+            'tables': ['tbl_incoming_payments', 'tbl_payment_statuses', 'tbl_postpayment_types', 'tbl_business_unit', 'tbl_principal_assignment']
+        },
+        'users': {
+            'keywords': ['пользователь', 'user', 'сотрудник', 'менеджер', 'админ', 'логин', 'отдел', 'департамент'],
+            'tables': ['equsers', 'eq_departments', 'eqroles', 'eqgroups']
+        },
+        'assignments': {
+            'keywords': ['поручение', 'поручения', 'assignment', 'assignments', 'задание', 'задания', 'документ', 'документы', 'договор', 'контракт', 'task', 'tasks'],
+            'tables': ['tbl_principal_assignment', 'tbl_business_unit', 'equsers']
+        },
+        'reports': {
+            'keywords': ['отчет', 'report', 'статистика', 'аналитика', 'сводка', 'итог'],
+            'tables': ['tbl_incoming_payments', 'equsers', 'eq_departments', 'tbl_business_unit']
+        }
+    }
+    domain_scores = {}
+    for domain, config in domain_configs.items():
+        score = sum(1 for keyword in config['keywords'] if keyword in question_lower)
+        if score > 0:
+            domain_scores[domain] = score
+    if domain_scores:
+        return max(domain_scores, key=domain_scores.get)
+    return 'general'
+
+
+def load_questions(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Domain classifier micro-benchmark")
+    parser.add_argument("--number", type=int, default=20000, help="Classifications per implementation")
+    parser.add_argument("--questions", help="File with one question per line")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions) if args.questions else QUESTIONS
+    classifier = DomainClassifier()
+    rounds = max(args.number // len(questions), 1)
+
+    def run_legacy():
+        for question in questions:
+            legacy_detect_domain(question)
+
+    def run_compiled():
+        for question in questions:
+            classifier.classify(question)
+
+    total = rounds * len(questions)
+    results = {}
+    for name, func in (("legacy", run_legacy), ("compiled", run_compiled)):
+        seconds = min(timeit.repeat(func, number=rounds, repeat=3))
+        results[name] = {"us_per_question": round(seconds / total * 1e6, 2), "questions": total}
+
+    differences = []
+    for question in questions:
+        legacy, compiled = legacy_detect_domain(question), classifier.classify(question)
+        if legacy != compiled.domain:
+            differences.append({"question": question, "legacy": legacy, "compiled": compiled.as_dict()})
+    results["speedup"] = round(results["legacy"]["us_per_question"] / results["compiled"]["us_per_question"], 2)
+    results["agreement"] = round(1 - len(differences) / len(questions), 3)
+
+    print(json.dumps(results, indent=2))
+    for item in differences:
+        print(json.dumps(item, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of /query/execute result serialization on a synthetic result.
+- pydantic: QueryResultResponse validated row by row, then json encoded
+  (the former response path)
+- rows / columnar: src/utils/result_encoding (orjson when installed)
+Reports encode time and payload size raw, gzip and brotli (if installed).
+
+Usage:
+    PYTHONPATH=.:src python tools/bench_result_encoding.py [--rows 50000] [--repeat 3]
+"""
+
+import json
+import time
+import random
+import decimal
+import argparse
+import datetime
+
+from src.utils import result_encoding
+
+COLUMNS = ["id", "assignment_number", "amount", "business_unit_id", "login", "created_at"]
+
+
+def make_rows(count: int):
+    started = datetime.datetime(2024, 1, 1)
+    return [
+        (i, f"PA-{i:07d}", decimal.Decimal(random.randint(100, 10 ** 7)) / 100, random.randint(1, 300),
+         f"user{random.randint(1, 5000)}", started + datetime.timedelta(minutes=i))
+        for i in range(count)
+    ]
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Result serialization micro-benchmark")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    meta = {"row_count": len(rows), "execution_time": 0.1, "sql": "SELECT ..."}
+    cases = {
+        "rows": lambda: result_encoding.dumps(
+            {**result_encoding.shape_result(COLUMNS, rows, result_encoding.ROWS), **meta}),
+        "columnar": lambda: result_encoding.dumps(
+            {**result_encoding.shape_result(COLUMNS, rows, result_encoding.COLUMNAR), **meta}),
+    }
+    try:
+        from models.responses import QueryResultResponse
+
+        def pydantic_path():
+            model = QueryResultResponse(data=result_encoding.to_rows(COLUMNS, rows), columns=COLUMNS, **meta)
+            return model.json().encode("utf-8")
+
+        cases = {"pydantic": pydantic_path, **cases}
+    except ImportError as e:
+        print(f"pydantic path skipped: {e}")
+
+    results = {"row_count": len(rows), "orjson": result_encoding.orjson is not None}
+    for name, func in cases.items():
+        body = func()
+        results[name] = {
+            "encode_ms": round(best_of(func, args.repeat) * 1000, 1),
+            "bytes": len(body),
+            "gzip_bytes": len(result_encoding.compress(body, "gzip")),
+        }
+        if result_encoding.brotli is not None:
+            results[name]["br_bytes"] = len(result_encoding.compress(body, "br"))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Build domain embedding centroids for the domain classifier fallback
+(src/utils/domain_classifier.py). A centroid is the mean embedding of the
+domain's example questions and keywords, computed with the retrieval
+embedding backend (the same one QueryService uses for the semantic cache).
+
+Usage:
+    PYTHONPATH=. python tools/build_domain_centroids.py [--out training_data/domain_centroids.json]
+"""
+
+import os
+import json
+import argparse
+
+from src.utils.domain_classifier import DEFAULT_CENTROIDS_PATH, DOMAINS, build_centroids
+from src.utils.embeddings import embed_queries, retrieval_spec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build domain centroids for the domain classifier")
+    parser.add_argument("--out", default=os.getenv("DOMAIN_CENTROIDS_PATH", DEFAULT_CENTROIDS_PATH))
+    args = parser.parse_args()
+
+    centroids = build_centroids(embed_queries)
+    payload = {"spec": retrieval_spec(), "centroids": centroids}
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+    dims = {len(vector) for vector in centroids.values()}
+    print(f"✅ {len(centroids)} centroids ({', '.join(DOMAINS)}), dim={dims}, spec={payload['spec']} -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()